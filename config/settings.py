@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -52,6 +53,9 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "webapp.routers.FixarPrimarioAposEscritaMiddleware",
+    "webapp.perfilador.PerfiladorMiddleware",
+    "webapp.consultas_lentas.ConsultasLentasMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -69,8 +73,22 @@ TEMPLATES = [
             ],
         },
     },
+    {
+        # Motor alternativo só para as linhas das tabelas do dashboard e do
+        # relatório (webapp/templates/webapp/parciais/), os mesmos arquivos lidos
+        # pelo motor Django. Selecionado por MOTOR_TEMPLATES_PAINEIS.
+        "BACKEND": "django.template.backends.jinja2.Jinja2",
+        "DIRS": [BASE_DIR / "webapp" / "templates"],
+        "APP_DIRS": False,
+        "OPTIONS": {
+            "environment": "webapp.ambiente_jinja2.environment",
+        },
+    },
 ]
 
+# Motor das linhas do dashboard e do relatório: "django" (padrão) ou "jinja2"
+MOTOR_TEMPLATES_PAINEIS = config("MOTOR_TEMPLATES_PAINEIS", default="django")
+
 WSGI_APPLICATION = "config.wsgi.application"
 
 
@@ -79,10 +97,35 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 DATABASE_URL = config("DATABASE_URL", default=None)
 
+# Perfil local: SQLite em arquivo, sem depender de um PostgreSQL externo.
+# Ativado com DB_LOCAL=True e, por padrão, ao rodar "manage.py test".
+TESTANDO = sys.argv[1:2] == ["test"]
+DB_LOCAL = config("DB_LOCAL", default=TESTANDO, cast=bool)
+
 if DATABASE_URL:
     DATABASES = {
         "default": dj_database_url.parse(DATABASE_URL, conn_max_age=600)
     }
+elif DB_LOCAL:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # WAL permite leituras concorrentes com uma escrita em andamento;
+                # nos testes a durabilidade não importa e o fsync é desligado.
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    f"PRAGMA synchronous={'OFF' if TESTANDO else 'NORMAL'};"
+                    "PRAGMA busy_timeout=5000;"
+                    "PRAGMA temp_store=MEMORY;"
+                ),
+                # Evita "database is locked" quando duas transações tentam escrever
+                "transaction_mode": "IMMEDIATE",
+            },
+            "TEST": {"NAME": ":memory:"},
+        }
+    }
 else:
     DATABASES = {
         "default": {
@@ -99,6 +142,82 @@ else:
     }
 
 
+# Réplica somente leitura (opcional), no mesmo formato de DATABASE_URL.
+# Recebe as leituras das telas de consulta; ver webapp/routers.py.
+DATABASE_REPLICA_URL = config("DATABASE_REPLICA_URL", default=None)
+
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    if DATABASES["replica"]["ENGINE"] == "django.db.backends.sqlite3":
+        # Modo local com dois aliases: nos testes a réplica compartilha o banco em
+        # memória do primário e precisa enxergar a transação aberta do TestCase.
+        DATABASES["replica"]["OPTIONS"] = {"init_command": "PRAGMA read_uncommitted = 1;"}
+
+DATABASE_ROUTERS = ["webapp.routers.ReplicaRouter"]
+
+# Cache compartilhado entre os workers (versões de cache, limites de taxa) e canal dos
+# eventos SSE das salas (webapp.eventos); sem REDIS_URL cada processo usa o próprio
+# cache em memória e os eventos só chegam às telas do mesmo processo
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}
+    }
+
+# Segundos em que um usuário continua lendo do primário depois de uma escrita
+REPLICA_JANELA_PRIMARIO = config("REPLICA_JANELA_PRIMARIO", default=5, cast=int)
+
+# E-mails (ex: aviso de reservas canceladas por manutenção); o padrão só imprime no console
+EMAIL_BACKEND = config("EMAIL_BACKEND", default="django.core.mail.backends.console.EmailBackend")
+DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+
+# Perfilador sob demanda para staff (?_perfil=1); o cabeçalho X-Perfilar só vale se habilitado
+PERFILADOR_CABECALHO = config("PERFILADOR_CABECALHO", default=False, cast=bool)
+PERFILADOR_DIR = config("PERFILADOR_DIR", default=str(BASE_DIR / "perfis"))
+PERFILADOR_MAX_REGISTROS = config("PERFILADOR_MAX_REGISTROS", default=20, cast=int)
+
+# Consultas acima do limite (ms) vão para o arquivo JSONL; None desativa o registro
+CONSULTAS_LENTAS_MS = config("CONSULTAS_LENTAS_MS", default="200", cast=lambda v: float(v) if v else None)
+CONSULTAS_LENTAS_ARQUIVO = config("CONSULTAS_LENTAS_ARQUIVO", default=str(BASE_DIR / "consultas_lentas.jsonl"))
+# Fração dos SELECTs lentos que têm o plano (EXPLAIN) capturado; ANALYZE só no PostgreSQL
+CONSULTAS_LENTAS_AMOSTRA_EXPLAIN = config("CONSULTAS_LENTAS_AMOSTRA_EXPLAIN", default=0.1, cast=float)
+CONSULTAS_LENTAS_ANALYZE = config("CONSULTAS_LENTAS_ANALYZE", default=False, cast=bool)
+
+# Aquecimento dos workers do gunicorn ao iniciar (gunicorn.conf.py)
+AQUECER_WORKERS = config("AQUECER_WORKERS", default=True, cast=bool)
+
+# Limitação de taxa (webapp.limites): por escopo, {tipo: (capacidade, período em segundos)}.
+# "ip" vale para todos; "usuario" é o usuário autenticado ou, no login, o nome tentado.
+LIMITES_TAXA_ATIVO = config("LIMITES_TAXA_ATIVO", default=True, cast=bool)
+LIMITES_TAXA = {
+    "login": {"ip": (20, 60), "usuario": (5, 60)},
+    "cadastro": {"ip": (5, 600)},
+    "reserva": {"ip": (60, 60), "usuario": (20, 60)},
+    "reserva_recorrente": {"ip": (30, 60), "usuario": (5, 60)},
+}
+# Quantos proxies reversos ficam na frente da aplicação (1 no Render); define o IP lido do X-Forwarded-For
+LIMITES_PROXIES_CONFIAVEIS = config("LIMITES_PROXIES_CONFIAVEIS", default=0, cast=int)
+
+# Auditoria das reservas (webapp.auditoria): gravada em lote por uma thread a cada
+# AUDITORIA_LOTE eventos ou AUDITORIA_INTERVALO_MS, o que vier primeiro
+AUDITORIA_ASSINCRONA = config("AUDITORIA_ASSINCRONA", default=True, cast=bool)
+AUDITORIA_LOTE = config("AUDITORIA_LOTE", default=100, cast=int)
+AUDITORIA_INTERVALO_MS = config("AUDITORIA_INTERVALO_MS", default=500, cast=int)
+
+# Validade (segundos) dos tokens de idempotência dos formulários de reserva (webapp.idempotencia)
+IDEMPOTENCIA_TTL = config("IDEMPOTENCIA_TTL", default=3600, cast=int)
+
+# Dias da semana letivos (0 = segunda) quando o calendário acadêmico não cadastra o dia
+# (webapp.calendario_academico); depois de mudar, rode gerar_disponibilidade
+DIAS_SEMANA_LETIVOS = config(
+    "DIAS_SEMANA_LETIVOS", default="0,1,2,3,4", cast=lambda v: frozenset(int(d) for d in v.split(",") if d.strip())
+)
+
+# Token dos quiosques de porta para o envio de check-ins em lote; vazio desativa o endpoint
+QUIOSQUE_TOKEN = config("QUIOSQUE_TOKEN", default="")
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -117,6 +236,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+if TESTANDO:
+    # PBKDF2 com 1.000.000 de iterações domina o tempo da suíte de testes
+    PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+    # Na suíte, qualquer consulta pode passar do limite e sujar o registro do projeto
+    CONSULTAS_LENTAS_MS = None
+    # Os baldes sobreviveriam entre os testes no cache local; os testes de limite o ativam
+    LIMITES_TAXA_ATIVO = False
+    # Grava a auditoria no commit, sem thread, para os testes enxergarem os registros
+    AUDITORIA_ASSINCRONA = False
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
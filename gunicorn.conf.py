@@ -0,0 +1,32 @@
+"""
+Configuração do gunicorn, lida automaticamente quando ele é iniciado na raiz
+do projeto (``gunicorn config.wsgi``).
+
+A aplicação é carregada uma vez no processo mestre (``preload_app``) e os
+workers nascem dela por fork, já com o Django e o NumPy importados. Cada
+worker ainda abre sua própria conexão com o banco e aquece rotas, templates e
+caches (``webapp.aquecimento``) antes de aceitar a primeira requisição.
+"""
+
+preload_app = True
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+
+    if not settings.AQUECER_WORKERS:
+        return
+    from webapp.aquecimento import aquecer
+
+    try:
+        tempos = aquecer()
+    except Exception:
+        # Um worker frio ainda atende; só a primeira requisição fica mais lenta
+        worker.log.exception("Falha ao aquecer o worker %s", worker.pid)
+        return
+    worker.log.info(
+        "Worker %s aquecido em %.0f ms (%s)",
+        worker.pid,
+        sum(ms for ms, _ in tempos.values()),
+        ", ".join(f"{etapa} {ms:.0f} ms" for etapa, (ms, _) in tempos.items()),
+    )
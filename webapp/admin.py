@@ -1,15 +1,279 @@
-from django.contrib import admin
+from datetime import timedelta
 
-from .models import Sala, Reserva
+from django.contrib import admin, messages
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .auditoria import registrar
+from .models import BloqueioManutencao, DiaCalendario, PerfilUsuario, Predio, RegistroAuditoria, Sala, Reserva
+
+
+class ContagemParcial(int):
+    """Contagem interrompida no limite: vale o limite nas contas e aparece como "10000+"."""
+
+    def __str__(self):
+        return f"{int(self)}+"
+
+
+class ContagemEstimadaPaginator(Paginator):
+    """
+    Evita o ``COUNT(*)`` exato em tabelas grandes: sem filtros, usa a
+    estimativa de linhas do PostgreSQL (``pg_class.reltuples``); com filtros,
+    conta no máximo ``LIMITE_CONTAGEM`` linhas e, passando disso, mostra
+    "10000+" (``ContagemParcial``).
+
+    Como a contagem não é exata nesses dois casos, as páginas depois da última
+    calculada continuam acessíveis enquanto tiverem linhas, e a navegação
+    oferece a página seguinte à atual.
+    """
+
+    LIMITE_CONTAGEM = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimativa = self._estimativa(queryset)
+            if estimativa is not None and estimativa > self.LIMITE_CONTAGEM:
+                self._aproximada = True
+                return estimativa
+        # Uma linha além do limite diz se a contagem foi interrompida
+        contagem = queryset.order_by()[: self.LIMITE_CONTAGEM + 1].count()
+        if contagem > self.LIMITE_CONTAGEM:
+            self._aproximada = True
+            return ContagemParcial(self.LIMITE_CONTAGEM)
+        return contagem
+
+    @property
+    def aproximada(self):
+        self.count
+        return getattr(self, "_aproximada", False)
+
+    def _tem_pagina(self, numero):
+        return self.object_list[(numero - 1) * self.per_page:][:1].exists()
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            numero = int(number)
+            if numero > self.num_pages and self.aproximada and self._tem_pagina(numero):
+                return numero
+            raise
+
+    def page(self, number):
+        if not self.aproximada:
+            return super().page(number)
+        numero = self.validate_number(number)
+        inicio = (numero - 1) * self.per_page
+        return self._get_page(self.object_list[inicio:inicio + self.per_page], numero, self)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        numero = self.validate_number(number)
+        if not self.aproximada or numero + on_each_side < self.num_pages:
+            yield from super().get_elided_page_range(numero, on_each_side=on_each_side, on_ends=on_ends)
+            return
+        # Perto ou além da última página calculada: até ela e mais uma, se existir
+        if numero - on_each_side > on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(numero - on_each_side, numero + 1)
+        else:
+            yield from range(1, numero + 1)
+        ultima = max(numero, self.num_pages)
+        yield from range(numero + 1, ultima + 1)
+        if self._tem_pagina(ultima + 1):
+            yield ultima + 1
+
+    def _estimativa(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            linha = cursor.fetchone()
+        # reltuples é -1 enquanto a tabela não passou por ANALYZE
+        return int(linha[0]) if linha and linha[0] >= 0 else None
+
+
+class PeriodoReservaFilter(admin.SimpleListFilter):
+    """Faixas de ``data_hora_inicio`` resolvidas pelo índice, no lugar do ``date_hierarchy``."""
+
+    title = "período"
+    parameter_name = "periodo"
+
+    PERIODOS = {
+        "hoje": (0, 1),
+        "proximos_7_dias": (0, 7),
+        "ultimos_7_dias": (-7, 0),
+        "ultimos_30_dias": (-30, 0),
+    }
+
+    def lookups(self, request, model_admin):
+        return (
+            ("hoje", "Hoje"),
+            ("proximos_7_dias", "Próximos 7 dias"),
+            ("ultimos_7_dias", "Últimos 7 dias"),
+            ("ultimos_30_dias", "Últimos 30 dias"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.PERIODOS:
+            return queryset
+        de, ate = self.PERIODOS[self.value()]
+        hoje = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return queryset.filter(
+            data_hora_inicio__gte=hoje + timedelta(days=de),
+            data_hora_inicio__lt=hoje + timedelta(days=ate),
+        )
+
+
+class SalaReservaFilter(admin.SimpleListFilter):
+    """
+    Sala digitada (número ou parte do nome), no lugar da lista com todas as
+    salas na barra lateral; o filtro continua atendido pelo índice
+    (sala, data_hora_inicio).
+    """
+
+    title = "sala"
+    parameter_name = "sala"
+    template = "admin/webapp/filtro_texto.html"
+
+    def lookups(self, request, model_admin):
+        # Sem opções a listar; só não pode ser vazio, senão o filtro não aparece
+        return ((None, ""),)
+
+    def choices(self, changelist):
+        yield {
+            "parametro": self.parameter_name,
+            "valor": self.value() or "",
+            "dica": "Número ou nome da sala",
+            # Os demais filtros e a ordenação seguem no envio do formulário
+            "outros": [(chave, valor) for chave, valor in changelist.params.items() if chave != self.parameter_name],
+            "limpar": changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+    def queryset(self, request, queryset):
+        valor = (self.value() or "").strip()
+        if not valor:
+            return queryset
+        if valor.isdigit():
+            return queryset.filter(sala_id=int(valor))
+        return queryset.filter(sala__in=Sala.objects.filter(nome__icontains=valor))
 
 
 @admin.register(Sala)
 class SalaAdmin(admin.ModelAdmin):
-    list_display = ("nome", "capacidade", "hora_inicio", "hora_fim")
+    list_display = ("nome", "predio", "tipo", "capacidade", "hora_inicio", "hora_fim")
+    list_select_related = ("predio",)
+    list_filter = ("predio", "tipo")
+    # Usado pelo autocomplete de sala nas reservas e nos bloqueios
+    search_fields = ("nome",)
+
+
+@admin.register(Predio)
+class PredioAdmin(admin.ModelAdmin):
+    list_display = ("nome", "campus")
+    list_filter = ("campus",)
+    search_fields = ("nome", "campus")
+
+
+@admin.register(DiaCalendario)
+class DiaCalendarioAdmin(admin.ModelAdmin):
+    list_display = ("data", "tipo", "descricao")
+    list_filter = ("tipo",)
+    search_fields = ("descricao",)
+    date_hierarchy = "data"
+
+
+@admin.register(PerfilUsuario)
+class PerfilUsuarioAdmin(admin.ModelAdmin):
+    list_display = ("nome_completo", "user", "predio_padrao")
+    list_select_related = ("user", "predio_padrao")
+    list_filter = ("predio_padrao",)
+    search_fields = ("nome_completo", "user__username")
+    autocomplete_fields = ("user", "predio_padrao")
 
 
 @admin.register(Reserva)
 class ReservaAdmin(admin.ModelAdmin):
     list_display = ("sala", "usuario", "quantidade_pessoas", "data_hora_inicio", "data_hora_fim")
-    list_filter = ("sala",)
-    date_hierarchy = "data_hora_inicio"
+    list_select_related = ("sala", "usuario")
+    # Filtros atendidos pelos índices (sala, data_hora_inicio) e (data_hora_inicio)
+    list_filter = (PeriodoReservaFilter, SalaReservaFilter)
+    autocomplete_fields = ("sala", "usuario")
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            registrar("alterada", [obj], request.user, origem="admin", campos=form.changed_data)
+        else:
+            registrar("criada", [obj], request.user, origem="admin")
+
+    def delete_model(self, request, obj):
+        registrar("cancelada", [obj], request.user, origem="admin")
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        registrar("cancelada", list(queryset), request.user, origem="admin")
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(RegistroAuditoria)
+class RegistroAuditoriaAdmin(admin.ModelAdmin):
+    """Somente leitura: a auditoria só recebe inserções, feitas por ``webapp.auditoria``."""
+
+    list_display = ("ocorrido_em", "reserva_id", "acao", "usuario")
+    list_select_related = ("usuario",)
+    list_filter = ("acao",)
+    # Busca exata pelo número da reserva, atendida pelo índice auditoria_reserva_idx
+    search_fields = ("=reserva_id",)
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BloqueioManutencao)
+class BloqueioManutencaoAdmin(admin.ModelAdmin):
+    list_display = ("motivo", "inicio", "fim", "criado_por")
+    list_select_related = ("criado_por",)
+    autocomplete_fields = ("salas",)
+    exclude = ("criado_por",)
+
+    def save_model(self, request, obj, form, change):
+        if not obj.criado_por_id:
+            obj.criado_por = request.user
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        # Os sinais do bloqueio e das salas (M2M) cancelam as reservas sobrepostas
+        super().save_related(request, form, formsets, change)
+        canceladas = getattr(form.instance, "reservas_canceladas", 0)
+        if canceladas:
+            self.message_user(
+                request,
+                f"{canceladas} reserva(s) cancelada(s) e usuários notificados por e-mail.",
+                messages.WARNING,
+            )
+        em_andamento = form.instance.reservas_em_andamento().count()
+        if em_andamento:
+            self.message_user(
+                request,
+                f"{em_andamento} reserva(s) já em andamento nas salas bloqueadas não foram canceladas.",
+                messages.WARNING,
+            )
@@ -0,0 +1,189 @@
+"""Alocação automática de salas para as aulas do semestre.
+
+Cada aula é semanal: ``(turma, dia_da_semana, hora_inicio, hora_fim,
+quantidade_pessoas, tipo preferido)``. Por dia da semana as aulas formam um
+grafo de intervalos; a alocação varre os horários de início em ordem e, em
+cada um, resolve uma atribuição de custo mínimo (algoritmo húngaro) entre as
+aulas que começam ali e as salas livres naquele instante. O custo é a
+capacidade ociosa (lugares vazios), mais uma penalidade se o tipo da sala não
+é o preferido; salas pequenas demais, fora do horário de funcionamento
+(``hora_inicio``/``hora_fim``), com reservas existentes ou bloqueios (RN-24)
+no horário em alguma semana do período são inviáveis.
+
+A varredura é gulosa entre horários diferentes (a escolha das 8h não é
+revista às 10h), mas ótima em cada horário — na prática evita que uma turma de
+15 pessoas fique com o auditório de 200 lugares enquanto uma de 180 sobra.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import Reserva
+from .ocupacao import bloqueios_por_sala
+
+# Lugares vazios "equivalentes" a usar uma sala de tipo diferente do preferido
+PENALIDADE_TIPO = 500
+NAO_ALOCADA = 1e7
+INVIAVEL = 1e9
+
+MOTIVO_SEM_SALA = "nenhuma sala comporta a turma nesse horário (capacidade ou funcionamento)"
+MOTIVO_OCUPADAS = "todas as salas compatíveis estão ocupadas nesse horário"
+
+
+def hungaro(custos):
+    """
+    Atribuição de custo mínimo para uma matriz ``n × m`` com ``n <= m``
+    (algoritmo húngaro com potenciais, O(n²·m), laço interno vetorizado).
+    Retorna, para cada linha, o índice da coluna atribuída.
+    """
+    n, m = custos.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    dono = np.zeros(m + 1, dtype=int)  # dono[j]: linha (base 1) na coluna j; a coluna 0 é auxiliar
+    anterior = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        dono[0] = i
+        j0 = 0
+        minimo = np.full(m + 1, np.inf)
+        usada = np.zeros(m + 1, dtype=bool)
+        while True:
+            usada[j0] = True
+            i0 = dono[j0]
+            livres = np.flatnonzero(~usada)
+            reduzido = custos[i0 - 1, livres - 1] - u[i0] - v[livres]
+            melhora = reduzido < minimo[livres]
+            minimo[livres[melhora]] = reduzido[melhora]
+            anterior[livres[melhora]] = j0
+            j1 = livres[np.argmin(minimo[livres])]
+            delta = minimo[j1]
+            u[dono[usada]] += delta
+            v[usada] -= delta
+            minimo[livres] -= delta
+            j0 = j1
+            if dono[j0] == 0:
+                break
+        while j0:
+            j1 = anterior[j0]
+            dono[j0] = dono[j1]
+            j0 = j1
+
+    atribuicao = np.empty(n, dtype=int)
+    for j in range(1, m + 1):
+        if dono[j]:
+            atribuicao[dono[j] - 1] = j - 1
+    return atribuicao
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def ocupacao_existente(data_inicio, semanas, sala_ids=None):
+    """
+    Intervalos já ocupados por reservas e bloqueios no período, projetados na
+    semana: ``{(sala_id, dia_da_semana): [(inicio_min, fim_min), ...]}`` ordenados.
+    Uma reserva em qualquer semana ocupa o horário no semestre inteiro.
+    """
+    inicio = timezone.make_aware(datetime.combine(data_inicio, time.min))
+    fim = inicio + timedelta(weeks=semanas)
+    intervalos = []
+    reservas = Reserva.objects.filter(data_hora_inicio__gte=inicio, data_hora_inicio__lt=fim)
+    if sala_ids is not None:
+        reservas = reservas.filter(sala_id__in=sala_ids)
+    intervalos.extend(reservas.values_list("sala_id", "data_hora_inicio", "data_hora_fim").iterator())
+    for sala_id, bloqueios in bloqueios_por_sala(inicio, fim, sala_ids).items():
+        intervalos.extend((sala_id, b_inicio, b_fim) for b_inicio, b_fim in bloqueios)
+
+    ocupados = defaultdict(list)
+    for sala_id, i, f in intervalos:
+        i, f = timezone.localtime(i), timezone.localtime(f)
+        # Bloqueios podem atravessar dias: um trecho por dia
+        while i < f:
+            fim_do_dia = timezone.make_aware(datetime.combine(i.date() + timedelta(days=1), time.min))
+            trecho_fim = min(f, fim_do_dia)
+            fim_min = 24 * 60 if trecho_fim == fim_do_dia else _minutos(trecho_fim)
+            ocupados[(sala_id, i.weekday())].append((_minutos(i), fim_min))
+            i = trecho_fim
+    for lista in ocupados.values():
+        lista.sort()
+    return ocupados
+
+
+def _indice_ocupacao(intervalos):
+    """Inícios ordenados e o maior fim acumulado, para testar sobreposição com uma busca binária."""
+    inicios, maiores_fins, maior = [], [], 0
+    for inicio, fim in intervalos:
+        maior = max(maior, fim)
+        inicios.append(inicio)
+        maiores_fins.append(maior)
+    return inicios, maiores_fins
+
+
+def _ocupado(indice, inicio, fim):
+    """Algum intervalo do índice se sobrepõe a ``[inicio, fim)``?"""
+    inicios, maiores_fins = indice
+    pos = bisect_left(inicios, fim)
+    return pos > 0 and maiores_fins[pos - 1] > inicio
+
+
+def alocar(aulas, salas, ocupados=None):
+    """
+    Aloca as ``aulas`` (dicts com ``dia``, ``inicio``, ``fim`` — objetos time —,
+    ``pessoas`` e ``tipo`` opcional) nas ``salas``. Retorna ``(alocadas,
+    nao_alocadas)``: ``alocadas`` é uma lista de ``(aula, sala)`` e
+    ``nao_alocadas`` de ``(aula, motivo)``.
+    """
+    ocupados = ocupados or {}
+    salas = list(salas)
+    capacidade = np.array([s.capacidade for s in salas], dtype=float)
+    abertura = np.array([_minutos(s.hora_inicio) for s in salas])
+    encerramento = np.array([_minutos(s.hora_fim) for s in salas])
+    tipos = np.array([s.tipo for s in salas], dtype=object)
+
+    alocadas, nao_alocadas = [], []
+    por_dia = defaultdict(list)
+    for aula in aulas:
+        por_dia[aula["dia"]].append(aula)
+
+    for dia, aulas_do_dia in sorted(por_dia.items()):
+        ocupadas_no_dia = {
+            j: _indice_ocupacao(ocupados[(s.pk, dia)]) for j, s in enumerate(salas) if (s.pk, dia) in ocupados
+        }
+        livre_em = np.zeros(len(salas))  # minuto em que cada sala fica livre das aulas já alocadas
+        por_inicio = defaultdict(list)
+        for aula in aulas_do_dia:
+            por_inicio[_minutos(aula["inicio"])].append(aula)
+
+        for inicio in sorted(por_inicio):
+            grupo = por_inicio[inicio]
+            pessoas = np.array([a["pessoas"] for a in grupo], dtype=float)
+            fins = np.array([_minutos(a["fim"]) for a in grupo])
+
+            custos = capacidade[None, :] - pessoas[:, None]
+            viavel = (custos >= 0) & (abertura[None, :] <= inicio) & (encerramento[None, :] >= fins[:, None])
+            sem_sala = ~viavel.any(axis=1)
+            for k, aula in enumerate(grupo):
+                if aula.get("tipo"):
+                    custos[k, tipos != aula["tipo"]] += PENALIDADE_TIPO
+                for j, indice in ocupadas_no_dia.items():
+                    if viavel[k, j] and _ocupado(indice, inicio, fins[k]):
+                        viavel[k, j] = False
+            viavel &= (livre_em <= inicio)[None, :]
+
+            # Só entram na matriz as salas que servem a alguma aula do grupo,
+            # mais uma coluna "não alocada" por aula
+            colunas = np.flatnonzero(viavel.any(axis=0))
+            matriz = np.full((len(grupo), len(colunas) + len(grupo)), NAO_ALOCADA)
+            matriz[:, : len(colunas)] = np.where(viavel[:, colunas], custos[:, colunas], INVIAVEL)
+            for k, coluna in enumerate(hungaro(matriz)):
+                if coluna < len(colunas) and viavel[k, colunas[coluna]]:
+                    j = colunas[coluna]
+                    livre_em[j] = fins[k]
+                    alocadas.append((grupo[k], salas[j]))
+                else:
+                    nao_alocadas.append((grupo[k], MOTIVO_SEM_SALA if sem_sala[k] else MOTIVO_OCUPADAS))
+    return alocadas, nao_alocadas
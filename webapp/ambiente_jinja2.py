@@ -0,0 +1,23 @@
+from django.utils.html import escape
+from jinja2 import Environment
+
+
+def _escapar_aspas(valor):
+    """
+    O autoescape do Jinja2 e o do Django só divergem nas aspas (``&#39;`` ×
+    ``&#x27;``, ``&#34;`` × ``&quot;``); apenas esses textos passam pelo escape
+    do Django, para não pagar uma chamada a mais em cada valor da tabela.
+    """
+    if valor.__class__ is str and ("'" in valor or '"' in valor):
+        return escape(valor)
+    return valor
+
+
+def environment(**options):
+    """
+    Ambiente Jinja2 das linhas de ``webapp/parciais/``, que também são
+    renderizadas pelo motor Django: mesmo escape e mesma quebra de linha final,
+    para que os dois motores produzam o mesmo HTML.
+    """
+    options.setdefault("keep_trailing_newline", True)
+    return Environment(finalize=_escapar_aspas, **options)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WebappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'webapp'
+
+    def ready(self):
+        from . import consultas_lentas, signals  # noqa: F401
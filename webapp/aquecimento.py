@@ -0,0 +1,102 @@
+"""Aquecimento de um processo recém-iniciado, antes da primeira requisição.
+
+Sem isso, a primeira requisição de cada worker paga por montar o resolvedor de
+URLs, compilar os templates, abrir a conexão com o banco (com handshake TLS
+no PostgreSQL gerenciado) e preencher caches vazios. ``aquecer()`` faz esse
+trabalho na inicialização; o ``gunicorn.conf.py`` o chama em cada worker
+(``post_worker_init``) e o comando ``medir_inicializacao`` mede o efeito.
+"""
+
+import os
+import time as cronometro
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+from django.utils import timezone
+
+EXTENSOES_TEMPLATE = (".html", ".txt")
+# Motores que só servem parte dos templates dos seus diretórios (nome do motor em TEMPLATES)
+PREFIXOS_POR_MOTOR = {"jinja2": "webapp/parciais/"}
+
+
+def _urls():
+    resolvedor = get_resolver()
+    # Acessar reverse_dict popula o resolvedor e todos os sub-resolvedores (include)
+    resolvedor.reverse_dict
+    return len(resolvedor.reverse_dict)
+
+
+def _templates():
+    """
+    Compila os templates do projeto em cada motor; ficam nos caches dos
+    loaders. O motor Jinja2 só serve as linhas de ``webapp/parciais/``
+    (PREFIXOS_POR_MOTOR); os demais templates usam tags do Django e nem
+    compilam nele. Um erro de sintaxe sobe: o worker registra a falha.
+    """
+    base = str(settings.BASE_DIR)
+    compilados = 0
+    for motor in engines.all():
+        prefixo = PREFIXOS_POR_MOTOR.get(motor.name, "")
+        for diretorio in map(str, motor.template_dirs):
+            # Os templates do admin e de outros pacotes instalados ficam de fora
+            if not diretorio.startswith(base) or "site-packages" in diretorio:
+                continue
+            for raiz, _, arquivos in os.walk(diretorio):
+                for arquivo in arquivos:
+                    nome = os.path.relpath(os.path.join(raiz, arquivo), diretorio).replace(os.sep, "/")
+                    if arquivo.endswith(EXTENSOES_TEMPLATE) and nome.startswith(prefixo):
+                        motor.get_template(nome)
+                        compilados += 1
+    return compilados
+
+
+def _banco():
+    for conexao in connections.all():
+        conexao.ensure_connection()
+    return len(connections.all())
+
+
+def _caches():
+    """
+    Versão das reservas e o resumo do período padrão do relatório
+    (RESUMO_DIAS_PADRAO), só leitura no banco. Com o cache compartilhado
+    (Redis) o resumo já calculado por outro worker não é refeito; o mapa de
+    calor, caro e só para staff, fica para a primeira requisição.
+    Retorna quantas salas o resumo calculado tem (0 se já estava em cache).
+    """
+    from django.core.cache import cache
+
+    from .cache import obter_versao
+    from .views import RESUMO_DIAS_PADRAO, _chave_resumo, _resumo_ocupacao
+
+    obter_versao("reservas")
+    data_fim = timezone.localdate()
+    data_inicio = data_fim - timedelta(days=RESUMO_DIAS_PADRAO - 1)
+    if cache.has_key(_chave_resumo(data_inicio, data_fim)):
+        return 0
+    return len(_resumo_ocupacao(data_inicio, data_fim)["por_sala"])
+
+
+ETAPAS = {
+    "urls": _urls,
+    "templates": _templates,
+    "banco": _banco,
+    "caches": _caches,
+}
+
+
+def aquecer(etapas=None):
+    """
+    Executa as etapas de aquecimento (todas, por padrão) e retorna
+    ``{etapa: (milissegundos, quantidade)}`` — rotas nomeadas, templates
+    compilados, conexões abertas e salas no resumo calculado.
+    """
+    resultado = {}
+    for nome in etapas or ETAPAS:
+        inicio = cronometro.perf_counter()
+        quantidade = ETAPAS[nome]()
+        resultado[nome] = ((cronometro.perf_counter() - inicio) * 1000, quantidade)
+    return resultado
@@ -0,0 +1,140 @@
+"""Auditoria das reservas gravada em lote, fora do caminho da requisição.
+
+``registrar`` não toca no banco: depois do commit da transação da view, os
+registros entram em uma fila em memória. Uma thread do processo os grava com
+um ``bulk_create`` a cada ``AUDITORIA_LOTE`` eventos ou
+``AUDITORIA_INTERVALO_MS`` milissegundos, o que vier primeiro. Ao encerrar o
+processo (``atexit``) a thread é parada e o que sobrou na fila é gravado de
+forma síncrona.
+
+Com ``AUDITORIA_ASSINCRONA = False`` (padrão nos testes) cada evento é
+gravado logo após o commit, sem fila nem thread.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import RegistroAuditoria
+from .routers import PRIMARIO
+
+logger = logging.getLogger(__name__)
+
+_fila = queue.SimpleQueue()
+_lock = threading.Lock()
+_parar = threading.Event()
+_thread = None
+_pid = None
+_FIM = object()  # acorda a thread parada na fila para encerrar
+
+
+def _dados(reserva):
+    return {
+        "sala": reserva.sala_id,
+        "data_hora_inicio": reserva.data_hora_inicio,
+        "data_hora_fim": reserva.data_hora_fim,
+        "quantidade_pessoas": reserva.quantidade_pessoas,
+    }
+
+
+def registrar(acao, reservas, usuario=None, **extras):
+    """
+    Agenda um registro de ``acao`` para cada reserva, feito por ``usuario``
+    (``None`` para ações do sistema, como os quiosques). ``reservas`` aceita
+    instâncias — cujos dados são guardados — ou apenas pks.
+    """
+    usuario_id = getattr(usuario, "pk", usuario)
+    registros = []
+    for reserva in reservas:
+        dados = dict(extras)
+        if isinstance(reserva, int):
+            reserva_id = reserva
+        else:
+            reserva_id = reserva.pk
+            dados.update(_dados(reserva))
+        registros.append(RegistroAuditoria(reserva_id=reserva_id, usuario_id=usuario_id, acao=acao, dados=dados))
+    if registros:
+        # Uma view que falha depois daqui não deixa rastro de uma ação que não aconteceu
+        transaction.on_commit(lambda: _enfileirar(registros), using=PRIMARIO)
+
+
+def _enfileirar(registros):
+    if not settings.AUDITORIA_ASSINCRONA:
+        _gravar(registros)
+        return
+    _iniciar()
+    for registro in registros:
+        _fila.put(registro)
+
+
+def _gravar(registros):
+    try:
+        RegistroAuditoria.objects.using(PRIMARIO).bulk_create(registros)
+    except Exception:
+        # A auditoria nunca derruba a requisição nem a thread; o log guarda o que se perdeu
+        logger.exception("Falha ao gravar %d registro(s) de auditoria", len(registros))
+
+
+def _iniciar():
+    """Sobe a thread na primeira chamada de cada processo (inclusive depois de um fork do gunicorn)."""
+    global _thread, _pid
+    if _pid == os.getpid() and _thread.is_alive():
+        return
+    with _lock:
+        if _pid == os.getpid() and _thread.is_alive():
+            return
+        _parar.clear()
+        _thread = threading.Thread(target=_executar, name="auditoria", daemon=True)
+        _thread.start()
+        if _pid is None:
+            atexit.register(encerrar)
+        _pid = os.getpid()
+
+
+def _retirar_lote(prazo):
+    """Espera até ``prazo`` (``time.monotonic``) ou até juntar um lote completo."""
+    lote = []
+    while len(lote) < settings.AUDITORIA_LOTE:
+        restante = prazo - time.monotonic()
+        try:
+            registro = _fila.get(timeout=restante) if restante > 0 else _fila.get_nowait()
+        except queue.Empty:
+            break
+        if registro is _FIM:
+            break
+        lote.append(registro)
+    return lote
+
+
+def _executar():
+    intervalo = settings.AUDITORIA_INTERVALO_MS / 1000
+    while not _parar.is_set():
+        lote = _retirar_lote(time.monotonic() + intervalo)
+        if lote:
+            close_old_connections()
+            _gravar(lote)
+
+
+def descarregar():
+    """Grava agora, na thread atual, tudo o que está na fila."""
+    while True:
+        lote = _retirar_lote(0)
+        if lote:
+            _gravar(lote)
+        elif _fila.empty():
+            return
+
+
+def encerrar(espera=5):
+    """Para a thread e grava o restante da fila de forma síncrona (registrado no ``atexit``)."""
+    _parar.set()
+    if _thread is not None and _pid == os.getpid() and _thread.is_alive():
+        _fila.put(_FIM)
+        _thread.join(espera)
+    descarregar()
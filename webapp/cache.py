@@ -0,0 +1,47 @@
+"""Versões de cache invalidadas a cada escrita em reservas.
+
+Cada escopo (ex: ``"reservas"``) guarda no cache o instante da última
+alteração. As chaves de cache que dependem desses dados incluem a versão,
+então uma escrita invalida tudo de uma vez sem precisar apagar chave por chave.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def _chave_versao(escopo):
+    return f"versao:{escopo}"
+
+
+def obter_versao(escopo):
+    """Retorna a versão atual do escopo, criando-a se ainda não existir."""
+    chave = _chave_versao(escopo)
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, time.time(), None)
+        versao = cache.get(chave)
+    return versao
+
+
+def invalidar(*escopos):
+    """Marca os escopos como alterados agora, invalidando as chaves derivadas."""
+    agora = time.time()
+    cache.set_many({_chave_versao(escopo): agora for escopo in escopos}, None)
+
+
+# Escopos das reservas: "reservas" muda a cada escrita (painéis com todos os
+# prédios); cada prédio tem o seu, e "reservas:geral" muda quando não se sabe
+# o prédio afetado (check-ins por queryset, bloqueios, salas alteradas).
+ESCOPO_GERAL = "reservas:geral"
+
+
+def escopo_predio(predio_id):
+    return f"reservas:predio:{predio_id}"
+
+
+def versao_reservas(predio_id=None):
+    """Versão para chaves de cache das reservas de um prédio (ou de todos, com ``None``)."""
+    if predio_id is None:
+        return obter_versao("reservas")
+    return f"{obter_versao(ESCOPO_GERAL)}-{obter_versao(escopo_predio(predio_id))}"
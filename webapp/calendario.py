@@ -0,0 +1,169 @@
+"""Feeds iCalendar (RFC 5545) das reservas: "minhas reservas" e uma agenda por sala.
+
+Aplicativos de calendário consultam o feed a cada poucos minutos, então ele
+precisa ser barato:
+
+* a URL leva um token (HMAC do usuário e do hash da senha), sem sessão; trocar
+  a senha invalida os feeds antigos;
+* cada feed tem uma versão de cache própria (``reservas:usuario:<id>`` ou
+  ``reservas:sala:<id>``), atualizada por ``signals.reservas_alteradas``;
+  a versão vira o ``ETag`` e o ``Last-Modified``, então a maioria das
+  consultas termina em 304 sem tocar no banco de reservas;
+* quando a versão muda, o feed é gerado em streaming a partir de uma única
+  consulta coberta por índice e guardado no cache até a próxima alteração.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import http_date
+
+from .cache import obter_versao
+from .models import Reserva
+
+# Reservas encerradas há mais tempo que isso saem do feed
+JANELA_PASSADO = timedelta(days=90)
+FEED_CACHE_TIMEOUT = 24 * 60 * 60  # segundos; a janela do passado anda mesmo sem alterações
+TAMANHO_LOTE = 500
+LARGURA_LINHA = 75  # octetos, RFC 5545 §3.1
+CONTENT_TYPE = "text/calendar; charset=utf-8"
+_SAL = "webapp.calendario"
+
+
+def token_feed(usuario):
+    return salted_hmac(_SAL, f"{usuario.pk}:{usuario.password}").hexdigest()[:32]
+
+
+def token_valido(usuario, token):
+    return constant_time_compare(token, token_feed(usuario))
+
+
+def escopo_usuario(usuario_id):
+    return f"reservas:usuario:{usuario_id}"
+
+
+def escopo_sala(sala_id):
+    return f"reservas:sala:{sala_id}"
+
+
+def _texto(valor):
+    return (
+        str(valor).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _instante(valor):
+    return valor.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _linha(nome, valor):
+    """Uma linha de conteúdo terminada em CRLF, dobrada a cada 75 octetos."""
+    bruta = f"{nome}:{valor}".encode()
+    partes = []
+    while len(bruta) > LARGURA_LINHA:
+        corte = LARGURA_LINHA if not partes else LARGURA_LINHA - 1
+        # Não corta um caractere UTF-8 ao meio (bytes de continuação são 10xxxxxx)
+        while bruta[corte] & 0xC0 == 0x80:
+            corte -= 1
+        partes.append(bruta[:corte])
+        bruta = bruta[corte:]
+    partes.append(bruta)
+    return b"\r\n ".join(partes).decode() + "\r\n"
+
+
+def _evento(dominio, carimbo, pk, inicio, fim, resumo, local, descricao):
+    return "".join((
+        "BEGIN:VEVENT\r\n",
+        _linha("UID", f"reserva-{pk}@{dominio}"),
+        _linha("DTSTAMP", carimbo),
+        _linha("DTSTART", _instante(inicio)),
+        _linha("DTEND", _instante(fim)),
+        _linha("SUMMARY", _texto(resumo)),
+        _linha("LOCATION", _texto(local)),
+        _linha("DESCRIPTION", _texto(descricao)),
+        "END:VEVENT\r\n",
+    ))
+
+
+def _gerar(chave, nome, eventos):
+    """Produz o feed em partes e, se chegar ao fim, guarda o corpo completo no cache."""
+    partes = [
+        "BEGIN:VCALENDAR\r\n",
+        "VERSION:2.0\r\n",
+        "PRODID:-//Gestão de Salas de Aula//Reservas//PT-BR\r\n",
+        "CALSCALE:GREGORIAN\r\n",
+        "METHOD:PUBLISH\r\n",
+        _linha("X-WR-CALNAME", _texto(nome)),
+    ]
+    yield "".join(partes)
+    for evento in eventos:
+        partes.append(evento)
+        yield evento
+    partes.append("END:VCALENDAR\r\n")
+    yield partes[-1]
+    cache.set(chave, "".join(partes), FEED_CACHE_TIMEOUT)
+
+
+def _responder(request, escopo, variante, nome, eventos):
+    versao = obter_versao(escopo)
+    etag = f'"{variante}-{versao:.6f}"'
+    ultima_alteracao = int(versao)
+    condicional = get_conditional_response(request, etag=etag, last_modified=ultima_alteracao)
+    if condicional is not None:
+        return condicional
+
+    dominio = request.get_host()
+    chave = f"feed:{escopo}:{variante}:{versao}:{dominio}"
+    corpo = cache.get(chave)
+    if corpo is not None:
+        response = HttpResponse(corpo, content_type=CONTENT_TYPE)
+    else:
+        carimbo = _instante(datetime.fromtimestamp(ultima_alteracao, dt_timezone.utc))
+        response = StreamingHttpResponse(
+            _gerar(chave, nome, eventos(dominio, carimbo)), content_type=CONTENT_TYPE
+        )
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(ultima_alteracao)
+    # O cliente sempre revalida; com o ETag a resposta costuma ser um 304 vazio
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def feed_usuario(request, usuario):
+    """Feed com as reservas do usuário (índice ``reserva_usuario_fim_idx``)."""
+
+    def eventos(dominio, carimbo):
+        linhas = (
+            Reserva.objects.filter(usuario_id=usuario.pk, data_hora_fim__gte=timezone.now() - JANELA_PASSADO)
+            .order_by("data_hora_fim")
+            .values_list("pk", "data_hora_inicio", "data_hora_fim", "quantidade_pessoas", "sala__nome")
+        )
+        for pk, inicio, fim, pessoas, sala_nome in linhas.iterator(chunk_size=TAMANHO_LOTE):
+            yield _evento(dominio, carimbo, pk, inicio, fim, f"Reserva: {sala_nome}", sala_nome, f"{pessoas} pessoa(s)")
+
+    return _responder(request, escopo_usuario(usuario.pk), "u", f"Minhas reservas ({usuario.get_username()})", eventos)
+
+
+def feed_sala(request, sala, usuario):
+    """
+    Agenda da sala (índice ``reserva_sala_inicio_idx``). Só a equipe vê quem
+    reservou; para os demais cada horário aparece apenas como ocupado.
+    """
+    mostrar_usuario = usuario.is_staff
+
+    def eventos(dominio, carimbo):
+        linhas = (
+            Reserva.objects.filter(sala_id=sala.pk, data_hora_inicio__gte=timezone.now() - JANELA_PASSADO)
+            .order_by("data_hora_inicio")
+            .values_list("pk", "data_hora_inicio", "data_hora_fim", "quantidade_pessoas", "usuario__username")
+        )
+        for pk, inicio, fim, pessoas, username in linhas.iterator(chunk_size=TAMANHO_LOTE):
+            resumo = f"Reservada: {username}" if mostrar_usuario and username else "Reservada"
+            yield _evento(dominio, carimbo, pk, inicio, fim, resumo, sala.nome, f"{pessoas} pessoa(s)")
+
+    variante = "s-equipe" if mostrar_usuario else "s"
+    return _responder(request, escopo_sala(sala.pk), variante, f"Sala {sala.nome}", eventos)
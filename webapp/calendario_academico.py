@@ -0,0 +1,152 @@
+"""Calendário acadêmico e tempo disponível das salas (denominador de RN-19/RN-20).
+
+``DisponibilidadeSala`` guarda, por sala e dia, os minutos em que a sala pode
+ser reservada: o horário de funcionamento (``hora_inicio``/``hora_fim``) nos
+dias letivos, menos os bloqueios de manutenção (RN-24). Feriados, recessos e
+dias fora de ``DIAS_SEMANA_LETIVOS`` valem zero.
+
+Leituras nunca gravam: ``minutos_disponiveis`` soma o período em uma consulta
+(índice único ``sala, data``) e calcula em memória as salas com dias que
+ainda não estão na tabela. As linhas são gravadas só por
+``gerar_disponibilidade`` — chamada pelo comando de mesmo nome e, depois do
+commit, pelos sinais de mudança no calendário, nos horários das salas e nos
+bloqueios (``atualizar_disponibilidade``). Cada geração trava as salas
+(``select_for_update``) e lê o estado já gravado, então duas gerações
+concorrentes terminam na ordem das travas e a última grava os valores atuais.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import DiaCalendario, DisponibilidadeSala, Sala
+from .ocupacao import bloqueios_por_sala, mesclar_intervalos
+from .routers import PRIMARIO
+
+
+def dias_do_periodo(data_inicio, data_fim):
+    """Datas de ``data_inicio`` a ``data_fim``, inclusivas."""
+    return [data_inicio + timedelta(days=i) for i in range((data_fim - data_inicio).days + 1)]
+
+
+def _minutos_do_dia(dia, hora_inicio, hora_fim, bloqueios):
+    abertura = timezone.make_aware(datetime.combine(dia, hora_inicio))
+    encerramento = timezone.make_aware(datetime.combine(dia, hora_fim))
+    total = (encerramento - abertura).total_seconds()
+    for inicio, fim in bloqueios:
+        sobreposicao = (min(fim, encerramento) - max(inicio, abertura)).total_seconds()
+        if sobreposicao > 0:
+            total -= sobreposicao
+    return max(int(total // 60), 0)
+
+
+def calcular_disponibilidade(data_inicio, data_fim, horarios, using=None):
+    """
+    Minutos disponíveis de cada dia do período para as salas de ``horarios``
+    (``{sala_id: (hora_inicio, hora_fim)}``), sem gravar nada:
+    ``{sala_id: {data: minutos}}``.
+    """
+    if not horarios:
+        return {}
+    letivos = DiaCalendario.objects.using(using).dias_letivos(data_inicio, data_fim)
+    inicio = timezone.make_aware(datetime.combine(data_inicio, time.min))
+    fim = timezone.make_aware(datetime.combine(data_fim + timedelta(days=1), time.min))
+    bloqueios = bloqueios_por_sala(inicio, fim, list(horarios))
+
+    por_sala = {}
+    for sala_id, (hora_inicio, hora_fim) in horarios.items():
+        intervalos = mesclar_intervalos(bloqueios.get(sala_id, []))
+        por_sala[sala_id] = {
+            dia: _minutos_do_dia(dia, hora_inicio, hora_fim, intervalos) if dia in letivos else 0
+            for dia in dias_do_periodo(data_inicio, data_fim)
+        }
+    return por_sala
+
+
+def minutos_disponiveis(data_inicio, data_fim, horarios):
+    """
+    Minutos disponíveis de cada sala entre ``data_inicio`` e ``data_fim``
+    (datas inclusivas): ``{sala_id: minutos}``. Uma consulta com ``SUM``
+    agrupado por sala; salas com dias faltando na tabela são calculadas em
+    memória, sem gravar.
+    """
+    num_dias = (data_fim - data_inicio).days + 1
+    totais, incompletas = {}, dict(horarios)
+    for linha in (
+        DisponibilidadeSala.objects.filter(sala_id__in=list(horarios), data__range=(data_inicio, data_fim))
+        .values("sala_id")
+        .annotate(minutos=Sum("minutos"), dias=Count("pk"))
+        .order_by()
+    ):
+        if linha["dias"] == num_dias:
+            totais[linha["sala_id"]] = linha["minutos"]
+            del incompletas[linha["sala_id"]]
+    for sala_id, por_dia in calcular_disponibilidade(data_inicio, data_fim, incompletas).items():
+        totais[sala_id] = sum(por_dia.values())
+    return totais
+
+
+def gerar_disponibilidade(data_inicio, data_fim, sala_ids=None, dias=None):
+    """
+    Calcula e grava (``INSERT ... ON CONFLICT UPDATE``) os minutos disponíveis
+    de cada dia do período para as salas ``sala_ids`` (todas, se ``None``).
+    Com ``dias`` (``{sala_id: {data, ...}}``) só esses dias de cada sala são
+    gravados. Retorna ``{sala_id: minutos}`` dos dias gravados.
+    """
+    with transaction.atomic(using=PRIMARIO):
+        salas = Sala.objects.using(PRIMARIO).select_for_update().order_by("pk")
+        if sala_ids is not None:
+            salas = salas.filter(pk__in=sala_ids)
+        horarios = {pk: (inicio, fim) for pk, inicio, fim in salas.values_list("pk", "hora_inicio", "hora_fim")}
+        por_sala = calcular_disponibilidade(data_inicio, data_fim, horarios, using=PRIMARIO)
+        if dias is not None:
+            por_sala = {
+                sala_id: {dia: minutos for dia, minutos in por_dia.items() if dia in dias.get(sala_id, ())}
+                for sala_id, por_dia in por_sala.items()
+            }
+        DisponibilidadeSala.objects.using(PRIMARIO).bulk_create(
+            [
+                DisponibilidadeSala(sala_id=sala_id, data=dia, minutos=minutos)
+                for sala_id, por_dia in por_sala.items()
+                for dia, minutos in por_dia.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["sala", "data"],
+            update_fields=["minutos"],
+        )
+    return {sala_id: sum(por_dia.values()) for sala_id, por_dia in por_sala.items()}
+
+
+def _regerar(periodo, sala_ids):
+    """
+    Refaz as linhas já existentes em ``periodo`` para as salas ``sala_ids``;
+    ``None`` não filtra. Só os dias que já têm linha são gravados: lacunas
+    entre eles continuam sendo calculadas na leitura.
+    """
+    linhas = DisponibilidadeSala.objects.using(PRIMARIO).all()
+    if periodo is not None:
+        linhas = linhas.filter(data__range=periodo)
+    if sala_ids is not None:
+        linhas = linhas.filter(sala_id__in=sala_ids)
+    existentes = defaultdict(set)
+    for sala_id, dia in linhas.values_list("sala_id", "data"):
+        existentes[sala_id].add(dia)
+    faixas = defaultdict(list)
+    for sala_id, dias in existentes.items():
+        faixas[min(dias), max(dias)].append(sala_id)
+    for (data_inicio, data_fim), ids in faixas.items():
+        gerar_disponibilidade(data_inicio, data_fim, ids, dias=existentes)
+
+
+def atualizar_disponibilidade(periodo=None, sala_ids=None):
+    """
+    Agenda, para depois do commit, o recálculo das linhas afetadas por uma
+    mudança — dias de ``periodo`` (``(data_inicio, data_fim)``) das salas
+    ``sala_ids``; ``None`` não filtra. Só os dias já presentes na tabela são
+    refeitos; os demais continuam sendo calculados na leitura.
+    """
+    transaction.on_commit(lambda: _regerar(periodo, sala_ids), using=PRIMARIO, robust=True)
@@ -0,0 +1,135 @@
+"""Registro de consultas lentas com captura de EXPLAIN.
+
+Cada conexão aberta ganha um ``execute_wrapper`` que mede as consultas. As
+que passam de ``CONSULTAS_LENTAS_MS`` são gravadas em
+``CONSULTAS_LENTAS_ARQUIVO`` (uma linha JSON por consulta) com a view e a
+linha de código que as originaram. Para uma amostra dos SELECTs
+(``CONSULTAS_LENTAS_AMOSTRA_EXPLAIN``) o plano de execução também é gravado;
+no PostgreSQL, ``CONSULTAS_LENTAS_ANALYZE`` troca o EXPLAIN por EXPLAIN ANALYZE.
+
+O comando ``consultas_lentas`` resume o arquivo por impressão digital da
+consulta (o SQL sem valores).
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_view_atual = ContextVar("view_atual", default=None)
+_explicando = ContextVar("explicando", default=False)
+_lock_arquivo = threading.Lock()
+
+_ESTE_ARQUIVO = str(Path(__file__).resolve())
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS_IN = re.compile(r"IN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_ESPACOS = re.compile(r"\s+")
+
+
+def impressao_digital(sql):
+    """SQL normalizado (sem literais e com listas IN colapsadas) e seu hash curto."""
+    normalizado = _LITERAIS.sub("?", sql)
+    normalizado = _LISTAS_IN.sub("IN (...)", normalizado)
+    normalizado = _ESPACOS.sub(" ", normalizado).strip()
+    return hashlib.md5(normalizado.encode()).hexdigest()[:12], normalizado
+
+
+def _origem():
+    """Primeira linha do projeto (fora das bibliotecas e deste módulo) na pilha atual."""
+    base = str(settings.BASE_DIR)
+    for quadro in reversed(traceback.extract_stack()):
+        arquivo = quadro.filename
+        if arquivo.startswith(base) and arquivo != _ESTE_ARQUIVO and "site-packages" not in arquivo:
+            return f"{Path(arquivo).relative_to(base)}:{quadro.lineno} em {quadro.name}"
+    return None
+
+
+def _plano(connection, sql, params):
+    analisar = settings.CONSULTAS_LENTAS_ANALYZE and connection.vendor == "postgresql"
+    prefixo = connection.ops.explain_query_prefix(**({"analyze": True} if analisar else {}))
+    token = _explicando.set(True)
+    try:
+        # Savepoint: um erro no EXPLAIN não pode abortar a transação da requisição
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"{prefixo} {sql}", params)
+            return "\n".join(" ".join(str(coluna) for coluna in linha) for linha in cursor.fetchall())
+    except DatabaseError:
+        return None
+    finally:
+        _explicando.reset(token)
+
+
+def _gravar(registro):
+    linha = json.dumps(registro, ensure_ascii=False, default=str)
+    with _lock_arquivo, open(settings.CONSULTAS_LENTAS_ARQUIVO, "a", encoding="utf-8") as arquivo:
+        arquivo.write(linha + "\n")
+
+
+class MedidorConsultas:
+    """``execute_wrapper`` instalado permanentemente em cada conexão."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explicando.get():
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if duracao_ms >= settings.CONSULTAS_LENTAS_MS:
+                self._registrar(sql, params, many, duracao_ms)
+
+    def _registrar(self, sql, params, many, duracao_ms):
+        digital, _ = impressao_digital(sql)
+        registro = {
+            "quando": datetime.now().isoformat(timespec="seconds"),
+            "banco": self.connection.alias,
+            "duracao_ms": round(duracao_ms, 1),
+            "impressao": digital,
+            "sql": sql,
+            "view": _view_atual.get(),
+            "origem": _origem(),
+            "plano": None,
+        }
+        eh_select = sql.lstrip().upper().startswith(("SELECT", "WITH"))
+        if not many and eh_select and random.random() < settings.CONSULTAS_LENTAS_AMOSTRA_EXPLAIN:
+            registro["plano"] = _plano(self.connection, sql, params)
+        _gravar(registro)
+
+
+@receiver(connection_created)
+def _instalar_medidor(sender, connection, **kwargs):
+    if settings.CONSULTAS_LENTAS_MS is not None:
+        connection.execute_wrappers.append(MedidorConsultas(connection))
+
+
+class ConsultasLentasMiddleware:
+    """Anota qual view está rodando, para identificar a origem das consultas lentas."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _view_atual.set(request.path)
+        try:
+            return self.get_response(request)
+        finally:
+            _view_atual.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, "view_class", view_func)
+        _view_atual.set(f"{view.__module__}.{view.__qualname__}")
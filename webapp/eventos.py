@@ -0,0 +1,304 @@
+"""Difusão em tempo real do estado das salas (Server-Sent Events).
+
+Cada conexão SSE assina o ``difusor`` do processo e recebe os eventos em uma
+fila própria. Os eventos vêm de duas fontes:
+
+* escritas em ``Reserva`` (sinais e check-in): ``reserva_criada``,
+  ``reserva_alterada``, ``reserva_cancelada`` e ``checkin``;
+* um relógio que acorda nas fronteiras das reservas: ``reserva_iniciada``,
+  ``reserva_liberada`` (RN-12, sem check-in após 15 minutos) e
+  ``reserva_encerrada``.
+
+Com ``REDIS_URL`` configurado, os eventos de escrita passam pelo canal
+``CANAL_REDIS`` (pub/sub): qualquer processo — inclusive os workers WSGI do
+gunicorn — publica, e cada processo ASGI com telas conectadas assina o canal
+e repassa às suas filas. Sem Redis a difusão fica em memória e só chega às
+telas do mesmo processo (desenvolvimento, um processo só). Os eventos do
+relógio são calculados em cada processo com telas e entregues só a elas.
+
+O fluxo contínuo exige um servidor ASGI (ex: ``uvicorn config.asgi:application``);
+servido por WSGI, o endpoint responde só com o estado atual e um ``retry``
+longo, e o navegador o consulta periodicamente (``INTERVALO_CONSULTA_WSGI``).
+"""
+
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q, QuerySet
+from django.utils import timezone
+
+from .models import DURACAO_MAXIMA, JANELA_CHECKIN, Reserva, Sala
+
+TAMANHO_FILA = 100
+INTERVALO_HEARTBEAT = 15  # segundos
+# Mesmo sem fronteiras próximas o relógio reavalia o próximo evento periodicamente
+INTERVALO_MAXIMO_RELOGIO = 300  # segundos
+# Sem ASGI o navegador reconecta neste intervalo para receber o estado atual
+INTERVALO_CONSULTA_WSGI = 30  # segundos
+CANAL_REDIS = "webapp:eventos-salas"
+# Espera antes de assinar o canal de novo depois de uma falha do Redis
+INTERVALO_RECONEXAO_REDIS = 5  # segundos
+
+logger = logging.getLogger(__name__)
+
+
+class Assinante:
+    def __init__(self, loop, salas=None):
+        self.loop = loop
+        # Salas do prédio escolhido pela tela; ``None`` recebe os eventos de todas
+        self.salas = salas
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        # Fila cheia: a tela perdeu eventos e precisa reconectar para receber o estado atual
+        self.atrasado = False
+
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.atrasado = True
+
+
+class Difusor:
+    """Distribui eventos para as conexões SSE abertas neste processo, via Redis se configurado."""
+
+    def __init__(self):
+        self._assinantes = set()
+        self._lock = threading.Lock()
+        self._relogio = None
+        self._acordar = None
+        self._ouvinte = None
+        self._cliente_redis = None
+
+    @property
+    def url_redis(self):
+        return settings.REDIS_URL
+
+    def tem_assinantes(self):
+        return bool(self._assinantes)
+
+    def distribuido(self):
+        """Com Redis, outro processo pode ter telas conectadas mesmo sem nenhuma neste."""
+        return bool(self.url_redis)
+
+    def assinar(self, salas=None):
+        """Registra uma conexão; deve ser chamado dentro do event loop que vai consumir a fila.
+
+        Com ``salas``, só os eventos dessas salas entram na fila da conexão.
+        """
+        loop = asyncio.get_running_loop()
+        assinante = Assinante(loop, salas)
+        with self._lock:
+            self._assinantes.add(assinante)
+        if self._relogio is None or self._relogio.done():
+            self._acordar = asyncio.Event()
+            self._relogio = loop.create_task(self._rodar_relogio())
+        if self.distribuido() and (self._ouvinte is None or self._ouvinte.done()):
+            self._ouvinte = loop.create_task(self._ouvir_redis())
+        return assinante
+
+    def cancelar(self, assinante):
+        with self._lock:
+            self._assinantes.discard(assinante)
+            vazio = not self._assinantes
+        if vazio:
+            for tarefa in (self._relogio, self._ouvinte):
+                if tarefa is not None:
+                    tarefa.cancel()
+            self._relogio = self._ouvinte = None
+
+    def publicar(self, eventos):
+        """Publica eventos de escrita para todos os processos; pode ser chamado de qualquer thread."""
+        if not self.distribuido():
+            self.entregar(eventos)
+            return
+        import redis
+
+        try:
+            if self._cliente_redis is None:
+                self._cliente_redis = redis.Redis.from_url(self.url_redis)
+            self._cliente_redis.publish(CANAL_REDIS, json.dumps(eventos))
+        except redis.RedisError:
+            # As telas perdem os eventos, mas a escrita já foi confirmada
+            logger.exception("Falha ao publicar %d evento(s) no Redis", len(eventos))
+
+    def entregar(self, eventos):
+        """Entrega os eventos às filas deste processo; pode ser chamado de qualquer thread."""
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for assinante in assinantes:
+            for evento in eventos:
+                if assinante.salas is None or evento["sala"] in assinante.salas:
+                    assinante.loop.call_soon_threadsafe(assinante.entregar, evento)
+        # Uma reserva nova pode antecipar a próxima fronteira do relógio
+        relogio, acordar = self._relogio, self._acordar
+        if relogio is not None and acordar is not None:
+            relogio.get_loop().call_soon_threadsafe(acordar.set)
+
+    async def _ouvir_redis(self):
+        from redis import asyncio as redis_asyncio
+        from redis.exceptions import RedisError
+
+        while True:
+            cliente = redis_asyncio.Redis.from_url(self.url_redis)
+            try:
+                async with cliente.pubsub() as pubsub:
+                    await pubsub.subscribe(CANAL_REDIS)
+                    async for mensagem in pubsub.listen():
+                        if mensagem["type"] == "message":
+                            self.entregar(json.loads(mensagem["data"]))
+            except RedisError:
+                logger.exception("Conexão com o canal de eventos do Redis perdida; reconectando")
+                await asyncio.sleep(INTERVALO_RECONEXAO_REDIS)
+            finally:
+                await cliente.aclose()
+
+    async def _rodar_relogio(self):
+        ultimo = timezone.now()
+        while True:
+            proxima = await sync_to_async(_proxima_fronteira)(ultimo)
+            espera = INTERVALO_MAXIMO_RELOGIO
+            if proxima is not None:
+                espera = min(max((proxima - timezone.now()).total_seconds(), 0), espera)
+            try:
+                await asyncio.wait_for(self._acordar.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+            agora = timezone.now()
+            eventos = await sync_to_async(_fronteiras_entre)(ultimo, agora)
+            if eventos:
+                # Cada processo calcula as fronteiras; não passam pelo Redis
+                self.entregar(eventos)
+            ultimo = agora
+
+
+difusor = Difusor()
+
+
+def _evento(tipo, pk, sala_id, inicio, fim):
+    return {
+        "tipo": tipo,
+        "reserva": pk,
+        "sala": sala_id,
+        "inicio": inicio.isoformat(),
+        "fim": fim.isoformat(),
+    }
+
+
+def publicar_reservas(tipo, reservas):
+    """Publica um evento por reserva depois do commit.
+
+    ``reservas`` pode ser uma lista de instâncias ou um queryset; sem Redis,
+    o queryset só é consultado se houver alguma tela conectada neste processo.
+    """
+    if not difusor.distribuido() and not difusor.tem_assinantes():
+        return
+    if isinstance(reservas, QuerySet):
+        dados = reservas.values_list("pk", "sala_id", "data_hora_inicio", "data_hora_fim")
+    else:
+        dados = [(r.pk, r.sala_id, r.data_hora_inicio, r.data_hora_fim) for r in reservas]
+    eventos = [_evento(tipo, *linha) for linha in dados]
+    transaction.on_commit(lambda: difusor.publicar(eventos))
+
+
+def _proxima_fronteira(depois):
+    """Próximo instante após ``depois`` em que alguma sala muda de estado."""
+    fronteiras = Reserva.objects.aggregate(
+        inicio=Min("data_hora_inicio", filter=Q(data_hora_inicio__gt=depois)),
+        liberacao=Min(
+            "data_hora_inicio",
+            filter=Q(data_hora_inicio__gt=depois - JANELA_CHECKIN, check_in_realizado=False),
+        ),
+        fim=Min(
+            "data_hora_fim",
+            filter=Q(data_hora_fim__gt=depois, data_hora_inicio__gt=depois - DURACAO_MAXIMA),
+        ),
+    )
+    if fronteiras["liberacao"] is not None:
+        fronteiras["liberacao"] += JANELA_CHECKIN
+    candidatas = [valor for valor in fronteiras.values() if valor is not None]
+    return min(candidatas) if candidatas else None
+
+
+def _fronteiras_entre(desde, ate):
+    """Eventos de início, liberação (RN-12) e término ocorridos em ``(desde, ate]``."""
+    reservas = Reserva.objects.filter(
+        Q(data_hora_inicio__gt=desde, data_hora_inicio__lte=ate)
+        | Q(
+            data_hora_inicio__gt=desde - JANELA_CHECKIN,
+            data_hora_inicio__lte=ate - JANELA_CHECKIN,
+            check_in_realizado=False,
+        )
+        | Q(data_hora_fim__gt=desde, data_hora_fim__lte=ate, data_hora_inicio__gt=desde - DURACAO_MAXIMA)
+    ).values_list("pk", "sala_id", "data_hora_inicio", "data_hora_fim", "check_in_realizado")
+
+    eventos = []
+    for pk, sala_id, inicio, fim, check_in_realizado in reservas:
+        if desde < inicio <= ate:
+            eventos.append(_evento("reserva_iniciada", pk, sala_id, inicio, fim))
+        liberacao = inicio + JANELA_CHECKIN
+        if not check_in_realizado and desde < liberacao <= ate:
+            eventos.append(_evento("reserva_liberada", pk, sala_id, inicio, fim))
+        if desde < fim <= ate:
+            eventos.append(_evento("reserva_encerrada", pk, sala_id, inicio, fim))
+    return eventos
+
+
+def salas_do_predio(predio_id):
+    """Ids das salas do prédio, para filtrar os eventos de uma conexão; ``None`` para todos os prédios."""
+    if predio_id is None:
+        return None
+    return set(Sala.objects.do_predio(predio_id).values_list("pk", flat=True))
+
+
+def estado_salas(agora=None, predio_id=None):
+    """Estado inicial enviado a cada conexão: salas do prédio (ou de todos) e quais estão ocupadas agora."""
+    agora = agora or timezone.now()
+    ocupadas = set(Reserva.objects.ocupando_sala(agora).do_predio(predio_id).values_list("sala_id", flat=True))
+    return {
+        "salas": [
+            {"sala": pk, "nome": nome, "ocupada": pk in ocupadas}
+            for pk, nome in Sala.objects.do_predio(predio_id).values_list("pk", "nome")
+        ],
+    }
+
+
+def _formatar(tipo, dados):
+    return f"event: {tipo}\ndata: {json.dumps(dados)}\n\n"
+
+
+def estado_para_consulta(predio_id=None):
+    """Corpo da resposta sob WSGI: só o estado atual; o navegador volta em ``INTERVALO_CONSULTA_WSGI``."""
+    return f"retry: {INTERVALO_CONSULTA_WSGI * 1000}\n\n" + _formatar("estado", estado_salas(predio_id=predio_id))
+
+
+async def fluxo_eventos(predio_id=None):
+    """Gera o corpo ``text/event-stream`` de uma conexão até o cliente desconectar.
+
+    Com ``predio_id`` a tela só recebe o estado e os eventos das salas do prédio.
+    """
+    salas = await sync_to_async(salas_do_predio)(predio_id)
+    # Assina antes de ler o estado inicial para não perder eventos entre os dois
+    assinante = difusor.assinar(salas)
+    try:
+        yield "retry: 5000\n\n"
+        yield _formatar("estado", await sync_to_async(estado_salas)(predio_id=predio_id))
+        while True:
+            try:
+                evento = await asyncio.wait_for(assinante.fila.get(), INTERVALO_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comentário SSE: mantém a conexão viva através de proxies
+                yield ": ping\n\n"
+                continue
+            if assinante.atrasado:
+                # O navegador reconecta sozinho e recebe um estado novo
+                yield _formatar("recarregar", {})
+                return
+            yield _formatar(evento["tipo"], evento)
+    finally:
+        difusor.cancelar(assinante)
@@ -1,8 +1,31 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.utils import timezone
 
-from .models import Sala, Reserva, PerfilUsuario
+from .models import DURACAO_MAXIMA, BloqueioManutencao, Sala, Reserva, PerfilUsuario
+from .routers import PRIMARIO
+
+MENSAGEM_SOBREPOSICAO = "Já existe uma reserva para esta sala nesse período. Escolha outro horário."
+
+
+def travar_salas(sala_ids):
+    """
+    Trava as salas (``SELECT ... FOR UPDATE``) em ordem de pk; deve ser chamada
+    dentro de uma transação no primário. Toda gravação de reserva — simples,
+    recorrente, edição e lote — trava as suas salas antes de repetir a
+    checagem de RN-06, então duas gravações na mesma sala esperam uma pela
+    outra e a segunda enxerga a primeira. A ordem fixa evita deadlocks entre
+    gravações com várias salas em comum.
+    """
+    list(
+        Sala.objects.using(PRIMARIO)
+        .select_for_update()
+        .filter(pk__in=sala_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
 
 
 class RegistroForm(forms.ModelForm):
@@ -106,14 +129,51 @@ class RegistroForm(forms.ModelForm):
         return user
 
 
-class SalaForm(forms.ModelForm):
-    """Formulário para criar/editar sala: nome e faixa de horários."""
+class VersaoFormMixin:
+    """
+    Formulários de edição de um ``ModeloVersionado``: a versão lida vai em um
+    campo oculto e ``salvar_versionado`` grava só se ninguém gravou antes.
+    """
+
+    MENSAGEM_CONFLITO = (
+        "Este registro foi alterado por outra pessoa enquanto você editava. "
+        "Recarregue a página para ver a versão atual e refaça as alterações."
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields["versao"] = forms.IntegerField(
+                widget=forms.HiddenInput, initial=self.instance.versao, required=False
+            )
+
+    def clean(self):
+        data = super().clean()
+        if self.instance.pk and data.get("versao") is None:
+            raise forms.ValidationError("Formulário desatualizado. Recarregue a página e tente de novo.")
+        return data
+
+    @property
+    def campos_alterados(self):
+        return [nome for nome in self.changed_data if nome in self._meta.fields]
+
+    def salvar_versionado(self):
+        """Grava os campos alterados; ``False`` (e um erro no formulário) se outra edição venceu."""
+        if self.instance.salvar_se_versao(self.cleaned_data["versao"], self.campos_alterados):
+            return True
+        self.add_error(None, self.MENSAGEM_CONFLITO)
+        return False
+
+
+class SalaForm(VersaoFormMixin, forms.ModelForm):
+    """Formulário para criar/editar sala: nome, prédio e faixa de horários."""
 
     class Meta:
         model = Sala
-        fields = ("nome", "tipo", "capacidade", "hora_inicio", "hora_fim")
+        fields = ("nome", "predio", "tipo", "capacidade", "hora_inicio", "hora_fim")
         labels = {
             "nome": "Nome da sala",
+            "predio": "Prédio",
             "tipo": "Tipo de sala",
             "capacidade": "Capacidade (pessoas)",
             "hora_inicio": "Horário de início",
@@ -121,6 +181,7 @@ class SalaForm(forms.ModelForm):
         }
         widgets = {
             "nome": forms.TextInput(attrs={"class": "form-control", "placeholder": "Ex: Sala 101"}),
+            "predio": forms.Select(attrs={"class": "form-select"}),
             "tipo": forms.Select(attrs={"class": "form-select"}),
             "capacidade": forms.NumberInput(attrs={"class": "form-control", "min": "1"}),
             "hora_inicio": forms.TimeInput(attrs={"class": "form-control", "type": "time"}),
@@ -136,7 +197,7 @@ class SalaForm(forms.ModelForm):
         return data
 
 
-class ReservaForm(forms.ModelForm):
+class ReservaForm(VersaoFormMixin, forms.ModelForm):
     """Formulário para criar uma reserva de sala."""
 
     class Meta:
@@ -200,23 +261,19 @@ class ReservaForm(forms.ModelForm):
                 raise forms.ValidationError(
                     {"data_hora_fim": "A reserva deve ter duração mínima de 30 minutos."}
                 )
-            if duracao > timedelta(hours=4):
+            if duracao > DURACAO_MAXIMA:
                 raise forms.ValidationError(
                     {"data_hora_fim": "A reserva não pode ter duração superior a 4 horas."}
                 )
         # RN-06 — não é permitido fazer reservas sobrepostas para a mesma sala
         if sala and inicio and fim:
-            conflitos = Reserva.objects.filter(
-                sala=sala,
-                data_hora_inicio__lt=fim,
-                data_hora_fim__gt=inicio,
-            )
-            if self.instance and self.instance.pk:
-                conflitos = conflitos.exclude(pk=self.instance.pk)
-            if conflitos.exists():
-                raise forms.ValidationError(
-                    "Já existe uma reserva para esta sala nesse período. Escolha outro horário."
-                )
+            if self._conflitos(sala, inicio, fim).exists():
+                raise forms.ValidationError(MENSAGEM_SOBREPOSICAO)
+        # RN-24 — a sala não pode estar bloqueada para manutenção no período
+        if sala and inicio and fim:
+            bloqueio = BloqueioManutencao.objects.using(PRIMARIO).sobrepostos(inicio, fim).filter(salas=sala).first()
+            if bloqueio:
+                raise forms.ValidationError(bloqueio.mensagem_conflito())
         # RN-07 — reserva deve estar dentro do horário de disponibilidade da sala
         if sala and inicio and fim:
             hora_inicio_reserva = inicio.time()
@@ -233,9 +290,8 @@ class ReservaForm(forms.ModelForm):
         MAX_RESERVAS_ATIVAS = 3
         if self.usuario and self.usuario.is_authenticated:
             from django.utils import timezone as tz
-            reservas_ativas = Reserva.objects.filter(
+            reservas_ativas = Reserva.objects.using(PRIMARIO).ativas(tz.now()).filter(
                 usuario=self.usuario,
-                data_hora_fim__gt=tz.now(),
             )
             if self.instance and self.instance.pk:
                 reservas_ativas = reservas_ativas.exclude(pk=self.instance.pk)
@@ -246,6 +302,25 @@ class ReservaForm(forms.ModelForm):
                 )
         return data
 
+    def _conflitos(self, sala, inicio, fim):
+        conflitos = Reserva.objects.using(PRIMARIO).sobrepostas(inicio, fim).filter(sala=sala)
+        if self.instance and self.instance.pk:
+            conflitos = conflitos.exclude(pk=self.instance.pk)
+        return conflitos
+
+    def travar_sala(self):
+        """
+        Trava a sala (``travar_salas``) e repete RN-06; chamada pela view dentro
+        da transação que grava a reserva. ``False`` (e um erro no formulário) se
+        outra reserva entrou na sala depois da validação.
+        """
+        data = self.cleaned_data
+        travar_salas([data["sala"].pk])
+        if self._conflitos(data["sala"], data["data_hora_inicio"], data["data_hora_fim"]).exists():
+            self.add_error(None, MENSAGEM_SOBREPOSICAO)
+            return False
+        return True
+
 
 class ReservaRecorrenteForm(forms.Form):
     """RN-22 e RN-23 — Formulário para criar reservas recorrentes semanais."""
@@ -348,7 +423,7 @@ class ReservaRecorrenteForm(forms.Form):
             raise forms.ValidationError(
                 {"hora_fim": "A reserva deve ter duração mínima de 30 minutos."}
             )
-        if duracao > timedelta(hours=4):
+        if duracao > DURACAO_MAXIMA:
             raise forms.ValidationError(
                 {"hora_fim": "A reserva não pode ter duração superior a 4 horas."}
             )
@@ -388,21 +463,37 @@ class ReservaRecorrenteForm(forms.Form):
 
         # RN-23 — verifica disponibilidade em TODAS as datas antes de confirmar
         conflitos = []
-        for dt in datas:
-            dt_inicio = tz.make_aware(datetime.combine(dt, hora_inicio))
-            dt_fim = tz.make_aware(datetime.combine(dt, hora_fim))
-
+        # RN-24 — bloqueios de manutenção da sala em todo o período, em uma consulta
+        bloqueios = list(
+            BloqueioManutencao.objects.using(PRIMARIO)
+            .sobrepostos(
+                tz.make_aware(datetime.combine(datas[0], hora_inicio)),
+                tz.make_aware(datetime.combine(datas[-1], hora_fim)),
+            )
+            .filter(salas=sala)
+            .values_list("inicio", "fim")
+        )
+        periodos = [
+            (dt, tz.make_aware(datetime.combine(dt, hora_inicio)), tz.make_aware(datetime.combine(dt, hora_fim)))
+            for dt in datas
+        ]
+        # RN-06 — reservas da sala que cruzam alguma ocorrência, em uma consulta
+        ocupados = list(
+            Reserva.objects.using(PRIMARIO)
+            .sobrepostas_a_alguma([(sala.pk, dt_inicio, dt_fim) for _, dt_inicio, dt_fim in periodos])
+            .values_list("data_hora_inicio", "data_hora_fim")
+        )
+        for dt, dt_inicio, dt_fim in periodos:
             # RN-08 — ignora datas no passado (primeira data pode ser hoje mas hora já passou)
             if dt_inicio < tz.now():
                 conflitos.append(f"{dt.strftime('%d/%m/%Y')} (horário no passado)")
                 continue
 
-            qs_conflito = Reserva.objects.filter(
-                sala=sala,
-                data_hora_inicio__lt=dt_fim,
-                data_hora_fim__gt=dt_inicio,
-            )
-            if qs_conflito.exists():
+            if any(b_inicio < dt_fim and b_fim > dt_inicio for b_inicio, b_fim in bloqueios):
+                conflitos.append(f"{dt.strftime('%d/%m/%Y')} (sala bloqueada para manutenção)")
+                continue
+
+            if any(r_inicio < dt_fim and r_fim > dt_inicio for r_inicio, r_fim in ocupados):
                 conflitos.append(dt.strftime("%d/%m/%Y"))
 
         if conflitos:
@@ -414,7 +505,16 @@ class ReservaRecorrenteForm(forms.Form):
         return data
 
     def criar_reservas(self, usuario):
-        """Cria todas as reservas recorrentes validadas. Retorna a lista de reservas criadas."""
+        """
+        Cria todas as reservas recorrentes validadas, em uma transação com a sala
+        travada (``travar_salas``), RN-06 conferida de novo para todas as
+        ocorrências em uma consulta e um único ``bulk_create`` — o número de
+        consultas não cresce com o número de semanas. Retorna a lista de
+        reservas criadas, ou ``None`` (e um erro no formulário) se outra
+        reserva entrou na sala depois da validação. Como o ``bulk_create`` não
+        dispara sinais, quem chama invalida os caches e publica os eventos
+        (``reservas_alteradas`` e ``publicar_reservas``).
+        """
         from datetime import datetime
         from django.utils import timezone as tz
 
@@ -423,17 +523,199 @@ class ReservaRecorrenteForm(forms.Form):
         hora_inicio = self.cleaned_data["hora_inicio"]
         hora_fim = self.cleaned_data["hora_fim"]
         quantidade_pessoas = self.cleaned_data["quantidade_pessoas"]
+        periodos = [
+            (tz.make_aware(datetime.combine(dt, hora_inicio)), tz.make_aware(datetime.combine(dt, hora_fim)))
+            for dt in datas
+        ]
+
+        with transaction.atomic(using=PRIMARIO):
+            travar_salas([sala.pk])
+            pedidos = [(sala.pk, dt_inicio, dt_fim) for dt_inicio, dt_fim in periodos]
+            if Reserva.objects.using(PRIMARIO).sobrepostas_a_alguma(pedidos).exists():
+                self.add_error(None, MENSAGEM_SOBREPOSICAO)
+                return None
+            return Reserva.objects.using(PRIMARIO).bulk_create([
+                Reserva(
+                    sala=sala,
+                    usuario=usuario,
+                    data_hora_inicio=dt_inicio,
+                    data_hora_fim=dt_fim,
+                    quantidade_pessoas=quantidade_pessoas,
+                )
+                for dt_inicio, dt_fim in periodos
+            ])
+
+
+class ItemReservaLoteForm(forms.Form):
+    """Um item do lote: regras que não dependem do banco (RN-05, RN-08, RN-09 e RN-14)."""
+
+    sala = forms.IntegerField(min_value=1)
+    data_hora_inicio = forms.DateTimeField()
+    data_hora_fim = forms.DateTimeField()
+    quantidade_pessoas = forms.IntegerField(min_value=1, required=False)
 
-        reservas_criadas = []
-        for dt in datas:
-            dt_inicio = tz.make_aware(datetime.combine(dt, hora_inicio))
-            dt_fim = tz.make_aware(datetime.combine(dt, hora_fim))
-            reserva = Reserva.objects.create(
-                sala=sala,
-                usuario=usuario,
-                data_hora_inicio=dt_inicio,
-                data_hora_fim=dt_fim,
-                quantidade_pessoas=quantidade_pessoas,
+    def clean(self):
+        from datetime import timedelta
+
+        data = super().clean()
+        inicio = data.get("data_hora_inicio")
+        fim = data.get("data_hora_fim")
+        if not inicio or not fim:
+            return data
+        if inicio < timezone.now() + timedelta(minutes=15):
+            raise forms.ValidationError(
+                "A reserva deve ser feita com pelo menos 15 minutos de antecedência."
+            )
+        if fim <= inicio:
+            raise forms.ValidationError("O horário de término da reserva deve ser posterior ao de início.")
+        if fim - inicio < timedelta(minutes=30):
+            raise forms.ValidationError("A reserva deve ter duração mínima de 30 minutos.")
+        if fim - inicio > DURACAO_MAXIMA:
+            raise forms.ValidationError("A reserva não pode ter duração superior a 4 horas.")
+        return data
+
+
+class ReservaLoteForm(forms.Form):
+    """
+    Várias salas de uma vez para provas e eventos (staff), tudo ou nada.
+
+    ``reservas`` é uma lista de ``{"sala", "data_hora_inicio", "data_hora_fim",
+    "quantidade_pessoas"}``. A validação do lote inteiro usa um número fixo de
+    consultas (salas, reservas sobrepostas e bloqueios), independente do
+    tamanho do lote. RN-10 não se aplica: reservas de eventos são
+    institucionais. Os erros por item ficam em ``erros_itens`` (índice → mensagens).
+    """
+
+    MAX_ITENS = 100
+
+    reservas = forms.JSONField()
+
+    def __init__(self, *args, **kwargs):
+        self.usuario = kwargs.pop("usuario", None)
+        super().__init__(*args, **kwargs)
+        self.erros_itens = {}
+
+    def _erro_item(self, indice, mensagem):
+        self.erros_itens.setdefault(indice, []).append(mensagem)
+
+    def clean_reservas(self):
+        itens = self.cleaned_data["reservas"]
+        if not isinstance(itens, list) or not 1 <= len(itens) <= self.MAX_ITENS:
+            raise forms.ValidationError(f"Informe uma lista com 1 a {self.MAX_ITENS} reservas.")
+        pedidos = []
+        for indice, item in enumerate(itens):
+            item_form = ItemReservaLoteForm(item if isinstance(item, dict) else {})
+            if item_form.is_valid():
+                pedidos.append(item_form.cleaned_data)
+            else:
+                for mensagens in item_form.errors.values():
+                    for mensagem in mensagens:
+                        self._erro_item(indice, mensagem)
+        if self.erros_itens:
+            raise forms.ValidationError("Há reservas inválidas no lote.")
+        return pedidos
+
+    def clean(self):
+        data = super().clean()
+        pedidos = data.get("reservas")
+        if not pedidos:
+            return data
+
+        # 1ª consulta — RN-03 e RN-07
+        salas = Sala.objects.using(PRIMARIO).in_bulk({p["sala"] for p in pedidos})
+        inexistentes = [indice for indice, pedido in enumerate(pedidos) if pedido["sala"] not in salas]
+        for indice in inexistentes:
+            self._erro_item(indice, "Sala inexistente.")
+        if inexistentes:
+            raise forms.ValidationError("Há reservas inválidas no lote.")
+        for indice, pedido in enumerate(pedidos):
+            sala = pedido["sala"] = salas[pedido["sala"]]
+            pedido["quantidade_pessoas"] = pedido["quantidade_pessoas"] or 1
+            if pedido["quantidade_pessoas"] > sala.capacidade:
+                self._erro_item(
+                    indice,
+                    f"A quantidade reservada ({pedido['quantidade_pessoas']}) excede a capacidade da sala ({sala.capacidade} pessoas).",
+                )
+            inicio = timezone.localtime(pedido["data_hora_inicio"])
+            fim = timezone.localtime(pedido["data_hora_fim"])
+            if inicio.time() < sala.hora_inicio or fim.time() > sala.hora_fim or inicio.date() != fim.date():
+                self._erro_item(
+                    indice,
+                    f"Fora do horário de funcionamento da sala ({sala.hora_inicio:%H:%M} às {sala.hora_fim:%H:%M}).",
+                )
+
+        # RN-06 dentro do próprio lote
+        for indice, pedido in enumerate(pedidos):
+            for outro in pedidos[:indice]:
+                if (
+                    outro["sala"] == pedido["sala"]
+                    and outro["data_hora_inicio"] < pedido["data_hora_fim"]
+                    and outro["data_hora_fim"] > pedido["data_hora_inicio"]
+                ):
+                    self._erro_item(indice, "Sobrepõe outra reserva do mesmo lote para esta sala.")
+                    break
+
+        # 2ª consulta — RN-06 contra as reservas existentes
+        for indice in self._indices_com_conflito(pedidos):
+            self._erro_item(indice, "Já existe uma reserva para esta sala nesse período.")
+
+        # 3ª consulta — RN-24, bloqueios de manutenção de todas as salas do lote
+        bloqueios = BloqueioManutencao.salas.through.objects.using(PRIMARIO).filter(
+            sala_id__in=salas,
+            bloqueiomanutencao__inicio__lt=max(p["data_hora_fim"] for p in pedidos),
+            bloqueiomanutencao__fim__gt=min(p["data_hora_inicio"] for p in pedidos),
+        ).values_list("sala_id", "bloqueiomanutencao__inicio", "bloqueiomanutencao__fim")
+        bloqueios = list(bloqueios)
+        for indice, pedido in enumerate(pedidos):
+            if any(
+                sala_id == pedido["sala"].pk and inicio < pedido["data_hora_fim"] and fim > pedido["data_hora_inicio"]
+                for sala_id, inicio, fim in bloqueios
+            ):
+                self._erro_item(indice, "A sala está bloqueada para manutenção nesse período.")
+
+        if self.erros_itens:
+            raise forms.ValidationError("Há reservas inválidas no lote.")
+        return data
+
+    def _indices_com_conflito(self, pedidos):
+        """Índices dos pedidos que se sobrepõem a reservas já gravadas, em uma consulta."""
+        existentes = list(
+            Reserva.objects.using(PRIMARIO)
+            .sobrepostas_a_alguma([(p["sala"].pk, p["data_hora_inicio"], p["data_hora_fim"]) for p in pedidos])
+            .values_list("sala_id", "data_hora_inicio", "data_hora_fim")
+        )
+        return [
+            indice
+            for indice, pedido in enumerate(pedidos)
+            if any(
+                sala_id == pedido["sala"].pk and inicio < pedido["data_hora_fim"] and fim > pedido["data_hora_inicio"]
+                for sala_id, inicio, fim in existentes
             )
-            reservas_criadas.append(reserva)
-        return reservas_criadas
+        ]
+
+    def criar_reservas(self):
+        """
+        Grava o lote em uma transação: trava as salas (``travar_salas``, a mesma
+        trava das reservas simples, recorrentes e edições), repete a checagem de
+        RN-06 já com as travas e insere tudo com um ``bulk_create``. Se outra
+        reserva entrou nesse meio-tempo, nada é gravado e ``erros_itens`` indica
+        os conflitos.
+        """
+        pedidos = self.cleaned_data["reservas"]
+        with transaction.atomic(using=PRIMARIO):
+            travar_salas({p["sala"].pk for p in pedidos})
+            conflitos = self._indices_com_conflito(pedidos)
+            if conflitos:
+                for indice in conflitos:
+                    self._erro_item(indice, "Já existe uma reserva para esta sala nesse período.")
+                return None
+            return Reserva.objects.using(PRIMARIO).bulk_create([
+                Reserva(
+                    sala=p["sala"],
+                    usuario=self.usuario,
+                    data_hora_inicio=p["data_hora_inicio"],
+                    data_hora_fim=p["data_hora_fim"],
+                    quantidade_pessoas=p["quantidade_pessoas"],
+                )
+                for p in pedidos
+            ])
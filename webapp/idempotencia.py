@@ -0,0 +1,106 @@
+"""Envios idempotentes dos formulários de reserva.
+
+O formulário leva um token aleatório em um campo oculto (``token_idempotencia``).
+No POST, o decorator ``idempotente`` reserva o token no cache com ``cache.add``
+(atômico) antes de a view rodar:
+
+* se a view redireciona (sucesso), o redirecionamento e as mensagens ficam
+  guardados por ``IDEMPOTENCIA_TTL`` segundos; um reenvio com o mesmo token —
+  duplo clique, retentativa do navegador — recebe a mesma resposta na hora,
+  sem validar nem gravar de novo;
+* se a view devolve o formulário com erros, o token é liberado e o usuário
+  pode corrigir e reenviar;
+* um reenvio enquanto o primeiro ainda está em andamento volta para o painel
+  com um aviso, sem esperar.
+
+O token é por usuário: a chave do cache inclui o pk de quem envia.
+"""
+
+import re
+import secrets
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponseRedirect
+from django.http.response import HttpResponseRedirectBase
+from django.shortcuts import redirect
+
+CAMPO = "token_idempotencia"
+EM_ANDAMENTO = "em_andamento"
+_FORMATO = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def novo_token():
+    return secrets.token_urlsafe(16)
+
+
+def token_do_formulario(request):
+    """Token para o campo oculto: o do envio que voltou com erros ou um novo."""
+    token = request.POST.get(CAMPO, "")
+    return token if _FORMATO.match(token) else novo_token()
+
+
+@contextmanager
+def _gravar_mensagens(request):
+    """Lista das mensagens que a view adiciona (``messages.add_message``) dentro do bloco."""
+    gravadas = []
+    armazenamento = messages.get_messages(request)
+    adicionar = armazenamento.add
+
+    def _add(level, message, extra_tags=""):
+        gravadas.append((level, message, extra_tags))
+        adicionar(level, message, extra_tags)
+
+    armazenamento.add = _add
+    try:
+        yield gravadas
+    finally:
+        # Volta ao método da classe
+        del armazenamento.add
+
+
+def idempotente(escopo, destino="dashboard"):
+    """Decorator de view que torna os POSTs com ``token_idempotencia`` idempotentes; use ``method_decorator`` em views de classe."""
+
+    def decorator(view):
+        @wraps(view)
+        def _view(request, *args, **kwargs):
+            token = request.POST.get(CAMPO, "") if request.method == "POST" else ""
+            if not _FORMATO.match(token) or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            chave = f"idempotencia:{escopo}:{request.user.pk}:{token}"
+            if not cache.add(chave, EM_ANDAMENTO, settings.IDEMPOTENCIA_TTL):
+                anterior = cache.get(chave)
+                if anterior == EM_ANDAMENTO:
+                    messages.info(request, "Sua solicitação anterior ainda está sendo processada.")
+                    return redirect(destino)
+                if anterior is not None:
+                    for nivel, texto, tags in anterior["mensagens"]:
+                        messages.add_message(request, nivel, texto, extra_tags=tags)
+                    return HttpResponseRedirect(anterior["location"])
+                # Expirou entre o add e o get: segue como um envio novo
+                cache.add(chave, EM_ANDAMENTO, settings.IDEMPOTENCIA_TTL)
+
+            try:
+                with _gravar_mensagens(request) as mensagens:
+                    response = view(request, *args, **kwargs)
+            except BaseException:
+                cache.delete(chave)
+                raise
+            if isinstance(response, HttpResponseRedirectBase):
+                cache.set(
+                    chave,
+                    {"location": response["Location"], "mensagens": mensagens},
+                    settings.IDEMPOTENCIA_TTL,
+                )
+            else:
+                cache.delete(chave)
+            return response
+
+        return _view
+
+    return decorator
@@ -0,0 +1,131 @@
+"""Limitação de taxa (token bucket) dos endpoints caros: login, cadastro e reservas.
+
+Cada escopo de ``LIMITES_TAXA`` tem um balde por IP e, quando faz sentido, um
+por usuário (o autenticado, ou o nome tentado no login). Um balde comporta
+``capacidade`` fichas e recupera ``capacidade`` fichas a cada ``periodo``
+segundos; cada POST consome uma ficha de cada balde do escopo. Sem ficha, a
+requisição recebe 429 com ``Retry-After`` antes de a view rodar — ou seja,
+antes do PBKDF2 do login/cadastro e das consultas de validação das reservas.
+
+Os baldes ficam no cache padrão (compartilhado entre os workers quando
+``REDIS_URL`` está configurado). Se o cache falhar, cada processo passa a usar
+baldes em memória local. A leitura e a gravação do balde não são atômicas:
+sob concorrência o limite pode ser excedido por poucas requisições, o que é
+aceitável para conter abuso.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+METODOS_LIMITADOS = ("POST",)
+MAX_BALDES_LOCAIS = 10_000
+
+_baldes_locais = OrderedDict()
+_lock_local = threading.Lock()
+
+
+def ip_cliente(request):
+    """IP do cliente; atrás de LIMITES_PROXIES_CONFIAVEIS proxies, lido do X-Forwarded-For."""
+    proxies = settings.LIMITES_PROXIES_CONFIAVEIS
+    encaminhado = [ip.strip() for ip in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if ip.strip()]
+    if proxies and len(encaminhado) >= proxies:
+        # Cada proxy confiável acrescenta o IP de quem o chamou; os anteriores podem ser forjados
+        return encaminhado[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _identificadores(request, escopo):
+    yield "ip", ip_cliente(request)
+    if request.user.is_authenticated:
+        yield "usuario", str(request.user.pk)
+    elif escopo == "login" and request.POST.get("username"):
+        # Protege a conta atacada mesmo com os pedidos vindo de muitos IPs
+        yield "usuario", request.POST["username"].strip().lower()
+
+
+def _chave(escopo, tipo, identificador):
+    return f"limite:{escopo}:{tipo}:{hashlib.sha256(identificador.encode()).hexdigest()[:32]}"
+
+
+def _ler(chaves):
+    try:
+        return cache.get_many(chaves), True
+    except Exception:
+        with _lock_local:
+            return {chave: _baldes_locais[chave] for chave in chaves if chave in _baldes_locais}, False
+
+
+def _gravar(baldes, timeout, no_cache):
+    if no_cache:
+        try:
+            cache.set_many(baldes, timeout)
+            return
+        except Exception:
+            pass
+    with _lock_local:
+        _baldes_locais.update(baldes)
+        for chave in baldes:
+            _baldes_locais.move_to_end(chave)
+        while len(_baldes_locais) > MAX_BALDES_LOCAIS:
+            _baldes_locais.popitem(last=False)
+
+
+def consumir(request, escopo):
+    """
+    Consome uma ficha de cada balde do escopo. Retorna 0 se a requisição pode
+    seguir ou, se algum balde está vazio, os segundos até haver ficha (nada é
+    consumido nesse caso).
+    """
+    limites = settings.LIMITES_TAXA[escopo]
+    agora = time.time()
+    baldes = {
+        _chave(escopo, tipo, identificador): limites[tipo]
+        for tipo, identificador in _identificadores(request, escopo)
+        if tipo in limites
+    }
+    salvos, no_cache = _ler(list(baldes))
+
+    novos, espera = {}, 0.0
+    for chave, (capacidade, periodo) in baldes.items():
+        taxa = capacidade / periodo
+        fichas, instante = salvos.get(chave, (capacidade, agora))
+        fichas = min(capacidade, fichas + (agora - instante) * taxa)
+        if fichas < 1:
+            espera = max(espera, (1 - fichas) / taxa)
+        novos[chave] = (fichas - 1, agora)
+    if espera:
+        return math.ceil(espera)
+
+    _gravar(novos, max(periodo for _, periodo in baldes.values()), no_cache)
+    return 0
+
+
+def limitar(escopo):
+    """Decorator de view que aplica o escopo de ``LIMITES_TAXA`` aos POSTs; use ``method_decorator`` em views de classe."""
+
+    def decorator(view):
+        @wraps(view)
+        def _view(request, *args, **kwargs):
+            if settings.LIMITES_TAXA_ATIVO and request.method in METODOS_LIMITADOS:
+                espera = consumir(request, escopo)
+                if espera:
+                    response = HttpResponse(
+                        f"Muitas tentativas. Tente novamente em {espera} segundo(s).",
+                        status=429,
+                        content_type="text/plain; charset=utf-8",
+                    )
+                    response["Retry-After"] = str(espera)
+                    return response
+            return view(request, *args, **kwargs)
+
+        return _view
+
+    return decorator
@@ -0,0 +1,92 @@
+import csv
+import sys
+import time as cronometro
+from datetime import date, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from webapp.alocacao import alocar, ocupacao_existente
+from webapp.models import Sala
+
+COLUNAS = ("turma", "dia_da_semana", "hora_inicio", "hora_fim", "quantidade_pessoas", "tipo")
+SEMANAS_PADRAO = 18
+
+
+class Command(BaseCommand):
+    help = (
+        "Aloca salas para as aulas semanais do semestre lidas de um CSV "
+        f"({', '.join(COLUNAS)}; dia_da_semana 0=segunda, tipo opcional), minimizando "
+        "lugares ociosos e respeitando o funcionamento das salas, as reservas existentes e "
+        "os bloqueios de manutenção. Grava o resultado em CSV e lista as aulas sem sala."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="CSV com as aulas (use - para a entrada padrão).")
+        parser.add_argument(
+            "--inicio", type=date.fromisoformat, default=None,
+            help="Primeiro dia do semestre (padrão: hoje), para consultar reservas e bloqueios.",
+        )
+        parser.add_argument("--semanas", type=int, default=SEMANAS_PADRAO, help="Duração do semestre em semanas.")
+        parser.add_argument("--saida", default=None, help="CSV de saída (padrão: saída padrão).")
+
+    def handle(self, *args, **options):
+        aulas = self._ler(options["arquivo"])
+        salas = list(Sala.objects.order_by("pk"))
+        if not salas:
+            raise CommandError("Nenhuma sala cadastrada.")
+
+        inicio = cronometro.perf_counter()
+        ocupados = ocupacao_existente(options["inicio"] or timezone.localdate(), options["semanas"])
+        alocadas, nao_alocadas = alocar(aulas, salas, ocupados)
+        duracao = cronometro.perf_counter() - inicio
+
+        self._escrever(alocadas, nao_alocadas, options["saida"])
+        ociosos = sum(sala.capacidade - aula["pessoas"] for aula, sala in alocadas)
+        self.stderr.write(
+            f"{len(alocadas)} de {len(aulas)} aulas alocadas em {duracao:.2f}s; "
+            f"{ociosos} lugares ociosos no total."
+        )
+        for aula, motivo in nao_alocadas:
+            self.stderr.write(self.style.WARNING(f"  sem sala: {aula['turma']} — {motivo}"))
+
+    def _ler(self, caminho):
+        arquivo = sys.stdin if caminho == "-" else open(caminho, encoding="utf-8", newline="")
+        tipos = dict(Sala.TIPO_CHOICES)
+        aulas = []
+        with arquivo:
+            for linha, registro in enumerate(csv.DictReader(arquivo), start=2):
+                try:
+                    aula = {
+                        "turma": registro["turma"],
+                        "dia": int(registro["dia_da_semana"]),
+                        "inicio": time.fromisoformat(registro["hora_inicio"]),
+                        "fim": time.fromisoformat(registro["hora_fim"]),
+                        "pessoas": int(registro["quantidade_pessoas"]),
+                        "tipo": (registro.get("tipo") or "").strip() or None,
+                    }
+                except (KeyError, TypeError, ValueError) as erro:
+                    raise CommandError(f"Linha {linha} inválida: {erro}")
+                if not 0 <= aula["dia"] <= 6 or aula["fim"] <= aula["inicio"] or aula["pessoas"] < 1:
+                    raise CommandError(f"Linha {linha} inválida: dia, horário ou quantidade de pessoas.")
+                if aula["tipo"] and aula["tipo"] not in tipos:
+                    raise CommandError(f"Linha {linha}: tipo '{aula['tipo']}' inválido (use {', '.join(tipos)}).")
+                aulas.append(aula)
+        return aulas
+
+    def _escrever(self, alocadas, nao_alocadas, caminho):
+        arquivo = open(caminho, "w", encoding="utf-8", newline="") if caminho else self.stdout
+        escritor = csv.writer(arquivo)
+        escritor.writerow(
+            ["turma", "dia_da_semana", "hora_inicio", "hora_fim", "quantidade_pessoas", "sala", "lugares_ociosos", "motivo"]
+        )
+        linhas = [(aula, sala.nome, sala.capacidade - aula["pessoas"], "") for aula, sala in alocadas]
+        linhas += [(aula, "", "", motivo) for aula, motivo in nao_alocadas]
+        linhas.sort(key=lambda linha: (linha[0]["dia"], linha[0]["inicio"], linha[0]["turma"]))
+        for aula, sala, ociosos, motivo in linhas:
+            escritor.writerow([
+                aula["turma"], aula["dia"], aula["inicio"].strftime("%H:%M"), aula["fim"].strftime("%H:%M"),
+                aula["pessoas"], sala, ociosos, motivo,
+            ])
+        if caminho:
+            arquivo.close()
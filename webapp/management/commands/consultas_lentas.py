@@ -0,0 +1,68 @@
+import json
+import re
+import statistics
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.consultas_lentas import impressao_digital
+
+# Trechos de plano que costumam indicar falta de índice (PostgreSQL e SQLite)
+SEM_INDICE = (
+    re.compile(r"Seq Scan on (\w+)"),
+    re.compile(r"\bSCAN (\w+)(?! USING)(?!.*USING (?:COVERING )?INDEX)"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume o registro de consultas lentas por impressão digital (SQL sem valores): "
+        "quantidade, tempo total e máximo, views e linhas de origem e varreduras sem índice nos planos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--arquivo", default=None, help="Arquivo JSONL (padrão: CONSULTAS_LENTAS_ARQUIVO).")
+        parser.add_argument("--top", type=int, default=10, help="Quantas impressões digitais listar.")
+        parser.add_argument(
+            "--ordenar", choices=("total", "max", "quantidade"), default="total",
+            help="Critério de ordenação (padrão: total).",
+        )
+
+    def handle(self, *args, **options):
+        caminho = options["arquivo"] or settings.CONSULTAS_LENTAS_ARQUIVO
+        try:
+            with open(caminho, encoding="utf-8") as arquivo:
+                registros = [json.loads(linha) for linha in arquivo if linha.strip()]
+        except FileNotFoundError:
+            raise CommandError(f"Nenhuma consulta lenta registrada ainda ({caminho}).")
+
+        grupos = defaultdict(list)
+        for registro in registros:
+            grupos[registro["impressao"]].append(registro)
+
+        chave = {
+            "total": lambda g: sum(r["duracao_ms"] for r in g),
+            "max": lambda g: max(r["duracao_ms"] for r in g),
+            "quantidade": len,
+        }[options["ordenar"]]
+        self.stdout.write(f"{len(registros)} consultas lentas, {len(grupos)} impressões digitais\n")
+
+        for digital, grupo in sorted(grupos.items(), key=lambda item: chave(item[1]), reverse=True)[: options["top"]]:
+            duracoes = [r["duracao_ms"] for r in grupo]
+            self.stdout.write(
+                f"[{digital}] {len(grupo)}x  total {sum(duracoes):.0f} ms  "
+                f"mediana {statistics.median(duracoes):.0f} ms  máx {max(duracoes):.0f} ms"
+            )
+            self.stdout.write(f"  {impressao_digital(grupo[0]['sql'])[1][:300]}")
+            for rotulo, campo in (("views", "view"), ("origem", "origem")):
+                mais_comuns = Counter(r[campo] for r in grupo if r.get(campo)).most_common(3)
+                if mais_comuns:
+                    self.stdout.write(f"  {rotulo}: " + ", ".join(f"{v} ({n}x)" for v, n in mais_comuns))
+            plano = next((r["plano"] for r in grupo if r.get("plano")), None)
+            if plano:
+                tabelas = sorted({m for padrao in SEM_INDICE for m in padrao.findall(plano)})
+                if tabelas:
+                    self.stdout.write(self.style.WARNING(f"  varredura sem índice em: {', '.join(tabelas)}"))
+                self.stdout.write("  plano:\n" + "\n".join(f"    {linha}" for linha in plano.splitlines()))
+            self.stdout.write("")
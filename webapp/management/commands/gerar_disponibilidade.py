@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from webapp.calendario_academico import gerar_disponibilidade
+
+
+class Command(BaseCommand):
+    help = (
+        "Grava o tempo disponível de cada sala por dia (calendário acadêmico, horário da sala "
+        "e bloqueios de manutenção) usado nas taxas de ocupação. Dias fora da tabela são "
+        "calculados a cada leitura; rode periodicamente para os próximos meses e refaça o "
+        "período depois de mudar DIAS_SEMANA_LETIVOS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--inicio", type=date.fromisoformat, help="Primeiro dia, AAAA-MM-DD (padrão: hoje).")
+        parser.add_argument("--dias", type=int, default=120, help="Quantos dias a partir do início (padrão: 120).")
+        parser.add_argument("--sala", type=int, help="Só a sala com esse id.")
+
+    def handle(self, *args, **options):
+        if options["dias"] < 1:
+            raise CommandError("--dias deve ser pelo menos 1.")
+        data_inicio = options["inicio"] or timezone.localdate()
+        data_fim = data_inicio + timedelta(days=options["dias"] - 1)
+
+        sala_ids = None if options["sala"] is None else [options["sala"]]
+        totais = gerar_disponibilidade(data_inicio, data_fim, sala_ids)
+        if not totais:
+            raise CommandError("Nenhuma sala encontrada.")
+        self.stdout.write(
+            f"{len(totais)} sala(s) de {data_inicio:%d/%m/%Y} a {data_fim:%d/%m/%Y}: "
+            f"{sum(totais.values()) / 60:.0f} h disponíveis."
+        )
@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from webapp.particoes import (
+    TABELA,
+    converter_tabela,
+    criar_particao,
+    destacar_particao,
+    inicio_do_mes,
+    nome_particao,
+    particoes_mensais,
+    somar_meses,
+    suporta_particoes,
+    tabela_particionada,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria as partições mensais de reservas dos próximos meses e, com --reter-meses, "
+        "destaca (arquiva) as partições mais antigas. Só tem efeito no PostgreSQL, depois "
+        "de a tabela ser convertida com --converter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--meses-futuros", type=int, default=3,
+            help="Quantos meses à frente do atual devem ter partição (padrão: 3).",
+        )
+        parser.add_argument(
+            "--reter-meses", type=int, default=None,
+            help="Destaca as partições anteriores a esse número de meses atrás (padrão: não destaca).",
+        )
+        parser.add_argument(
+            "--apagar", action="store_true",
+            help="Apaga as partições destacadas em vez de mantê-las como tabelas de arquivo.",
+        )
+        parser.add_argument(
+            "--converter", action="store_true",
+            help="Recria a tabela de reservas como particionada (chave primária (id, data_hora_inicio)).",
+        )
+        parser.add_argument(
+            "--reverter", action="store_true",
+            help="Recria a tabela de reservas como tabela comum, com chave primária id.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if not suporta_particoes(connection):
+            self.stdout.write(f"Banco '{connection.vendor}' não usa partições; nada a fazer.")
+            return
+        if options["reter_meses"] is not None and options["reter_meses"] < 1:
+            raise CommandError("--reter-meses deve ser pelo menos 1.")
+        if options["converter"] and options["reverter"]:
+            raise CommandError("Use --converter ou --reverter, não os dois.")
+
+        mes_atual = inicio_do_mes(timezone.now().date())
+        with connection.cursor() as cursor:
+            particionada = tabela_particionada(cursor)
+            if options["reverter"]:
+                if particionada:
+                    with transaction.atomic(using=connection.alias):
+                        converter_tabela(connection, particionada=False)
+                    self.stdout.write(f"Tabela {TABELA} recriada sem partições.")
+                return
+            if options["converter"] and not particionada:
+                with transaction.atomic(using=connection.alias):
+                    converter_tabela(connection, meses_futuros=options["meses_futuros"])
+                self.stdout.write(f"Tabela {TABELA} convertida em particionada.")
+            elif not particionada:
+                self.stdout.write(f"Tabela {TABELA} não é particionada; use --converter para convertê-la.")
+                return
+
+            existentes = particoes_mensais(cursor)
+
+            for i in range(options["meses_futuros"] + 1):
+                mes = somar_meses(mes_atual, i)
+                if mes not in existentes:
+                    with transaction.atomic(using=connection.alias):
+                        criar_particao(cursor, mes)
+                    self.stdout.write(f"Criada {nome_particao(mes)}")
+
+            if options["reter_meses"] is not None:
+                limite = somar_meses(mes_atual, -options["reter_meses"])
+                for mes, nome in existentes.items():
+                    if mes >= limite:
+                        break
+                    with transaction.atomic(using=connection.alias):
+                        destacar_particao(cursor, nome, apagar=options["apagar"])
+                    self.stdout.write(f"{'Apagada' if options['apagar'] else 'Destacada'} {nome}")
@@ -0,0 +1,106 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time as cronometro
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.management.commands.teste_carga import PREFIXO_USUARIO, UsuarioVirtual
+from webapp.models import Sala
+
+USUARIO = f"{PREFIXO_USUARIO}inicializacao"
+ACOES = ("pagina_login", "login", "dashboard", "busca")
+MODOS = {"frio": False, "aquecido": True}
+# Linhas do log do gunicorn que indicam o worker pronto para aceitar requisições
+MARCA_WORKER = "Booting worker"
+MARCA_AQUECIDO = "aquecido em"
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe o gunicorn (1 worker) com e sem o aquecimento dos workers (AQUECER_WORKERS) e "
+        "compara o tempo até o worker ficar pronto e a latência da primeira e da segunda "
+        "requisição da página de login, do login, do dashboard e da busca de salas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rodadas", type=int, default=3, help="Inicializações por modo; reporta a mediana.")
+        parser.add_argument("--senha", default="carga-senha-123", help="Senha do usuário de teste.")
+        parser.add_argument("--timeout", type=float, default=60, help="Segundos de espera pelo worker pronto.")
+
+    def handle(self, *args, **options):
+        salas = list(Sala.objects.order_by("pk").values_list("pk", flat=True)[:3])
+        if not salas:
+            raise CommandError("Cadastre ao menos uma sala antes de medir a inicialização.")
+        usuario, _ = User.objects.get_or_create(username=USUARIO)
+        usuario.set_password(options["senha"])
+        usuario.save()
+
+        medidas = {}
+        for modo, aquecer in MODOS.items():
+            rodadas = [self._rodada(aquecer, salas, options) for _ in range(options["rodadas"])]
+            medidas[modo] = {chave: statistics.median(r[chave] for r in rodadas) for chave in rodadas[0]}
+            self.stdout.write(f"{modo}: {options['rodadas']} inicializações medidas")
+
+        self.stdout.write(f"\n{'(ms, mediana)':<24} {'frio':>9} {'aquecido':>9}")
+        for chave in medidas["frio"]:
+            self.stdout.write(f"{chave:<24} {medidas['frio'][chave]:>9.0f} {medidas['aquecido'][chave]:>9.0f}")
+
+    def _rodada(self, aquecer, salas, options):
+        porta = _porta_livre()
+        inicio = cronometro.perf_counter()
+        processo = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn", "config.wsgi", "--workers", "1",
+                "--bind", f"127.0.0.1:{porta}", "--log-level", "info",
+            ],
+            cwd=settings.BASE_DIR,
+            # O mesmo usuário entra várias vezes por rodada: sem isso o limite de login
+            # por usuário (LIMITES_TAXA) responde 429 com o cache compartilhado
+            env={**os.environ, "AQUECER_WORKERS": str(aquecer), "LIMITES_TAXA_ATIVO": "False"},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        pronto = threading.Event()
+        marca = MARCA_AQUECIDO if aquecer else MARCA_WORKER
+        threading.Thread(target=self._ler_log, args=(processo, marca, pronto), daemon=True).start()
+        try:
+            if not pronto.wait(options["timeout"]):
+                raise CommandError(
+                    f"O worker não ficou pronto em {options['timeout']:.0f}s; rode o gunicorn manualmente para ver o erro."
+                )
+            resultado = {"worker pronto": (cronometro.perf_counter() - inicio) * 1000}
+            usuario = UsuarioVirtual(f"http://127.0.0.1:{porta}", USUARIO, options["senha"], salas, options["timeout"])
+            for acao in ACOES:
+                for vez in ("1ª", "2ª"):
+                    antes = cronometro.perf_counter()
+                    if acao == "pagina_login":
+                        status, _ = usuario._requisitar("/login/")
+                        sucesso = status == 200
+                    else:
+                        sucesso = getattr(usuario, acao)() == "sucesso"
+                    if not sucesso:
+                        raise CommandError(f"A ação '{acao}' falhou durante a medição.")
+                    resultado[f"{acao} ({vez})"] = (cronometro.perf_counter() - antes) * 1000
+            return resultado
+        finally:
+            processo.terminate()
+            processo.wait()
+
+    def _ler_log(self, processo, marca, pronto):
+        """Consome o log do gunicorn (para o pipe não encher) e sinaliza quando a marca aparece."""
+        for linha in processo.stderr:
+            if marca in linha:
+                pronto.set()
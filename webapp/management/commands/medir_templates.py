@@ -0,0 +1,82 @@
+import statistics
+import time as cronometro
+from datetime import time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.template.backends.utils import csrf_input
+from django.test import RequestFactory
+from django.utils import timezone
+
+from webapp.models import Reserva, Sala
+from webapp.views import _linha_reserva, _rotas_reserva
+
+# As linhas das tabelas: a única parte das páginas renderizada por MOTOR_TEMPLATES_PAINEIS
+TEMPLATES = ("webapp/parciais/linhas_reservas.html", "webapp/parciais/linhas_relatorio.html")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o tempo de renderização das linhas do dashboard e do relatório de "
+        "ocupação nos motores Django e Jinja2 com dados sintéticos (sem acesso ao banco)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--linhas", type=int, nargs="+", default=[1000, 10000],
+            help="Quantidades de reservas a renderizar (padrão: 1000 10000).",
+        )
+        parser.add_argument(
+            "--repeticoes", type=int, default=5,
+            help="Renderizações por combinação; é reportada a mediana (padrão: 5).",
+        )
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get("/dashboard/")
+
+        self.stdout.write(f"{'template':<40} {'linhas':>7} {'django (ms)':>12} {'jinja2 (ms)':>12} {'ganho':>7}")
+        for num_linhas in options["linhas"]:
+            contexto = self._contexto(num_linhas, request)
+            for nome in TEMPLATES:
+                tempos = {
+                    motor: self._medir(engines[motor].get_template(nome), contexto, options["repeticoes"])
+                    for motor in ("django", "jinja2")
+                }
+                self.stdout.write(
+                    f"{nome:<40} {num_linhas:>7} {tempos['django']:>12.1f} {tempos['jinja2']:>12.1f} "
+                    f"{tempos['django'] / tempos['jinja2']:>6.1f}x"
+                )
+
+    def _medir(self, template, contexto, repeticoes):
+        amostras = []
+        for _ in range(repeticoes):
+            inicio = cronometro.perf_counter()
+            # Sem request, como em views._renderizar_linhas
+            template.render(contexto)
+            amostras.append((cronometro.perf_counter() - inicio) * 1000)
+        return statistics.median(amostras)
+
+    def _contexto(self, num_linhas, request):
+        agora = timezone.now()
+        usuario = User(pk=1, username="aluno")
+        salas = [
+            Sala(pk=i + 1, nome=f"Sala {i + 1:03d}", capacidade=30, hora_inicio=time(8), hora_fim=time(22))
+            for i in range(20)
+        ]
+        reservas = [
+            Reserva(
+                pk=i + 1,
+                sala=salas[i % len(salas)],
+                usuario=usuario,
+                data_hora_inicio=agora + timedelta(hours=i),
+                data_hora_fim=agora + timedelta(hours=i + 1),
+            )
+            for i in range(num_linhas)
+        ]
+        rotas = _rotas_reserva()
+        return {
+            "linhas": [_linha_reserva(r, agora, rotas) for r in reservas],
+            "staff": True,
+            "csrf_input": csrf_input(request),
+        }
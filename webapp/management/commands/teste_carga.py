@@ -0,0 +1,296 @@
+import random
+import statistics
+import threading
+import time as cronometro
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import timedelta
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from webapp.models import Sala
+
+PREFIXO_USUARIO = "carga_"
+MIX_PADRAO = "login=1,dashboard=5,busca=3,reserva=3,recorrente=1"
+ACOES = ("login", "dashboard", "busca", "reserva", "recorrente")
+
+# Trechos da resposta usados para classificar o resultado de uma reserva
+MARCAS_CONFLITO = ("Já existe uma reserva", "Conflito de horário")
+MARCAS_LIMITE = ("reservas ativas",)
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    """Mede só a requisição feita; o redirecionamento de sucesso não é seguido."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class UsuarioVirtual:
+    """Um navegador simulado: sessão própria (cookies) e as ações de um aluno no dia da matrícula."""
+
+    def __init__(self, url_base, username, senha, salas, timeout):
+        self.url_base = url_base.rstrip("/")
+        self.username = username
+        self.senha = senha
+        self.salas = salas
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _SemRedirecionar()
+        )
+
+    def _csrf(self):
+        return next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+
+    def _requisitar(self, caminho, dados=None, params=None):
+        url = self.url_base + caminho
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        corpo = None
+        if dados is not None:
+            corpo = urllib.parse.urlencode({**dados, "csrfmiddlewaretoken": self._csrf()}).encode()
+        requisicao = urllib.request.Request(url, data=corpo, headers={"Referer": url})
+        try:
+            with self.abridor.open(requisicao, timeout=self.timeout) as resposta:
+                return resposta.status, resposta.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as erro:
+            return erro.code, erro.read().decode("utf-8", "replace")
+
+    def login(self):
+        self.cookies.clear()
+        self._requisitar("/login/")
+        status, _ = self._requisitar("/login/", {"username": self.username, "password": self.senha})
+        return "sucesso" if status == 302 else _classificar_erro(status, "")
+
+    def dashboard(self):
+        status, corpo = self._requisitar("/dashboard/")
+        return "sucesso" if status == 200 else _classificar_erro(status, corpo)
+
+    def busca(self):
+        inicio, fim = _horario_disputado()
+        status, corpo = self._requisitar("/salas/disponiveis/", params={
+            "inicio": inicio.strftime("%Y-%m-%dT%H:%M"),
+            "fim": fim.strftime("%Y-%m-%dT%H:%M"),
+        })
+        return "sucesso" if status == 200 else _classificar_erro(status, corpo)
+
+    def reserva(self):
+        inicio, fim = _horario_disputado()
+        status, corpo = self._requisitar("/reservas/nova/", {
+            "sala": random.choice(self.salas),
+            "data_hora_inicio": inicio.strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": fim.strftime("%Y-%m-%dT%H:%M"),
+            "quantidade_pessoas": 1,
+        })
+        return _classificar_formulario(status, corpo)
+
+    def recorrente(self):
+        inicio, fim = _horario_disputado()
+        status, corpo = self._requisitar("/reservas/recorrente/", {
+            "sala": random.choice(self.salas),
+            "dia_da_semana": inicio.weekday(),
+            "hora_inicio": inicio.strftime("%H:%M"),
+            "hora_fim": fim.strftime("%H:%M"),
+            "data_inicio_recorrencia": inicio.date().isoformat(),
+            "num_semanas": random.randint(1, 4),
+            "quantidade_pessoas": 1,
+        })
+        return _classificar_formulario(status, corpo)
+
+
+def _horario_disputado():
+    """Uma hora cheia de amanhã no horário comercial; poucos horários para forçar disputa."""
+    amanha = timezone.localtime() + timedelta(days=1)
+    inicio = amanha.replace(hour=random.randint(8, 17), minute=0, second=0, microsecond=0)
+    return inicio, inicio + timedelta(hours=1)
+
+
+def _classificar_erro(status, corpo):
+    # Com DEBUG=False o corpo de um 500 não diz a causa: deadlocks são contados
+    # no banco (_deadlocks), não aqui
+    if status == 429:
+        return "limitado"
+    if status >= 500:
+        return "erro_servidor"
+    return "erro"
+
+
+def _deadlocks():
+    """Deadlocks acumulados no banco (``pg_stat_database``); ``None`` fora do PostgreSQL."""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+
+def _classificar_formulario(status, corpo):
+    if status == 302:
+        return "sucesso"
+    if status == 200:
+        # Formulário devolvido com erros de validação
+        if any(marca in corpo for marca in MARCAS_CONFLITO):
+            return "conflito"
+        if any(marca in corpo for marca in MARCAS_LIMITE):
+            return "limite"
+        return "rejeitada"
+    return _classificar_erro(status, corpo)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula o pico de matrícula contra um servidor rodando: usuários concorrentes fazendo "
+        "login, atualizando o dashboard, buscando salas (RN-21) e disputando reservas simples e "
+        "recorrentes nas mesmas salas. Reporta vazão, percentis de latência e taxas de conflito, "
+        "erro e deadlock (lidos de pg_stat_database, no mesmo banco do servidor). Todos os usuários "
+        "virtuais saem do mesmo IP: rode o servidor e o comando com LIMITES_TAXA_ATIVO=False, ou as "
+        "respostas viram 429 e os números não valem nada (--com-limites mede com os limites ligados)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Servidor alvo (padrão: %(default)s).")
+        parser.add_argument("--usuarios", type=int, default=50, help="Usuários simultâneos (threads).")
+        parser.add_argument("--duracao", type=int, default=60, help="Duração do teste em segundos.")
+        parser.add_argument("--rampa", type=float, default=5, help="Segundos para iniciar todos os usuários.")
+        parser.add_argument(
+            "--salas-disputadas", type=int, default=3,
+            help="Quantas salas recebem as reservas (menos salas, mais conflitos).",
+        )
+        parser.add_argument("--mix", default=MIX_PADRAO, help="Pesos das ações (padrão: %(default)s).")
+        parser.add_argument("--senha", default="carga-senha-123", help="Senha dos usuários de teste.")
+        parser.add_argument("--timeout", type=float, default=30, help="Timeout de cada requisição em segundos.")
+        parser.add_argument(
+            "--limpar", action="store_true",
+            help="Apaga ao final os usuários de carga criados nesta execução (e suas reservas).",
+        )
+        parser.add_argument(
+            "--com-limites", action="store_true",
+            help="Roda mesmo com LIMITES_TAXA_ATIVO ligado, para medir os próprios limites de taxa.",
+        )
+
+    def handle(self, *args, **options):
+        if settings.LIMITES_TAXA_ATIVO and not options["com_limites"]:
+            raise CommandError(
+                "Limites de taxa ligados: todos os usuários virtuais saem do mesmo IP e seriam "
+                "recusados com 429. Rode o servidor e este comando com LIMITES_TAXA_ATIVO=False "
+                "(ou use --com-limites para medir os limites)."
+            )
+        pesos = self._mix(options["mix"])
+        salas = list(Sala.objects.order_by("pk").values_list("pk", flat=True)[: options["salas_disputadas"]])
+        if not salas:
+            raise CommandError("Cadastre ao menos uma sala antes do teste de carga.")
+        usernames, criados = self._preparar_usuarios(options["usuarios"], options["senha"])
+
+        resultados = []
+        lock = threading.Lock()
+        fim_do_teste = cronometro.monotonic() + options["rampa"] + options["duracao"]
+
+        def executar(indice, username):
+            cronometro.sleep(options["rampa"] * indice / max(len(usernames), 1))
+            usuario = UsuarioVirtual(options["url"], username, options["senha"], salas, options["timeout"])
+            acoes = ["login"]
+            while cronometro.monotonic() < fim_do_teste:
+                acao = acoes.pop() if acoes else random.choices(ACOES, weights=[pesos[a] for a in ACOES])[0]
+                inicio = cronometro.perf_counter()
+                try:
+                    resultado = getattr(usuario, acao)()
+                except OSError:
+                    resultado = "erro"
+                latencia = (cronometro.perf_counter() - inicio) * 1000
+                with lock:
+                    resultados.append((acao, resultado, latencia))
+
+        self.stdout.write(
+            f"{len(usernames)} usuários contra {options['url']} por {options['duracao']}s "
+            f"(salas disputadas: {salas})..."
+        )
+        deadlocks_antes = _deadlocks()
+        inicio_teste = cronometro.monotonic()
+        threads = [
+            threading.Thread(target=executar, args=(i, username), daemon=True)
+            for i, username in enumerate(usernames)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = cronometro.monotonic() - inicio_teste
+        deadlocks = None if deadlocks_antes is None else _deadlocks() - deadlocks_antes
+        self._relatorio(resultados, duracao, deadlocks)
+
+        if options["limpar"]:
+            # Só os criados agora: contas que já existiam com o prefixo ficam
+            User.objects.filter(username__in=criados).delete()
+
+    def _mix(self, texto):
+        pesos = dict.fromkeys(ACOES, 0)
+        try:
+            for parte in texto.split(","):
+                acao, peso = parte.split("=")
+                if acao.strip() not in pesos:
+                    raise ValueError
+                pesos[acao.strip()] = float(peso)
+        except ValueError:
+            raise CommandError(f"--mix inválido: use pesos como '{MIX_PADRAO}'.")
+        if not any(pesos.values()):
+            raise CommandError("--mix precisa de ao menos uma ação com peso positivo.")
+        return pesos
+
+    def _preparar_usuarios(self, quantidade, senha):
+        """
+        Cria os usuários de carga que faltam e troca a senha dos que já existem
+        (de uma execução anterior com outra ``--senha``). Retorna os usernames e
+        os que foram criados agora. A senha é derivada uma vez só, e não por
+        usuário: o hash é lento de propósito.
+        """
+        usernames = [f"{PREFIXO_USUARIO}{i:05d}" for i in range(quantidade)]
+        hash_senha = make_password(senha)
+        existentes = list(User.objects.filter(username__in=usernames).only("pk", "username"))
+        for usuario in existentes:
+            usuario.password = hash_senha
+        User.objects.bulk_update(existentes, ["password"])
+        ja_existiam = {usuario.username for usuario in existentes}
+        criados = [username for username in usernames if username not in ja_existiam]
+        User.objects.bulk_create(User(username=username, password=hash_senha) for username in criados)
+        return usernames, criados
+
+    def _relatorio(self, resultados, duracao, deadlocks=None):
+        por_acao = defaultdict(list)
+        for acao, resultado, latencia in resultados:
+            por_acao[acao].append((resultado, latencia))
+
+        self.stdout.write(
+            f"\n{len(resultados)} requisições em {duracao:.1f}s ({len(resultados) / duracao:.1f} req/s)\n"
+        )
+        self.stdout.write(
+            f"{'ação':<11} {'total':>7} {'req/s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  resultados"
+        )
+        for acao in ACOES:
+            linhas = por_acao.get(acao)
+            if not linhas:
+                continue
+            latencias = sorted(latencia for _, latencia in linhas)
+            percentis = statistics.quantiles(latencias, n=100, method="inclusive") if len(latencias) > 1 else latencias * 99
+            contagem = Counter(resultado for resultado, _ in linhas)
+            resumo = ", ".join(f"{nome}={n} ({n / len(linhas):.1%})" for nome, n in contagem.most_common())
+            self.stdout.write(
+                f"{acao:<11} {len(linhas):>7} {len(linhas) / duracao:>7.1f} {percentis[49]:>8.0f} "
+                f"{percentis[89]:>8.0f} {percentis[98]:>8.0f} {latencias[-1]:>8.0f}  {resumo}"
+            )
+
+        totais = Counter(resultado for _, resultado, _ in resultados)
+        total = max(len(resultados), 1)
+        self.stdout.write(
+            f"\nerros: {totais['erro'] / total:.2%}  erros do servidor (5xx): {totais['erro_servidor']}  "
+            f"deadlocks: {'n/d (só no PostgreSQL)' if deadlocks is None else deadlocks}  "
+            f"limitadas (429): {totais['limitado']}"
+        )
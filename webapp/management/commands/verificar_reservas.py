@@ -0,0 +1,130 @@
+import csv
+import heapq
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from webapp.models import Reserva, Sala
+
+TAMANHO_LOTE = 5000
+
+
+def _preferida(a, b):
+    """Entre duas reservas em conflito, fica a com check-in ou, empatando, a mais antiga (menor pk)."""
+    return min(a, b, key=lambda r: (not r["check_in_realizado"], r["pk"]))
+
+
+class Command(BaseCommand):
+    help = (
+        "Varre a tabela de reservas em uma passada, ordenada por (sala, início), e aponta "
+        "sobreposições na mesma sala (RN-06), reservas fora do horário de funcionamento da "
+        "sala (RN-07) e acima da capacidade (RN-03). Com --plano, grava um plano de correção "
+        "em CSV (nada é alterado no banco)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--plano", default=None, help="Arquivo CSV para o plano de correção.")
+        parser.add_argument("--sala", type=int, default=None, help="Verifica só a sala com este id.")
+
+    def handle(self, *args, **options):
+        salas = {s.pk: s for s in Sala.objects.all()}
+        reservas = Reserva.objects.order_by("sala_id", "data_hora_inicio", "pk").values(
+            "pk", "sala_id", "usuario_id", "data_hora_inicio", "data_hora_fim",
+            "quantidade_pessoas", "check_in_realizado",
+        )
+        if options["sala"]:
+            reservas = reservas.filter(sala_id=options["sala"])
+
+        self.violacoes = {"RN-06": 0, "RN-07": 0, "RN-03": 0}
+        self.plano = {}  # pk -> ações da reserva, na ordem da varredura
+        sala_atual = None
+        ativas = []  # heap (fim, pk, reserva) de todas as reservas da sala que ainda não terminaram
+        mantidas = []  # idem, só as que o plano mantém
+        canceladas = set()
+        total = 0
+
+        # Com PostgreSQL, iterator() usa um cursor no servidor: a memória fica limitada
+        # ao lote e às reservas simultâneas de uma sala, qualquer que seja o tamanho da tabela
+        for reserva in reservas.iterator(chunk_size=TAMANHO_LOTE):
+            total += 1
+            if reserva["sala_id"] != sala_atual:
+                sala_atual, ativas, mantidas, canceladas = reserva["sala_id"], [], [], set()
+            sala = salas[reserva["sala_id"]]
+            inicio = reserva["data_hora_inicio"]
+
+            while ativas and ativas[0][0] <= inicio:
+                heapq.heappop(ativas)
+            for _, _, outra in ativas:
+                self._violacao("RN-06", sala, reserva, f"sobrepõe a reserva {outra['pk']}")
+            heapq.heappush(ativas, (reserva["data_hora_fim"], reserva["pk"], reserva))
+
+            # Cancelada por estar fora do horário, não disputa o horário com as outras (RN-06)
+            if self._verificar_horario(sala, reserva):
+                canceladas.add(reserva["pk"])
+            else:
+                self._planejar_sobreposicao(reserva, mantidas, canceladas)
+            if reserva["quantidade_pessoas"] > sala.capacidade:
+                self._violacao(
+                    "RN-03", sala, reserva,
+                    f"{reserva['quantidade_pessoas']} pessoas para capacidade {sala.capacidade}",
+                )
+                self._planejar("reduzir_pessoas", reserva["pk"], "RN-03", sala.capacidade)
+
+        resumo = ", ".join(f"{regra}: {n}" for regra, n in self.violacoes.items())
+        estilo = self.style.WARNING if any(self.violacoes.values()) else self.style.SUCCESS
+        self.stdout.write(estilo(f"{total} reservas verificadas — {resumo}"))
+        if options["plano"]:
+            with open(options["plano"], "w", encoding="utf-8", newline="") as arquivo:
+                escritor = csv.writer(arquivo)
+                escritor.writerow(["acao", "reserva", "regra", "detalhe"])
+                acoes = [acao for acoes_reserva in self.plano.values() for acao in acoes_reserva]
+                escritor.writerows(acoes)
+            self.stdout.write(f"Plano de correção com {len(acoes)} ações em {options['plano']}.")
+
+    def _violacao(self, regra, sala, reserva, detalhe):
+        self.violacoes[regra] += 1
+        inicio = timezone.localtime(reserva["data_hora_inicio"])
+        fim = timezone.localtime(reserva["data_hora_fim"])
+        self.stdout.write(
+            f"{regra} reserva {reserva['pk']} ({sala.nome}, {inicio:%d/%m/%Y %H:%M}–{fim:%H:%M}): {detalhe}"
+        )
+
+    def _planejar(self, acao, pk, regra, detalhe):
+        """Acrescenta uma ação ao plano; cancelar substitui as ações anteriores da reserva e encerra o plano dela."""
+        acoes = self.plano.setdefault(pk, [])
+        if acoes and acoes[0][0] == "cancelar":
+            return
+        if acao == "cancelar":
+            acoes.clear()
+        acoes.append((acao, pk, regra, detalhe))
+
+    def _verificar_horario(self, sala, reserva):
+        """RN-07; retorna se a reserva foi planejada para cancelamento por estar fora do horário."""
+        inicio = timezone.localtime(reserva["data_hora_inicio"])
+        fim = timezone.localtime(reserva["data_hora_fim"])
+        if inicio.date() != fim.date() or inicio.time() < sala.hora_inicio or fim.time() > sala.hora_fim:
+            self._violacao(
+                "RN-07", sala, reserva, f"fora do funcionamento ({sala.hora_inicio:%H:%M}–{sala.hora_fim:%H:%M})"
+            )
+            self._planejar("cancelar", reserva["pk"], "RN-07", "fora do horário da sala")
+            return True
+        return False
+
+    def _planejar_sobreposicao(self, reserva, mantidas, canceladas):
+        """Guloso na ordem da varredura: entre reservas em conflito, mantém a preferida e cancela as demais."""
+        inicio = reserva["data_hora_inicio"]
+        while mantidas and mantidas[0][0] <= inicio:
+            heapq.heappop(mantidas)
+        conflitos = [item for item in mantidas if item[2]["pk"] not in canceladas]
+        if not conflitos:
+            heapq.heappush(mantidas, (reserva["data_hora_fim"], reserva["pk"], reserva))
+            return
+        if all(_preferida(reserva, outra) is reserva for _, _, outra in conflitos):
+            for _, _, outra in conflitos:
+                canceladas.add(outra["pk"])
+                self._planejar("cancelar", outra["pk"], "RN-06", f"conflita com a reserva {reserva['pk']}")
+            heapq.heappush(mantidas, (reserva["data_hora_fim"], reserva["pk"], reserva))
+        else:
+            vencedora = next(outra for _, _, outra in conflitos if _preferida(reserva, outra) is outra)
+            canceladas.add(reserva["pk"])
+            self._planejar("cancelar", reserva["pk"], "RN-06", f"conflita com a reserva {vencedora['pk']}")
@@ -0,0 +1,79 @@
+"""RN-24 — aplicação de bloqueios de manutenção.
+
+Ao salvar um bloqueio ou mudar as suas salas (sinais em ``webapp.signals``,
+qualquer que seja a origem: admin, shell, comandos), as reservas sobrepostas
+que ainda não começaram são canceladas e cada usuário afetado recebe um só
+e-mail listando as suas reservas canceladas, enviado depois do commit.
+Reservas já em andamento (inclusive com check-in) são mantidas.
+
+A exclusão usa ``QuerySet.delete()``: os sinais de cada reserva invalidam os
+caches e publicam os eventos, como em qualquer cancelamento.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .auditoria import registrar
+from .models import Reserva
+
+
+def aplicar_bloqueio(bloqueio):
+    """
+    Cancela as reservas afetadas pelo bloqueio e agenda as notificações.
+    Retorna quantas foram canceladas e soma o número a
+    ``bloqueio.reservas_canceladas``, lido pelo admin para a mensagem.
+    """
+    with transaction.atomic(using=bloqueio._state.db):
+        reservas = bloqueio.reservas_afetadas()
+        canceladas = list(
+            reservas.values_list(
+                "pk", "sala_id", "sala__nome", "data_hora_inicio", "data_hora_fim",
+                "usuario__email", "usuario__first_name", "usuario__username", "usuario_id",
+                "quantidade_pessoas",
+            )
+        )
+        if not canceladas:
+            return 0
+        Reserva.objects.using(reservas.db).filter(pk__in=[linha[0] for linha in canceladas]).delete()
+
+        instancias = [
+            Reserva(
+                pk=pk, sala_id=sala_id, usuario_id=usuario_id, data_hora_inicio=inicio, data_hora_fim=fim,
+                quantidade_pessoas=pessoas,
+            )
+            for pk, sala_id, _, inicio, fim, *_, usuario_id, pessoas in canceladas
+        ]
+        registrar("cancelada", instancias, bloqueio.criado_por_id, origem="manutencao", bloqueio=bloqueio.pk)
+
+        mensagens = _mensagens_por_usuario(bloqueio, canceladas)
+        transaction.on_commit(lambda: send_mass_mail(mensagens, fail_silently=True))
+    bloqueio.reservas_canceladas = getattr(bloqueio, "reservas_canceladas", 0) + len(canceladas)
+    return len(canceladas)
+
+
+def _mensagens_por_usuario(bloqueio, canceladas):
+    """Uma mensagem por usuário com e-mail, listando todas as reservas canceladas dele."""
+    por_usuario = defaultdict(list)
+    nomes = {}
+    for _, _, sala_nome, inicio, fim, email, primeiro_nome, username, *_ in canceladas:
+        if not email:
+            continue
+        nomes[email] = primeiro_nome or username
+        por_usuario[email].append(
+            f"- {sala_nome}: {timezone.localtime(inicio):%d/%m/%Y %H:%M} a {timezone.localtime(fim):%H:%M}"
+        )
+
+    assunto = "Reservas canceladas por manutenção"
+    mensagens = []
+    for email, linhas in por_usuario.items():
+        corpo = (
+            f"Olá, {nomes[email]}.\n\n"
+            f"As reservas abaixo foram canceladas porque as salas estarão em manutenção "
+            f"({bloqueio.motivo}):\n\n" + "\n".join(linhas) + "\n"
+        )
+        mensagens.append((assunto, corpo, settings.DEFAULT_FROM_EMAIL, [email]))
+    return mensagens
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0007_reserva_check_in_realizado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueioManutencao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(verbose_name='Início')),
+                ('fim', models.DateTimeField(verbose_name='Término')),
+                ('motivo', models.CharField(max_length=255, verbose_name='Motivo')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('salas', models.ManyToManyField(related_name='bloqueios', to='webapp.sala', verbose_name='Salas')),
+            ],
+            options={
+                'verbose_name': 'Bloqueio de manutenção',
+                'verbose_name_plural': 'Bloqueios de manutenção',
+                'ordering': ['-inicio'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0008_bloqueiomanutencao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['sala', 'data_hora_inicio'], name='reserva_sala_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['usuario', 'data_hora_fim'], name='reserva_usuario_fim_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['data_hora_inicio'], name='reserva_inicio_idx'),
+        ),
+    ]
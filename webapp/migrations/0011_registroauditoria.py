@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:48
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0009_reserva_indices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroAuditoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reserva_id', models.BigIntegerField(verbose_name='Reserva')),
+                ('acao', models.CharField(choices=[('criada', 'Criada'), ('alterada', 'Alterada'), ('cancelada', 'Cancelada'), ('checkin', 'Check-in')], max_length=20, verbose_name='Ação')),
+                ('ocorrido_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ocorrido em')),
+                ('dados', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Dados')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Registro de auditoria',
+                'verbose_name_plural': 'Registros de auditoria',
+                'ordering': ['-ocorrido_em'],
+                'indexes': [models.Index(fields=['reserva_id', 'ocorrido_em'], name='auditoria_reserva_idx'), models.Index(fields=['usuario', 'ocorrido_em'], name='auditoria_usuario_idx')],
+            },
+        ),
+    ]
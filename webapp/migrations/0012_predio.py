@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0011_registroauditoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Predio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, unique=True, verbose_name='Nome do prédio')),
+                ('campus', models.CharField(blank=True, max_length=100, verbose_name='Campus')),
+            ],
+            options={
+                'verbose_name': 'Prédio',
+                'verbose_name_plural': 'Prédios',
+                'ordering': ['campus', 'nome'],
+            },
+        ),
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='predio_padrao',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='webapp.predio', verbose_name='Prédio padrão'),
+        ),
+        migrations.AddField(
+            model_name='sala',
+            name='predio',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='salas', to='webapp.predio', verbose_name='Prédio'),
+        ),
+        migrations.AddIndex(
+            model_name='sala',
+            index=models.Index(fields=['predio', 'nome'], name='sala_predio_nome_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0012_predio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='versao',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Versão'),
+        ),
+        migrations.AddField(
+            model_name='sala',
+            name='versao',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Versão'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0013_versao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaCalendario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True, verbose_name='Data')),
+                ('tipo', models.CharField(choices=[('letivo', 'Dia letivo'), ('feriado', 'Feriado'), ('recesso', 'Recesso')], max_length=10, verbose_name='Tipo')),
+                ('descricao', models.CharField(blank=True, max_length=255, verbose_name='Descrição')),
+            ],
+            options={
+                'verbose_name': 'Dia do calendário acadêmico',
+                'verbose_name_plural': 'Calendário acadêmico',
+                'ordering': ['data'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DisponibilidadeSala',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('minutos', models.PositiveIntegerField(verbose_name='Minutos disponíveis')),
+                ('sala', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='webapp.sala', verbose_name='Sala')),
+            ],
+            options={
+                'verbose_name': 'Disponibilidade de sala',
+                'verbose_name_plural': 'Disponibilidades de salas',
+                'constraints': [models.UniqueConstraint(fields=('sala', 'data'), name='disponibilidade_sala_data_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:28
+
+import datetime
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+def verificar_reservas_longas(apps, schema_editor):
+    """Recusa a migração, com os ids, se já houver reservas acima do máximo da RN-09."""
+    Reserva = apps.get_model("webapp", "Reserva")
+    longas = list(
+        Reserva.objects.using(schema_editor.connection.alias)
+        .filter(data_hora_fim__gt=models.F("data_hora_inicio") + datetime.timedelta(hours=4))
+        .values_list("pk", flat=True)[:20]
+    )
+    if longas:
+        raise ValueError(
+            "Reservas com mais de 4 horas (RN-09) impedem a constraint reserva_duracao_maxima; "
+            f"corrija-as antes de migrar: {longas}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0014_calendario_academico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_reservas_longas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.CheckConstraint(condition=models.Q(('data_hora_fim__lte', django.db.models.expressions.CombinedExpression(models.F('data_hora_inicio'), '+', models.Value(datetime.timedelta(seconds=14400))))), name='reserva_duracao_maxima'),
+        ),
+    ]
@@ -1,10 +1,87 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.utils import timezone
 
+from .routers import PRIMARIO
+
+
+class Predio(models.Model):
+    """Prédio (e campus) onde ficam as salas; delimita o que cada usuário vê nos painéis."""
+
+    nome = models.CharField("Nome do prédio", max_length=100, unique=True)
+    campus = models.CharField("Campus", max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = "Prédio"
+        verbose_name_plural = "Prédios"
+        ordering = ["campus", "nome"]
+
+    def __str__(self):
+        return f"{self.campus} — {self.nome}" if self.campus else self.nome
+
+
+class ModeloVersionado(models.Model):
+    """
+    Controle de concorrência otimista: ``versao`` avança a cada gravação da
+    linha. Formulários de edição guardam a versão lida e gravam com
+    ``salvar_se_versao``, que perde (retorna ``False``) se outra edição
+    gravou antes — sem travar a linha enquanto alguém preenche o formulário.
+    """
+
+    versao = models.PositiveIntegerField("Versão", default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        avancou_no_banco = False
+        if not self._state.adding:
+            if getattr(self, "_versao_reservada", None) is not None:
+                self.versao = self._versao_reservada
+            else:
+                # Gravação sem versão lida (admin, scripts): avança no próprio banco
+                self.versao = models.F("versao") + 1
+                avancou_no_banco = True
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "versao"}
+        super().save(*args, **kwargs)
+        if avancou_no_banco:
+            # Campo adiado: relido do banco só se alguém o consultar
+            del self.versao
 
-class Sala(models.Model):
+    def salvar_se_versao(self, versao_lida, campos=None):
+        """
+        Grava ``campos`` (todos, se ``None``) só se a linha ainda está em
+        ``versao_lida``. O ``UPDATE ... SET versao = n + 1 WHERE versao = n``
+        decide quem vence; o ``save()`` em seguida, na mesma transação curta,
+        grava os valores e dispara os sinais de sempre.
+        """
+        proxima = versao_lida + 1
+        with transaction.atomic(using=PRIMARIO):
+            venceu = type(self)._base_manager.using(PRIMARIO).filter(
+                pk=self.pk, versao=versao_lida,
+            ).update(versao=proxima)
+            if not venceu:
+                return False
+            self._versao_reservada = proxima
+            try:
+                self.save(using=PRIMARIO, update_fields=campos)
+            finally:
+                self._versao_reservada = None
+        return True
+
+
+class SalaQuerySet(models.QuerySet):
+    def do_predio(self, predio_id):
+        """Salas do prédio (índice ``sala_predio_nome_idx``); ``None`` mantém todas."""
+        return self if predio_id is None else self.filter(predio_id=predio_id)
+
+
+class Sala(ModeloVersionado):
     """Sala de aula com nome e faixa de horários em que fica disponível."""
 
     TIPO_CHOICES = [
@@ -19,11 +96,27 @@ class Sala(models.Model):
     capacidade = models.PositiveIntegerField("Capacidade máxima", default=30)
     hora_inicio = models.TimeField("Horário de início")
     hora_fim = models.TimeField("Horário de término")
+    predio = models.ForeignKey(
+        Predio,
+        on_delete=models.PROTECT,
+        related_name="salas",
+        null=True,
+        blank=True,
+        verbose_name="Prédio",
+        # Coberto pelo índice composto abaixo
+        db_index=False,
+    )
+
+    objects = SalaQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Sala"
         verbose_name_plural = "Salas"
         ordering = ["nome"]
+        indexes = [
+            # Salas de um prédio já na ordem das listagens
+            models.Index(fields=["predio", "nome"], name="sala_predio_nome_idx"),
+        ]
 
     def __str__(self):
         return self.nome
@@ -36,7 +129,79 @@ class Sala(models.Model):
             )
 
 
-class Reserva(models.Model):
+# Check-in permitido de 15 minutos antes até 15 minutos depois do início
+JANELA_CHECKIN = timedelta(minutes=15)
+# RN-09 — nenhuma reserva dura mais que isso
+DURACAO_MAXIMA = timedelta(hours=4)
+
+
+class ReservaQuerySet(models.QuerySet):
+    # As consultas abaixo limitam data_hora_inicio por baixo usando a duração
+    # máxima (RN-09). O limite não muda o resultado — a constraint
+    # reserva_duracao_maxima garante no banco que nenhuma reserva é mais
+    # longa —, mas permite ao PostgreSQL descartar as partições mensais
+    # antigas quando a tabela é particionada (veja webapp.particoes).
+
+    def sobrepostas(self, inicio, fim):
+        """Reservas que se sobrepõem ao intervalo ``[inicio, fim)``."""
+        return self.filter(
+            data_hora_inicio__lt=fim,
+            data_hora_fim__gt=inicio,
+            data_hora_inicio__gt=inicio - DURACAO_MAXIMA,
+        )
+
+    def sobrepostas_a_alguma(self, pedidos):
+        """Reservas que se sobrepõem a algum dos pedidos ``(sala_id, inicio, fim)``, em uma só consulta."""
+        filtro = models.Q()
+        for sala_id, inicio, fim in pedidos:
+            filtro |= models.Q(
+                sala_id=sala_id,
+                data_hora_inicio__lt=fim,
+                data_hora_fim__gt=inicio,
+                data_hora_inicio__gt=inicio - DURACAO_MAXIMA,
+            )
+        return self.filter(filtro) if pedidos else self.none()
+
+    def ativas(self, agora):
+        """Reservas que ainda não terminaram em ``agora`` (RN-10)."""
+        return self.filter(data_hora_fim__gt=agora, data_hora_inicio__gt=agora - DURACAO_MAXIMA)
+
+    def ocupando_sala(self, agora):
+        """Reservas em andamento em ``agora``.
+
+        RN-12: depois de 15 minutos do início sem check-in a sala é liberada.
+        """
+        return self.filter(
+            data_hora_inicio__lte=agora,
+            data_hora_fim__gte=agora,
+            data_hora_inicio__gte=agora - DURACAO_MAXIMA,
+        ).exclude(
+            data_hora_inicio__lte=agora - JANELA_CHECKIN,
+            check_in_realizado=False,
+        )
+
+    def em_janela_checkin(self, agora):
+        """Reservas ainda sem check-in cujo início está a no máximo 15 minutos de ``agora``."""
+        return self.filter(
+            check_in_realizado=False,
+            data_hora_inicio__gte=agora - JANELA_CHECKIN,
+            data_hora_inicio__lte=agora + JANELA_CHECKIN,
+        )
+
+    def do_predio(self, predio_id):
+        """Reservas das salas do prédio; ``None`` mantém todas."""
+        return self if predio_id is None else self.filter(sala__predio_id=predio_id)
+
+    def fazer_checkin(self, agora=None):
+        """Faz o check-in com um único UPDATE condicional e retorna o número de linhas afetadas.
+
+        A condição da janela fica no WHERE, então requisições simultâneas para a
+        mesma reserva não precisam de lock: só a primeira afeta a linha.
+        """
+        return self.em_janela_checkin(agora or timezone.now()).update(check_in_realizado=True)
+
+
+class Reserva(ModeloVersionado):
     """Reserva de uma sala em um período (define quando a sala está ocupada)."""
 
     sala = models.ForeignKey(Sala, on_delete=models.CASCADE, related_name="reservas")
@@ -52,27 +217,54 @@ class Reserva(models.Model):
     quantidade_pessoas = models.PositiveIntegerField("Quantidade de pessoas", default=1)
     check_in_realizado = models.BooleanField("Check-in realizado", default=False)
 
+    objects = ReservaQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Reserva"
         verbose_name_plural = "Reservas"
         ordering = ["-data_hora_inicio"]
+        indexes = [
+            # RN-06 e filtros por sala no admin/relatórios
+            models.Index(fields=["sala", "data_hora_inicio"], name="reserva_sala_inicio_idx"),
+            # RN-10: reservas ativas de um usuário
+            models.Index(fields=["usuario", "data_hora_fim"], name="reserva_usuario_fim_idx"),
+            # Ordenação padrão e faixas de período
+            models.Index(fields=["data_hora_inicio"], name="reserva_inicio_idx"),
+        ]
+        constraints = [
+            # RN-09 no banco, para qualquer caminho de gravação (admin, bulk_create, importação)
+            models.CheckConstraint(
+                condition=models.Q(data_hora_fim__lte=models.F("data_hora_inicio") + DURACAO_MAXIMA),
+                name="reserva_duracao_maxima",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.sala.nome} — {self.data_hora_inicio} a {self.data_hora_fim}"
         
     @property
     def pode_cancelar(self):
-        from datetime import timedelta
-        return timezone.now() <= self.data_hora_inicio - timedelta(hours=1)
+        return self.pode_cancelar_em(timezone.now())
         
     @property
     def pode_fazer_checkin(self):
+        return self.pode_fazer_checkin_em(timezone.now())
+
+    def pode_cancelar_em(self, agora):
+        """RN-11 avaliada em um instante já conhecido (evita um timezone.now() por linha)."""
         from datetime import timedelta
-        now = timezone.now()
-        # Permite check-in de 15 minutos antes até 15 minutos depois do início
-        start_window = self.data_hora_inicio - timedelta(minutes=15)
-        end_window = self.data_hora_inicio + timedelta(minutes=15)
-        return not self.check_in_realizado and start_window <= now <= end_window
+        return agora <= self.data_hora_inicio - timedelta(hours=1)
+
+    def pode_fazer_checkin_em(self, agora):
+        # Mesma janela de ReservaQuerySet.em_janela_checkin
+        start_window = self.data_hora_inicio - JANELA_CHECKIN
+        end_window = self.data_hora_inicio + JANELA_CHECKIN
+        return not self.check_in_realizado and start_window <= agora <= end_window
+
+    def validate_constraints(self, exclude=None):
+        # reserva_duracao_maxima é a RN-09, já verificada em clean() sem ir ao banco
+        exclude = {*(exclude or ()), "data_hora_inicio", "data_hora_fim"}
+        super().validate_constraints(exclude=exclude)
 
     def clean(self):
         super().clean()
@@ -102,7 +294,7 @@ class Reserva(models.Model):
                 raise ValidationError(
                     {"data_hora_fim": "A reserva deve ter duração mínima de 30 minutos."}
                 )
-            if duracao > timedelta(hours=4):
+            if duracao > DURACAO_MAXIMA:
                 raise ValidationError(
                     {"data_hora_fim": "A reserva não pode ter duração superior a 4 horas."}
                 )
@@ -117,17 +309,22 @@ class Reserva(models.Model):
             pass
         # RN-06 — não é permitido fazer reservas sobrepostas para a mesma sala
         if self.sala_id and self.data_hora_inicio and self.data_hora_fim:
-            conflitos = Reserva.objects.filter(
-                sala=self.sala_id,
-                data_hora_inicio__lt=self.data_hora_fim,
-                data_hora_fim__gt=self.data_hora_inicio,
-            )
+            conflitos = Reserva.objects.using(PRIMARIO).sobrepostas(
+                self.data_hora_inicio, self.data_hora_fim
+            ).filter(sala=self.sala_id)
             if self.pk:
                 conflitos = conflitos.exclude(pk=self.pk)
             if conflitos.exists():
                 raise ValidationError(
                     "Já existe uma reserva para esta sala nesse período. Escolha outro horário."
                 )
+        # RN-24 — a sala não pode estar bloqueada para manutenção no período
+        if self.sala_id and self.data_hora_inicio and self.data_hora_fim:
+            bloqueio = BloqueioManutencao.objects.using(PRIMARIO).sobrepostos(
+                self.data_hora_inicio, self.data_hora_fim
+            ).filter(salas=self.sala_id).first()
+            if bloqueio:
+                raise ValidationError(bloqueio.mensagem_conflito())
         # RN-07 — reserva deve estar dentro do horário de disponibilidade da sala
         try:
             if self.sala and self.data_hora_inicio and self.data_hora_fim:
@@ -146,9 +343,8 @@ class Reserva(models.Model):
         # RN-10 — um usuário não pode ter mais de 3 reservas ativas simultaneamente
         MAX_RESERVAS_ATIVAS = 3
         if self.usuario_id and self.data_hora_fim:
-            reservas_ativas = Reserva.objects.filter(
+            reservas_ativas = Reserva.objects.using(PRIMARIO).ativas(timezone.now()).filter(
                 usuario=self.usuario_id,
-                data_hora_fim__gt=timezone.now(),
             )
             if self.pk:
                 reservas_ativas = reservas_ativas.exclude(pk=self.pk)
@@ -159,6 +355,188 @@ class Reserva(models.Model):
                 )
 
 
+class BloqueioManutencaoQuerySet(models.QuerySet):
+    def sobrepostos(self, inicio, fim):
+        return self.filter(inicio__lt=fim, fim__gt=inicio)
+
+
+class BloqueioManutencao(models.Model):
+    """RN-24 — período em que uma ou mais salas ficam fechadas para manutenção."""
+
+    salas = models.ManyToManyField(Sala, related_name="bloqueios", verbose_name="Salas")
+    inicio = models.DateTimeField("Início")
+    fim = models.DateTimeField("Término")
+    motivo = models.CharField("Motivo", max_length=255)
+    criado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        verbose_name="Criado por",
+    )
+    criado_em = models.DateTimeField("Criado em", auto_now_add=True)
+
+    objects = BloqueioManutencaoQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Bloqueio de manutenção"
+        verbose_name_plural = "Bloqueios de manutenção"
+        ordering = ["-inicio"]
+
+    def __str__(self):
+        return f"{self.motivo} — {self.inicio} a {self.fim}"
+
+    def clean(self):
+        super().clean()
+        if self.inicio and self.fim and self.fim <= self.inicio:
+            raise ValidationError({"fim": "O término do bloqueio deve ser posterior ao início."})
+
+    def mensagem_conflito(self):
+        inicio = timezone.localtime(self.inicio).strftime("%d/%m/%Y %H:%M")
+        fim = timezone.localtime(self.fim).strftime("%d/%m/%Y %H:%M")
+        return f"A sala está bloqueada para manutenção de {inicio} a {fim} ({self.motivo})."
+
+    def _reservas_sobrepostas(self, agora):
+        return Reserva.objects.using(PRIMARIO).sobrepostas(max(self.inicio, agora), self.fim).filter(
+            sala__in=self.salas.through.objects.filter(bloqueiomanutencao=self).values("sala_id"),
+        )
+
+    def reservas_afetadas(self, agora=None):
+        """Reservas das salas bloqueadas que se sobrepõem ao bloqueio e ainda não começaram."""
+        agora = agora or timezone.now()
+        return self._reservas_sobrepostas(agora).filter(data_hora_inicio__gt=agora)
+
+    def reservas_em_andamento(self, agora=None):
+        """Reservas sobrepostas ao bloqueio já iniciadas; não são canceladas."""
+        agora = agora or timezone.now()
+        return self._reservas_sobrepostas(agora).filter(data_hora_inicio__lte=agora)
+
+
+class DiaCalendarioQuerySet(models.QuerySet):
+    def dias_letivos(self, data_inicio, data_fim):
+        """Conjunto dos dias letivos entre as datas (inclusivas), com o calendário lido em uma consulta."""
+        excecoes = dict(self.filter(data__range=(data_inicio, data_fim)).values_list("data", "tipo"))
+        letivos = set()
+        for i in range((data_fim - data_inicio).days + 1):
+            dia = data_inicio + timedelta(days=i)
+            padrao = "letivo" if dia.weekday() in settings.DIAS_SEMANA_LETIVOS else None
+            if excecoes.get(dia, padrao) == "letivo":
+                letivos.add(dia)
+        return letivos
+
+
+class DiaCalendario(models.Model):
+    """
+    Dia do calendário acadêmico. Só os dias que fogem da regra precisam ser
+    cadastrados: sem registro, valem como letivos os dias da semana em
+    ``DIAS_SEMANA_LETIVOS`` (um sábado de reposição entra como ``letivo``).
+    """
+
+    TIPO_CHOICES = [
+        ("letivo", "Dia letivo"),
+        ("feriado", "Feriado"),
+        ("recesso", "Recesso"),
+    ]
+
+    data = models.DateField("Data", unique=True)
+    tipo = models.CharField("Tipo", max_length=10, choices=TIPO_CHOICES)
+    descricao = models.CharField("Descrição", max_length=255, blank=True)
+
+    objects = DiaCalendarioQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Dia do calendário acadêmico"
+        verbose_name_plural = "Calendário acadêmico"
+        ordering = ["data"]
+
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y} — {self.descricao or self.get_tipo_display()}"
+
+    @property
+    def letivo(self):
+        return self.tipo == "letivo"
+
+
+class DisponibilidadeSala(models.Model):
+    """
+    Minutos em que a sala está disponível em cada dia: o horário de
+    funcionamento nos dias letivos, menos os bloqueios de manutenção (RN-24);
+    zero em feriados, recessos e fins de semana. É o denominador das taxas de
+    ocupação (RN-19/RN-20), mantido por ``webapp.calendario_academico``.
+    """
+
+    sala = models.ForeignKey(
+        Sala, on_delete=models.CASCADE, related_name="+", db_index=False, verbose_name="Sala"
+    )
+    data = models.DateField("Data")
+    minutos = models.PositiveIntegerField("Minutos disponíveis")
+
+    class Meta:
+        verbose_name = "Disponibilidade de sala"
+        verbose_name_plural = "Disponibilidades de salas"
+        constraints = [
+            # Também é o índice da soma por sala e período
+            models.UniqueConstraint(fields=["sala", "data"], name="disponibilidade_sala_data_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.sala_id} em {self.data:%d/%m/%Y}: {self.minutos} min"
+
+
+class RegistroAuditoriaQuerySet(models.QuerySet):
+    def da_reserva(self, reserva_id):
+        """Histórico de uma reserva, do mais recente ao mais antigo (índice ``auditoria_reserva_idx``)."""
+        return self.filter(reserva_id=reserva_id).order_by("-ocorrido_em", "-pk")
+
+    def do_usuario(self, usuario):
+        """Ações feitas por um usuário, da mais recente à mais antiga (índice ``auditoria_usuario_idx``)."""
+        return self.filter(usuario=usuario).order_by("-ocorrido_em", "-pk")
+
+
+class RegistroAuditoria(models.Model):
+    """Quem criou, alterou, cancelou ou fez check-in de cada reserva. Só recebe inserções.
+
+    ``reserva_id`` não é chave estrangeira: a tabela de reservas pode ser particionada
+    no PostgreSQL e o histórico precisa sobreviver ao cancelamento da reserva.
+    Os registros são gravados em lote por ``webapp.auditoria``.
+    """
+
+    ACAO_CHOICES = [
+        ("criada", "Criada"),
+        ("alterada", "Alterada"),
+        ("cancelada", "Cancelada"),
+        ("checkin", "Check-in"),
+    ]
+
+    reserva_id = models.BigIntegerField("Reserva")
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        verbose_name="Usuário",
+    )
+    acao = models.CharField("Ação", max_length=20, choices=ACAO_CHOICES)
+    ocorrido_em = models.DateTimeField("Ocorrido em", default=timezone.now)
+    dados = models.JSONField("Dados", default=dict, blank=True, encoder=DjangoJSONEncoder)
+
+    objects = RegistroAuditoriaQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Registro de auditoria"
+        verbose_name_plural = "Registros de auditoria"
+        ordering = ["-ocorrido_em"]
+        indexes = [
+            models.Index(fields=["reserva_id", "ocorrido_em"], name="auditoria_reserva_idx"),
+            models.Index(fields=["usuario", "ocorrido_em"], name="auditoria_usuario_idx"),
+        ]
+
+    def __str__(self):
+        return f"Reserva {self.reserva_id} {self.get_acao_display().lower()} em {self.ocorrido_em}"
+
+
 class PerfilUsuario(models.Model):
     """Informações adicionais do usuário cadastradas no fluxo de registro."""
 
@@ -170,6 +548,14 @@ class PerfilUsuario(models.Model):
     )
     nome_completo = models.CharField("Nome completo", max_length=255)
     endereco = models.CharField("Endereço", max_length=255, blank=True)
+    predio_padrao = models.ForeignKey(
+        Predio,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        verbose_name="Prédio padrão",
+    )
 
     class Meta:
         verbose_name = "Perfil de usuário"
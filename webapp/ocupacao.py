@@ -0,0 +1,203 @@
+"""Mapa de calor de ocupação: tipo de sala × dia da semana × hora do dia.
+
+As reservas do período são carregadas em uma única consulta e convertidas em
+vetores de minutos; a sobreposição com cada célula é calculada com NumPy
+(vetores de diferenças + soma acumulada), sem laços por reserva. Os minutos
+ocupados são recortados ao horário de funcionamento da sala e aos dias
+letivos, o mesmo critério do denominador.
+
+Também reúne os auxiliares que leem os bloqueios de manutenção (RN-24),
+descontados do tempo disponível das salas em todas as taxas de ocupação.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models.functions import ExtractHour, ExtractMinute
+from django.utils import timezone
+
+from .cache import versao_reservas
+from .models import BloqueioManutencao, DiaCalendario, Reserva, Sala
+
+MINUTOS_DIA = 24 * 60
+NUM_CELULAS = 7 * 24
+MAX_DIAS_MAPA = 366
+MAPA_CACHE_TIMEOUT = 300  # segundos
+
+DIAS_SEMANA = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _minutos_sql(campo):
+    """``_minutos`` calculado no banco, para um campo de hora."""
+    return ExtractHour(campo) * 60 + ExtractMinute(campo)
+
+
+def _minutos_desde(base, datas):
+    """Minutos inteiros de ``base`` até cada datetime de ``datas``, em um vetor."""
+    segundos = np.fromiter(map(datetime.timestamp, datas), dtype=np.float64, count=len(datas))
+    return ((segundos - base.timestamp()) // 60).astype(np.int64)
+
+
+def bloqueios_por_sala(inicio, fim, sala_ids=None):
+    """
+    Intervalos de bloqueio (RN-24) de cada sala recortados a ``[inicio, fim)``,
+    em uma única consulta: ``{sala_id: [(inicio, fim), ...]}``.
+    """
+    linhas = BloqueioManutencao.salas.through.objects.filter(
+        bloqueiomanutencao__inicio__lt=fim,
+        bloqueiomanutencao__fim__gt=inicio,
+    )
+    if sala_ids is not None:
+        linhas = linhas.filter(sala_id__in=sala_ids)
+    intervalos = defaultdict(list)
+    for sala_id, bloqueio_inicio, bloqueio_fim in linhas.values_list(
+        "sala_id", "bloqueiomanutencao__inicio", "bloqueiomanutencao__fim"
+    ):
+        intervalos[sala_id].append((max(bloqueio_inicio, inicio), min(bloqueio_fim, fim)))
+    return intervalos
+
+
+def mesclar_intervalos(intervalos):
+    """Une intervalos sobrepostos para que um minuto bloqueado duas vezes conte uma vez."""
+    mesclados = []
+    for inicio, fim in sorted(intervalos):
+        if mesclados and inicio <= mesclados[-1][1]:
+            mesclados[-1][1] = max(mesclados[-1][1], fim)
+        else:
+            mesclados.append([inicio, fim])
+    return mesclados
+
+
+def _grade_de_minutos(data_inicio, num_dias, letivos):
+    """
+    Para cada minuto decorrido desde ``inicio`` retorna a célula (dia da
+    semana × hora), o minuto do dia no horário local e se o dia está em
+    ``letivos``. O laço é por dia, não por reserva, e mantém as horas
+    corretas em dias com mudança de fuso.
+    """
+    celulas, minutos_do_dia, dia_letivo = [], [], []
+    for i in range(num_dias):
+        dia = data_inicio + timedelta(days=i)
+        meia_noite = timezone.make_aware(datetime.combine(dia, time.min))
+        proxima = timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+        duracao = int((proxima - meia_noite).total_seconds() // 60)
+        minuto_local = np.minimum(np.arange(duracao), MINUTOS_DIA - 1)
+        minutos_do_dia.append(minuto_local)
+        celulas.append(dia.weekday() * 24 + minuto_local // 60)
+        dia_letivo.append(np.full(duracao, dia in letivos))
+    return np.concatenate(celulas), np.concatenate(minutos_do_dia), np.concatenate(dia_letivo)
+
+
+def calcular_mapa_calor(data_inicio, data_fim, predio_id=None):
+    """
+    Percentual de ocupação por tipo de sala, dia da semana e hora, entre
+    ``data_inicio`` e ``data_fim`` (datas inclusivas), nas salas do prédio
+    ``predio_id`` (ou de todos).
+
+    O denominador é o tempo em que as salas de cada tipo estão abertas
+    (``hora_inicio``/``hora_fim``) nos dias letivos do calendário acadêmico
+    de cada célula do período, menos os bloqueios de manutenção (RN-24) —
+    o mesmo critério das taxas de ocupação do painel.
+    """
+    chave = (
+        f"mapa-calor:{versao_reservas(predio_id)}:{predio_id or ''}:"
+        f"{data_inicio.isoformat()}:{data_fim.isoformat()}"
+    )
+    mapa = cache.get(chave)
+    if mapa is not None:
+        return mapa
+
+    num_dias = (data_fim - data_inicio).days + 1
+    inicio = timezone.make_aware(datetime.combine(data_inicio, time.min))
+    fim = timezone.make_aware(datetime.combine(data_fim + timedelta(days=1), time.min))
+    letivos = DiaCalendario.objects.dias_letivos(data_inicio, data_fim)
+    celula_por_minuto, minuto_do_dia, dia_letivo = _grade_de_minutos(data_inicio, num_dias, letivos)
+    total_minutos = len(celula_por_minuto)
+
+    tipos = [codigo for codigo, _ in Sala.TIPO_CHOICES]
+    indice_tipo = {codigo: i for i, codigo in enumerate(tipos)}
+
+    # Denominador: salas abertas de cada tipo em cada minuto do dia
+    abertas = np.zeros((len(tipos), MINUTOS_DIA + 1), dtype=np.int64)
+    salas = Sala.objects.do_predio(predio_id)
+    for tipo, hora_inicio, hora_fim in salas.values_list("tipo", "hora_inicio", "hora_fim"):
+        abertas[indice_tipo[tipo], _minutos(hora_inicio)] += 1
+        abertas[indice_tipo[tipo], _minutos(hora_fim)] -= 1
+    abertas = np.cumsum(abertas, axis=1)[:, :MINUTOS_DIA]
+
+    # RN-24: minutos de funcionamento perdidos para bloqueios, por tipo e célula
+    bloqueados = np.zeros((len(tipos), NUM_CELULAS))
+    salas_bloqueadas = bloqueios_por_sala(inicio, fim, None if predio_id is None else salas.values("pk"))
+    if salas_bloqueadas:
+        for pk, tipo, hora_inicio, hora_fim in salas.filter(pk__in=salas_bloqueadas).values_list(
+            "pk", "tipo", "hora_inicio", "hora_fim"
+        ):
+            aberta = dia_letivo & (minuto_do_dia >= _minutos(hora_inicio)) & (minuto_do_dia < _minutos(hora_fim))
+            for bloqueio_inicio, bloqueio_fim in mesclar_intervalos(salas_bloqueadas[pk]):
+                de = int((bloqueio_inicio - inicio).total_seconds() // 60)
+                ate = int((bloqueio_fim - inicio).total_seconds() // 60)
+                bloqueados[indice_tipo[tipo]] += np.bincount(
+                    celula_por_minuto[de:ate], weights=aberta[de:ate], minlength=NUM_CELULAS
+                )
+
+    # Numerador: reservas de cada tipo ocupando cada minuto do período, só nos
+    # minutos em que a sala da reserva está aberta em dia letivo. As reservas são
+    # agrupadas por (tipo, abertura, encerramento) da sala; o laço é por grupo.
+    linhas = list(
+        Reserva.objects.sobrepostas(inicio, fim).do_predio(predio_id)
+        .values_list(
+            "sala__tipo", _minutos_sql("sala__hora_inicio"), _minutos_sql("sala__hora_fim"),
+            "data_hora_inicio", "data_hora_fim",
+        )
+    )
+    ocupadas = np.zeros((len(tipos), total_minutos))
+    if linhas:
+        tipo_reserva, aberturas, encerramentos, inicios, fins = zip(*linhas)
+        codigos, tipo_local = np.unique(np.array(tipo_reserva), return_inverse=True)
+        idx_tipo = np.array([indice_tipo[codigo] for codigo in codigos], dtype=np.int64)[tipo_local]
+        chave = (idx_tipo * (MINUTOS_DIA + 1) + np.array(aberturas)) * (MINUTOS_DIA + 1) + np.array(encerramentos)
+        grupos, grupo_da_reserva = np.unique(chave, return_inverse=True)
+        idx_inicio = np.clip(_minutos_desde(inicio, inicios), 0, total_minutos)
+        idx_fim = np.clip(_minutos_desde(inicio, fins), 0, total_minutos)
+        for g, chave_grupo in enumerate(grupos.tolist()):
+            resto, encerramento = divmod(chave_grupo, MINUTOS_DIA + 1)
+            t, abertura = divmod(resto, MINUTOS_DIA + 1)
+            do_grupo = grupo_da_reserva == g
+            diferencas = (
+                np.bincount(idx_inicio[do_grupo], minlength=total_minutos + 1)
+                - np.bincount(idx_fim[do_grupo], minlength=total_minutos + 1)
+            )
+            aberta = dia_letivo & (minuto_do_dia >= abertura) & (minuto_do_dia < encerramento)
+            ocupadas[t] += np.cumsum(diferencas)[:total_minutos] * aberta
+
+    resultado = {}
+    for codigo, nome in Sala.TIPO_CHOICES:
+        t = indice_tipo[codigo]
+        minutos_ocupados = np.bincount(celula_por_minuto, weights=ocupadas[t], minlength=NUM_CELULAS)
+        minutos_disponiveis = np.bincount(
+            celula_por_minuto, weights=abertas[t][minuto_do_dia] * dia_letivo, minlength=NUM_CELULAS
+        ) - bloqueados[t]
+        taxa = np.divide(
+            minutos_ocupados * 100,
+            minutos_disponiveis,
+            out=np.zeros(NUM_CELULAS),
+            where=minutos_disponiveis > 0,
+        )
+        taxa = np.round(taxa, 1).reshape(7, 24)
+        resultado[codigo] = {"nome": nome, "ocupacao": taxa.tolist()}
+
+    mapa = {
+        "data_inicio": data_inicio.isoformat(),
+        "data_fim": data_fim.isoformat(),
+        "dias_da_semana": DIAS_SEMANA,
+        "horas": list(range(24)),
+        "tipos": resultado,
+    }
+    cache.set(chave, mapa, MAPA_CACHE_TIMEOUT)
+    return mapa
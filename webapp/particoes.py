@@ -0,0 +1,168 @@
+"""Partições mensais da tabela de reservas no PostgreSQL (opcional).
+
+``converter_tabela`` transforma ``webapp_reserva`` em uma tabela
+particionada por faixa de ``data_hora_inicio``, com uma partição por mês
+(limites em UTC) e uma partição padrão para o que cair fora delas. A
+conversão não roda nas migrações: só com ``gerenciar_particoes --converter``,
+depois de validada em um PostgreSQL de homologação com a suíte completa
+(``ParticoesPostgresTest`` só roda nesse banco).
+
+Consequências da conversão, a pesar antes de usá-la:
+
+* a chave primária no banco passa a ser ``(id, data_hora_inicio)`` — para o
+  Django ``id`` continua sendo a chave, única pela sequência, mas um
+  ``get``/``update``/``delete`` só por pk consulta todas as partições;
+* nenhuma FK com constraint no banco pode apontar para ``Reserva``;
+* só as consultas com limite em ``data_hora_inicio`` descartam partições.
+
+Depois de convertida, o comando cria as partições dos próximos meses e
+destaca as antigas, que ficam como tabelas de arquivo independentes. Em
+outros bancos (SQLite no modo local) a tabela continua comum.
+"""
+
+import re
+from datetime import date
+
+from django.utils import timezone
+
+TABELA = "webapp_reserva"
+PARTICAO_PADRAO = "webapp_reserva_padrao"
+_NOME_PARTICAO = re.compile(r"^webapp_reserva_p(\d{4})_(\d{2})$")
+
+
+def suporta_particoes(connection):
+    return connection.vendor == "postgresql"
+
+
+def tabela_particionada(cursor):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [TABELA])
+    return cursor.fetchone()[0]
+
+
+def inicio_do_mes(dia):
+    return date(dia.year, dia.month, 1)
+
+
+def somar_meses(mes, quantidade):
+    indice = mes.year * 12 + mes.month - 1 + quantidade
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(mes):
+    return f"{TABELA}_p{mes:%Y_%m}"
+
+
+def _limite(mes):
+    return f"'{mes.isoformat()} 00:00:00+00'"
+
+
+def particoes_mensais(cursor):
+    """Meses com partição anexada, em ordem: ``{mes: nome_da_tabela}``."""
+    cursor.execute(
+        """
+        SELECT filha.relname
+        FROM pg_inherits
+        JOIN pg_class filha ON filha.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = %s::regclass
+        """,
+        [TABELA],
+    )
+    meses = {}
+    for (nome,) in cursor.fetchall():
+        encontrado = _NOME_PARTICAO.match(nome)
+        if encontrado:
+            meses[date(int(encontrado[1]), int(encontrado[2]), 1)] = nome
+    return dict(sorted(meses.items()))
+
+
+def criar_particao(cursor, mes):
+    """
+    Cria e anexa a partição do mês. Linhas do mês que tenham caído na
+    partição padrão são movidas antes, senão o ATTACH seria recusado.
+    """
+    nome = nome_particao(mes)
+    de, ate = _limite(mes), _limite(somar_meses(mes, 1))
+    faixa = f"data_hora_inicio >= {de} AND data_hora_inicio < {ate}"
+    cursor.execute(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"INSERT INTO {nome} SELECT * FROM {PARTICAO_PADRAO} WHERE {faixa}")
+    cursor.execute(f"DELETE FROM {PARTICAO_PADRAO} WHERE {faixa}")
+    # O ATTACH cria nas partições os índices, a chave primária e as FKs da tabela mãe
+    cursor.execute(f"ALTER TABLE {TABELA} ATTACH PARTITION {nome} FOR VALUES FROM ({de}) TO ({ate})")
+    return nome
+
+
+def destacar_particao(cursor, nome, apagar=False):
+    """Tira a partição da tabela de reservas; ela continua existindo como arquivo, a menos que ``apagar``."""
+    cursor.execute(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}")
+    if apagar:
+        cursor.execute(f"DROP TABLE {nome}")
+
+
+def _indices_e_fks(cursor):
+    cursor.execute(
+        """
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+          AND indexname NOT IN (
+              SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u')
+          )
+        """,
+        [TABELA, TABELA],
+    )
+    # Índices de tabela particionada aparecem como "ON ONLY"; recriados, valem para todas as partições
+    indices = [definicao.replace(" ON ONLY ", " ON ") for (definicao,) in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [TABELA],
+    )
+    return indices, cursor.fetchall()
+
+
+def converter_tabela(connection, particionada=True, meses_futuros=3):
+    """
+    Recria ``webapp_reserva`` como tabela particionada (ou de volta como
+    tabela comum) copiando os dados; índices e FKs são recriados com os
+    mesmos nomes. Deve rodar dentro de uma transação.
+    """
+    antiga = f"{TABELA}_antiga"
+    with connection.cursor() as cursor:
+        indices, fks = _indices_e_fks(cursor)
+        cursor.execute(f"SELECT min(data_hora_inicio), max(id) FROM {TABELA}")
+        primeiro_inicio, maior_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {TABELA} RENAME TO {antiga}")
+        particionamento = " PARTITION BY RANGE (data_hora_inicio)" if particionada else ""
+        cursor.execute(f"CREATE TABLE {TABELA} (LIKE {antiga} INCLUDING CONSTRAINTS){particionamento}")
+
+        if particionada:
+            cursor.execute(f"CREATE TABLE {PARTICAO_PADRAO} PARTITION OF {TABELA} DEFAULT")
+            mes_atual = inicio_do_mes(timezone.now().date())
+            mes = min(inicio_do_mes(primeiro_inicio.date()), mes_atual) if primeiro_inicio else mes_atual
+            while mes <= somar_meses(mes_atual, meses_futuros):
+                seguinte = somar_meses(mes, 1)
+                cursor.execute(
+                    f"CREATE TABLE {nome_particao(mes)} PARTITION OF {TABELA} "
+                    f"FOR VALUES FROM ('{mes.isoformat()} 00:00:00+00') TO ('{seguinte.isoformat()} 00:00:00+00')"
+                )
+                mes = seguinte
+
+        cursor.execute(f"INSERT INTO {TABELA} SELECT * FROM {antiga}")
+        # Leva junto a sequência/identidade, os índices e as FKs antigas, liberando os nomes
+        cursor.execute(f"DROP TABLE {antiga}")
+
+        if particionada:
+            cursor.execute(f"ALTER TABLE {TABELA} ADD PRIMARY KEY (id, data_hora_inicio)")
+            cursor.execute(f"CREATE SEQUENCE {TABELA}_id_seq OWNED BY {TABELA}.id")
+            cursor.execute(f"ALTER TABLE {TABELA} ALTER COLUMN id SET DEFAULT nextval('{TABELA}_id_seq')")
+        else:
+            cursor.execute(f"ALTER TABLE {TABELA} ADD PRIMARY KEY (id)")
+            cursor.execute(f"ALTER TABLE {TABELA} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, %s)",
+            [TABELA, maior_id or 1, maior_id is not None],
+        )
+
+        for definicao in indices:
+            cursor.execute(definicao)
+        for nome, definicao in fks:
+            cursor.execute(f"ALTER TABLE {TABELA} ADD CONSTRAINT {nome} {definicao}")
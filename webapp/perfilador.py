@@ -0,0 +1,156 @@
+"""Perfilador sob demanda para a equipe (staff).
+
+Uma requisição de um usuário staff com ``?_perfil=1`` (ou com o cabeçalho
+``X-Perfilar: 1``, se ``PERFILADOR_CABECALHO`` estiver ativo) roda sob o
+cProfile. A resposta é trocada por um relatório em texto com a árvore de
+chamadas e o SQL executado, com o tempo de cada consulta. Os perfis das
+``PERFILADOR_MAX_REGISTROS`` requisições mais lentas ficam em
+``PERFILADOR_DIR`` como JSON, para análise posterior.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+PARAMETRO = "_perfil"
+CABECALHO = "X-Perfilar"
+PROFUNDIDADE_MAXIMA = 25
+# Ramos da árvore abaixo desta fração do tempo total são omitidos
+FRACAO_MINIMA = 0.01
+
+
+def _consultas_medidas(consultas):
+    """``execute_wrapper`` que guarda o SQL e o tempo de cada consulta."""
+
+    def medir(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            consultas.append({
+                "banco": context["connection"].alias,
+                "sql": sql,
+                "duracao_ms": round((time.perf_counter() - inicio) * 1000, 2),
+            })
+
+    return medir
+
+
+def _nome(funcao):
+    arquivo, linha, nome = funcao
+    return f"{nome} ({os.path.relpath(arquivo) if arquivo.startswith(os.sep) else arquivo}:{linha})"
+
+
+def arvore_de_chamadas(perfil):
+    """Árvore de chamadas em texto, do ponto de entrada para baixo, com tempo acumulado por ramo."""
+    estatisticas = pstats.Stats(perfil).stats
+    chamados = {}
+    for funcao, (_, _, _, _, chamadores) in estatisticas.items():
+        for chamador, (_, _, _, acumulado) in chamadores.items():
+            chamados.setdefault(chamador, []).append((acumulado, funcao))
+    raizes = [f for f, (_, _, _, _, chamadores) in estatisticas.items() if not chamadores]
+    total = sum(estatisticas[f][3] for f in raizes) or 1e-9
+
+    linhas = []
+
+    def visitar(funcao, acumulado, profundidade, caminho):
+        linhas.append(
+            f"{'  ' * profundidade}{acumulado * 1000:9.1f} ms {acumulado / total:6.1%}  {_nome(funcao)}"
+        )
+        if profundidade >= PROFUNDIDADE_MAXIMA:
+            return
+        for tempo, filho in sorted(chamados.get(funcao, []), reverse=True):
+            if tempo / total >= FRACAO_MINIMA and filho not in caminho:
+                visitar(filho, tempo, profundidade + 1, caminho | {filho})
+
+    for raiz in sorted(raizes, key=lambda f: estatisticas[f][3], reverse=True):
+        visitar(raiz, estatisticas[raiz][3], 0, {raiz})
+    return "\n".join(linhas)
+
+
+def _relatorio_texto(registro):
+    saida = io.StringIO()
+    saida.write(
+        f"{registro['metodo']} {registro['caminho']} — {registro['duracao_ms']:.1f} ms, "
+        f"{len(registro['sql'])} consultas SQL ({registro['sql_ms']:.1f} ms), status {registro['status']}\n\n"
+    )
+    saida.write("Árvore de chamadas (tempo acumulado)\n\n")
+    saida.write(registro["arvore"])
+    saida.write("\n\nSQL\n\n")
+    for i, consulta in enumerate(registro["sql"], 1):
+        saida.write(f"{i:4d}. {consulta['duracao_ms']:8.2f} ms [{consulta['banco']}] {consulta['sql']}\n")
+    saida.write("\nFunções por tempo próprio\n\n")
+    saida.write(registro["funcoes"])
+    return saida.getvalue()
+
+
+def _guardar(registro):
+    """Grava o perfil e mantém só os PERFILADOR_MAX_REGISTROS mais lentos no diretório."""
+    diretorio = settings.PERFILADOR_DIR
+    os.makedirs(diretorio, exist_ok=True)
+    # O nome começa pela duração, então ordenar os nomes ordena pelos mais lentos
+    nome = f"{int(registro['duracao_ms']):09d}-{datetime.now():%Y%m%d%H%M%S%f}.json"
+    with open(os.path.join(diretorio, nome), "w", encoding="utf-8") as arquivo:
+        json.dump(registro, arquivo, ensure_ascii=False, indent=1)
+    perfis = sorted(n for n in os.listdir(diretorio) if n.endswith(".json"))
+    for antigo in perfis[: -settings.PERFILADOR_MAX_REGISTROS]:
+        try:
+            os.remove(os.path.join(diretorio, antigo))
+        except FileNotFoundError:
+            # Outro worker, podando ao mesmo tempo, já o removeu
+            pass
+
+
+class PerfiladorMiddleware:
+    """Deve vir depois do AuthenticationMiddleware (só perfila usuários staff)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _solicitado(self, request):
+        if request.GET.get(PARAMETRO):
+            return True
+        return settings.PERFILADOR_CABECALHO and bool(request.headers.get(CABECALHO))
+
+    def __call__(self, request):
+        if not self._solicitado(request) or not request.user.is_staff:
+            return self.get_response(request)
+
+        consultas = []
+        perfil = cProfile.Profile()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(_consultas_medidas(consultas)))
+            inicio = time.perf_counter()
+            perfil.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                perfil.disable()
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        funcoes = io.StringIO()
+        pstats.Stats(perfil, stream=funcoes).sort_stats("tottime").print_stats(30)
+        registro = {
+            "metodo": request.method,
+            "caminho": request.get_full_path(),
+            "usuario": request.user.get_username(),
+            "quando": datetime.now().isoformat(timespec="seconds"),
+            "status": response.status_code,
+            "duracao_ms": round(duracao_ms, 1),
+            "sql_ms": round(sum(c["duracao_ms"] for c in consultas), 1),
+            "sql": consultas,
+            "arvore": arvore_de_chamadas(perfil),
+            "funcoes": funcoes.getvalue(),
+        }
+        _guardar(registro)
+        return HttpResponse(_relatorio_texto(registro), content_type="text/plain; charset=utf-8")
@@ -0,0 +1,81 @@
+"""Envio das leituras das telas de consulta para a réplica (DATABASE_REPLICA_URL).
+
+Só as views marcadas com ``leitura_replica`` leem da réplica; todo o resto,
+incluindo as validações RN-06 e RN-10 e qualquer escrita, usa o primário.
+Depois de uma escrita o usuário fica fixado no primário por alguns segundos
+(cookie), para enxergar a própria reserva mesmo com atraso de replicação.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARIO = "default"
+REPLICA = "replica"
+COOKIE_FIXAR_PRIMARIO = "fixar_primario"
+METODOS_SEGUROS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+_ler_da_replica = ContextVar("ler_da_replica", default=False)
+
+
+def replica_configurada():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def leituras_na_replica(ativo=True):
+    """Dentro do bloco, as leituras vão para a réplica (se houver uma configurada)."""
+    token = _ler_da_replica.set(ativo)
+    try:
+        yield
+    finally:
+        _ler_da_replica.reset(token)
+
+
+def leitura_replica(view):
+    """Decorator para views somente leitura; use ``method_decorator`` em views de classe."""
+
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        with leituras_na_replica(not request.COOKIES.get(COOKIE_FIXAR_PRIMARIO)):
+            return view(request, *args, **kwargs)
+
+    return _view
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _ler_da_replica.get() and replica_configurada():
+            return REPLICA
+        return PRIMARIO
+
+    def db_for_write(self, model, **hints):
+        return PRIMARIO
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primário e réplica têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARIO
+
+
+class FixarPrimarioAposEscritaMiddleware:
+    """Após uma requisição de escrita bem-sucedida, fixa o usuário no primário por REPLICA_JANELA_PRIMARIO segundos."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in METODOS_SEGUROS and response.status_code < 400:
+            response.set_cookie(
+                COOKIE_FIXAR_PRIMARIO,
+                "1",
+                max_age=settings.REPLICA_JANELA_PRIMARIO,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,163 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import ESCOPO_GERAL, escopo_predio, invalidar
+from .calendario import escopo_sala, escopo_usuario
+from .calendario_academico import atualizar_disponibilidade
+from .eventos import publicar_reservas
+from .manutencao import aplicar_bloqueio
+from .models import BloqueioManutencao, DiaCalendario, Reserva, Sala
+
+
+def _predios(reservas):
+    """Prédios das salas das reservas; só consulta as salas que não vieram carregadas."""
+    predios, sem_sala = set(), set()
+    for reserva in reservas:
+        if Reserva.sala.is_cached(reserva):
+            predios.add(reserva.sala.predio_id)
+        else:
+            sem_sala.add(reserva.sala_id)
+    if sem_sala:
+        predios.update(Sala.objects.filter(pk__in=sem_sala).values_list("predio_id", flat=True))
+    predios.discard(None)
+    return predios
+
+
+def reservas_alteradas(reservas):
+    """Invalida os caches que dependem das reservas informadas.
+
+    Deve ser chamada diretamente por caminhos que não disparam sinais
+    (``update()``, ``bulk_create()``, exclusões em lote). Instâncias precisam
+    de ``sala_id`` e ``usuario_id`` para invalidar os feeds iCalendar da sala
+    e do usuário e os caches do prédio da sala; querysets (check-ins) não são
+    consultados: o check-in não muda nada nos feeds, e os caches de todos os
+    prédios são invalidados pelo escopo geral.
+    """
+    escopos = {"reservas"}
+    if isinstance(reservas, QuerySet):
+        escopos.add(ESCOPO_GERAL)
+    else:
+        for reserva in reservas:
+            escopos.add(escopo_sala(reserva.sala_id))
+            if reserva.usuario_id:
+                escopos.add(escopo_usuario(reserva.usuario_id))
+            # Reserva trocada de sala: a sala e o prédio antigos também mudaram
+            anterior = getattr(reserva, "_sala_anterior", None)
+            if anterior is not None and anterior[0] != reserva.sala_id:
+                escopos.add(escopo_sala(anterior[0]))
+                if anterior[1] is not None:
+                    escopos.add(escopo_predio(anterior[1]))
+        escopos.update(escopo_predio(predio_id) for predio_id in _predios(reservas))
+    invalidar(*escopos)
+    # De novo após o commit: uma leitura entre a invalidação e o commit guardaria
+    # os dados antigos sob a versão nova
+    transaction.on_commit(lambda: invalidar(*escopos))
+
+
+@receiver(pre_save, sender=Reserva)
+def _reserva_antes_de_salvar(sender, instance, update_fields=None, **kwargs):
+    # Sala e prédio gravados antes da edição; só consulta se a sala pode ter mudado
+    instance._sala_anterior = None
+    if instance.pk is None or instance._state.adding or (update_fields is not None and "sala" not in update_fields):
+        return
+    instance._sala_anterior = (
+        sender._base_manager.using(kwargs["using"])
+        .filter(pk=instance.pk)
+        .values_list("sala_id", "sala__predio_id")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Reserva)
+def _reserva_salva(sender, instance, created, **kwargs):
+    reservas_alteradas([instance])
+    publicar_reservas("reserva_criada" if created else "reserva_alterada", [instance])
+
+
+@receiver(post_delete, sender=Reserva)
+def _reserva_excluida(sender, instance, **kwargs):
+    reservas_alteradas([instance])
+    publicar_reservas("reserva_cancelada", [instance])
+
+
+def _dias_do_bloqueio(inicio, fim):
+    return timezone.localdate(inicio), timezone.localdate(fim)
+
+
+@receiver(pre_save, sender=BloqueioManutencao)
+def _bloqueio_antes_de_salvar(sender, instance, **kwargs):
+    # O período antigo também perde o bloqueio se as datas mudarem
+    instance._periodo_anterior = None
+    if instance.pk is not None:
+        instance._periodo_anterior = (
+            sender.objects.filter(pk=instance.pk).values_list("inicio", "fim").first()
+        )
+
+
+@receiver(post_save, sender=BloqueioManutencao)
+@receiver(post_delete, sender=BloqueioManutencao)
+@receiver(m2m_changed, sender=BloqueioManutencao.salas.through)
+def _bloqueio_alterado(sender, instance, action=None, reverse=False, pk_set=None, **kwargs):
+    # RN-24: bloqueios mudam o tempo disponível das salas nos relatórios de ocupação
+    if action is None:
+        for periodo in {(instance.inicio, instance.fim), getattr(instance, "_periodo_anterior", None)} - {None}:
+            atualizar_disponibilidade(_dias_do_bloqueio(*periodo))
+        # Um bloqueio novo ainda não tem salas; as reservas são canceladas no post_add
+        if kwargs["signal"] is post_save and not kwargs["created"]:
+            aplicar_bloqueio(instance)
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if reverse:
+            atualizar_disponibilidade(sala_ids=[instance.pk])
+        else:
+            atualizar_disponibilidade(_dias_do_bloqueio(instance.inicio, instance.fim), pk_set)
+        if action == "post_add":
+            bloqueios = BloqueioManutencao.objects.filter(pk__in=pk_set) if reverse else [instance]
+            for bloqueio in bloqueios:
+                aplicar_bloqueio(bloqueio)
+    invalidar("reservas", ESCOPO_GERAL)
+
+
+@receiver(pre_save, sender=Sala)
+def _sala_antes_de_salvar(sender, instance, update_fields=None, **kwargs):
+    # Horário gravado antes da edição; só consulta se o horário pode ter mudado
+    instance._horario_anterior = None
+    if instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and not {"hora_inicio", "hora_fim"} & set(update_fields):
+        return
+    instance._horario_anterior = (
+        sender._base_manager.using(kwargs["using"])
+        .filter(pk=instance.pk)
+        .values_list("hora_inicio", "hora_fim")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Sala)
+@receiver(post_delete, sender=Sala)
+def _sala_alterada(sender, instance, created=False, **kwargs):
+    # Horário, capacidade ou prédio de uma sala mudam os relatórios de ocupação;
+    # o tempo disponível gravado só depende do horário
+    anterior = getattr(instance, "_horario_anterior", None)
+    if kwargs["signal"] is post_save and anterior is not None and anterior != (instance.hora_inicio, instance.hora_fim):
+        atualizar_disponibilidade(sala_ids=[instance.pk])
+    invalidar("reservas", ESCOPO_GERAL)
+
+
+@receiver(pre_save, sender=DiaCalendario)
+def _calendario_antes_de_salvar(sender, instance, **kwargs):
+    instance._data_anterior = None
+    if instance.pk is not None:
+        instance._data_anterior = sender.objects.filter(pk=instance.pk).values_list("data", flat=True).first()
+
+
+@receiver(post_save, sender=DiaCalendario)
+@receiver(post_delete, sender=DiaCalendario)
+def _calendario_alterado(sender, instance, **kwargs):
+    # Um feriado ou reposição muda o tempo disponível de todas as salas no dia
+    for data in {instance.data, getattr(instance, "_data_anterior", None)} - {None}:
+        atualizar_disponibilidade((data, data))
+    invalidar("reservas", ESCOPO_GERAL)
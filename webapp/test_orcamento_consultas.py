@@ -0,0 +1,178 @@
+"""Orçamento de consultas por view, medido com o mesmo banco em duas escalas.
+
+Cada view tem um número fixo de consultas (``ORCAMENTO``), verificado com 10
+e com 200 salas e contado em todos os bancos configurados — com
+DATABASE_REPLICA_URL as leituras das telas de consulta vão para a réplica. Como o orçamento é o mesmo nas
+duas escalas, uma consulta por sala ou por reserva (N+1) — em uma view ou em
+um template — faz a escala maior falhar.
+
+A tabela de disponibilidade (``webapp.calendario_academico``) é preenchida
+antes, como faz o comando ``gerar_disponibilidade`` em produção. As medições
+são de uma segunda requisição, com o cache limpo: a primeira grava na sessão
+o prédio escolhido, trabalho feito uma vez e não a cada acesso.
+"""
+
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .calendario_academico import gerar_disponibilidade
+from .models import Reserva, Sala
+
+# Consultas por requisição, independentes do número de salas e reservas
+ORCAMENTO = {
+    "dashboard_aluno": 12,
+    "dashboard_admin": 14,
+    "relatorio": 5,
+    "relatorio_resumo": 8,
+    "salas_disponiveis": 4,
+    # Gravação com a sala travada: SAVEPOINT, SELECT ... FOR UPDATE, RN-06 de novo e RELEASE
+    "reserva_nova": 14,
+    # Uma consulta de conflitos (RN-23) para todas as semanas, a trava, RN-06 de novo e um bulk_create
+    "reserva_recorrente": 10,
+}
+
+
+@contextmanager
+def capturar_consultas():
+    """
+    ``CaptureQueriesContext`` no primário e na réplica (se configurada): a
+    lista produzida reúne as consultas dos dois, na ordem dos bancos.
+    """
+    consultas = []
+    with ExitStack() as pilha:
+        contextos = [pilha.enter_context(CaptureQueriesContext(conexao)) for conexao in connections.all()]
+        yield consultas
+    for contexto in contextos:
+        consultas.extend(contexto.captured_queries)
+
+
+def _amanha_as(hora):
+    amanha = timezone.localdate() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(amanha, time(hora, 0)))
+
+
+class _OrcamentoConsultas:
+    """Testes comuns às duas escalas; as subclasses definem ``NUM_SALAS``."""
+
+    NUM_SALAS = None
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = User.objects.create_user(username="aluno_orcamento", password="pass")
+        cls.admin = User.objects.create_user(username="admin_orcamento", password="pass", is_staff=True)
+        # Sem reservas ativas, para não esbarrar no limite por usuário (RN-10)
+        cls.novo = User.objects.create_user(username="novo_orcamento", password="pass")
+
+        agora = timezone.now()
+        cls.salas = Sala.objects.bulk_create(
+            Sala(nome=f"Sala {i:03d}", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+            for i in range(cls.NUM_SALAS)
+        )
+        # Por sala: uma reserva em andamento (sala ocupada no painel) e uma amanhã
+        reservas = []
+        for i, sala in enumerate(cls.salas):
+            usuario = cls.aluno if i % 2 else cls.admin
+            reservas.append(Reserva(
+                sala=sala, usuario=usuario, data_hora_inicio=agora - timedelta(minutes=10),
+                data_hora_fim=agora + timedelta(minutes=50), check_in_realizado=True,
+            ))
+            reservas.append(Reserva(
+                sala=sala, usuario=usuario, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(10),
+            ))
+        Reserva.objects.bulk_create(reservas)
+        hoje = timezone.localdate()
+        gerar_disponibilidade(hoje - timedelta(days=40), hoje + timedelta(days=10))
+
+    def _medir(self, chave, url, dados=None, metodo="get"):
+        requisitar = getattr(self.client, metodo)
+        if metodo == "get":
+            requisitar(url, dados)
+        else:
+            self.client.get("/dashboard/")
+        # Sem os resumos guardados pela primeira requisição: mede o cálculo, não o cache
+        cache.clear()
+        with capturar_consultas() as consultas:
+            response = requisitar(url, dados)
+        self.assertEqual(
+            len(consultas), ORCAMENTO[chave],
+            "\n".join(f"{i}. {c['sql']}" for i, c in enumerate(consultas, 1)),
+        )
+        return response
+
+    def test_dashboard_aluno(self):
+        self.client.login(username="aluno_orcamento", password="pass")
+        response = self._medir("dashboard_aluno", "/dashboard/")
+        self.assertEqual(len(response.context["salas_ocupadas"]), self.NUM_SALAS)
+
+    def test_dashboard_admin(self):
+        self.client.login(username="admin_orcamento", password="pass")
+        response = self._medir("dashboard_admin", "/dashboard/")
+        # RN-20: uma hora por sala na semana fica abaixo do limiar
+        self.assertEqual(len(response.context["salas_baixa_utilizacao"]), self.NUM_SALAS)
+
+    def test_relatorio(self):
+        self.client.login(username="admin_orcamento", password="pass")
+        response = self._medir("relatorio", "/relatorio-ocupacao/")
+        self.assertEqual(len(response.context["linhas"]), 2 * self.NUM_SALAS)
+
+    def test_relatorio_resumo(self):
+        self.client.login(username="admin_orcamento", password="pass")
+        response = self._medir("relatorio_resumo", "/relatorio-ocupacao/", {"modo": "resumo"})
+        self.assertEqual(len(response.context["resumo"]["por_sala"]), self.NUM_SALAS)
+
+    def test_salas_disponiveis(self):
+        self.client.login(username="aluno_orcamento", password="pass")
+        response = self._medir("salas_disponiveis", "/salas/disponiveis/", {
+            "inicio": _amanha_as(11).strftime("%Y-%m-%dT%H:%M"),
+            "fim": _amanha_as(12).strftime("%Y-%m-%dT%H:%M"),
+        })
+        self.assertEqual(len(response.context["salas_disponiveis"]), self.NUM_SALAS)
+
+    def test_reserva_nova(self):
+        self.client.login(username="novo_orcamento", password="pass")
+        response = self._medir("reserva_nova", "/reservas/nova/", {
+            "sala": self.salas[0].pk,
+            "data_hora_inicio": _amanha_as(14).strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": _amanha_as(15).strftime("%Y-%m-%dT%H:%M"),
+            "quantidade_pessoas": 5,
+        }, metodo="post")
+        self.assertRedirects(response, "/dashboard/", fetch_redirect_response=False)
+
+    def _reserva_recorrente(self, num_semanas, hora):
+        self.client.login(username="novo_orcamento", password="pass")
+        amanha = timezone.localdate() + timedelta(days=1)
+        response = self._medir("reserva_recorrente", "/reservas/recorrente/", {
+            "sala": self.salas[0].pk,
+            "dia_da_semana": amanha.weekday(),
+            "hora_inicio": f"{hora}:00",
+            "hora_fim": f"{hora + 1}:00",
+            "data_inicio_recorrencia": amanha.isoformat(),
+            "num_semanas": num_semanas,
+            "quantidade_pessoas": 5,
+        }, metodo="post")
+        self.assertRedirects(response, "/dashboard/", fetch_redirect_response=False)
+        self.assertEqual(Reserva.objects.filter(usuario=self.novo).count(), num_semanas)
+
+    def test_reserva_recorrente(self):
+        self._reserva_recorrente(4, 14)
+
+    def test_reserva_recorrente_maximo_de_semanas(self):
+        # Mesmo orçamento com 12 semanas: nada por ocorrência
+        self._reserva_recorrente(12, 16)
+
+
+class OrcamentoConsultas10SalasTest(_OrcamentoConsultas, TestCase):
+    NUM_SALAS = 10
+
+
+class OrcamentoConsultas200SalasTest(_OrcamentoConsultas, TestCase):
+    NUM_SALAS = 200
@@ -1,13 +1,22 @@
-from django.test import TestCase, Client
-from django.db import IntegrityError
+from unittest import skipUnless
+
+from django.test import TestCase, TransactionTestCase, Client
+from django.db import IntegrityError, connection
 from django.core.exceptions import ValidationError
-from datetime import time
+from datetime import datetime, time
 
 from .models import Sala, Reserva
 from .forms import SalaForm
 from django.utils import timezone
 from datetime import timedelta
 
+
+def _amanha_as(hora):
+    """Amanhã no horário informado — dentro do expediente das salas, seja qual for a hora atual."""
+    amanha = timezone.localdate() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(amanha, time(hora, 0)))
+
+
 class SalaModelTest(TestCase):
     def test_sala_unique_name(self):
         """Verifica que não é possível criar duas salas com o mesmo nome."""
@@ -21,7 +30,7 @@ class ReservaModelTest(TestCase):
         """Verifica que a reserva falha se a quantidade de pessoas exceder a capacidade."""
         sala = Sala.objects.create(nome="Auditório", capacidade=50, hora_inicio=time(8, 0), hora_fim=time(22, 0))
         
-        inicio = timezone.now() + timedelta(days=1)
+        inicio = _amanha_as(10)
         fim = inicio + timedelta(hours=2)
         
         # Cria uma reserva válida
@@ -78,8 +87,9 @@ class ReservaRN05Test(TestCase):
     A data/hora de início da reserva deve ser anterior à de término.
     """
 
-    def setUp(self):
-        self.sala = Sala.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(
             nome="Sala Teste RN05",
             capacidade=20,
             hora_inicio=time(8, 0),
@@ -88,14 +98,14 @@ class ReservaRN05Test(TestCase):
 
     def test_inicio_antes_do_fim_valido(self):
         """Reserva com início < fim deve ser válida (sem ValidationError)."""
-        inicio = timezone.now() + timedelta(days=1)
+        inicio = _amanha_as(10)
         fim = inicio + timedelta(hours=2)
         reserva = Reserva(sala=self.sala, data_hora_inicio=inicio, data_hora_fim=fim, quantidade_pessoas=5)
         reserva.full_clean()  # Não deve lançar exceção
 
     def test_inicio_igual_ao_fim_invalido(self):
         """Reserva com início == fim deve lançar ValidationError (RN-05)."""
-        inicio = timezone.now() + timedelta(days=1)
+        inicio = _amanha_as(10)
         reserva = Reserva(sala=self.sala, data_hora_inicio=inicio, data_hora_fim=inicio, quantidade_pessoas=5)
         with self.assertRaises(ValidationError) as ctx:
             reserva.full_clean()
@@ -103,7 +113,7 @@ class ReservaRN05Test(TestCase):
 
     def test_inicio_depois_do_fim_invalido(self):
         """Reserva com início > fim deve lançar ValidationError (RN-05)."""
-        fim = timezone.now() + timedelta(days=1)
+        fim = _amanha_as(10)
         inicio = fim + timedelta(hours=1)
         reserva = Reserva(sala=self.sala, data_hora_inicio=inicio, data_hora_fim=fim, quantidade_pessoas=5)
         with self.assertRaises(ValidationError) as ctx:
@@ -114,14 +124,18 @@ class ReservaRN05Test(TestCase):
 class RN19TaxaOcupacaoTest(TestCase):
     """Testes para RN-19: taxa de ocupação calculada corretamente."""
 
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         from datetime import time
-        self.sala = Sala.objects.create(
+        from .models import DiaCalendario
+        cls.sala = Sala.objects.create(
             nome="Sala RN19",
             capacidade=20,
             hora_inicio=time(8, 0),
             hora_fim=time(18, 0),
         )
+        # Hoje conta como dia letivo mesmo que caia em um fim de semana
+        DiaCalendario.objects.create(data=timezone.localdate(), tipo="letivo")
 
     def test_taxa_zero_sem_reservas(self):
         """Sem reservas, taxa de ocupação deve ser 0."""
@@ -137,12 +151,16 @@ class RN19TaxaOcupacaoTest(TestCase):
         hoje_inicio = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
         hoje_fim = hoje_inicio + timedelta(days=1)
         # Sala disponível das 8h às 18h = 10h = 600 min
-        inicio_reserva = hoje_inicio.replace(hour=8, minute=0)
-        fim_reserva = inicio_reserva + timedelta(hours=5)
+        # 4h + 1h: nenhuma reserva passa do máximo da RN-09
+        Reserva.objects.create(
+            sala=self.sala,
+            data_hora_inicio=hoje_inicio.replace(hour=8),
+            data_hora_fim=hoje_inicio.replace(hour=12),
+        )
         Reserva.objects.create(
             sala=self.sala,
-            data_hora_inicio=inicio_reserva,
-            data_hora_fim=fim_reserva,
+            data_hora_inicio=hoje_inicio.replace(hour=13),
+            data_hora_fim=hoje_inicio.replace(hour=14),
         )
         taxa = _calcular_taxa_ocupacao(self.sala, hoje_inicio, hoje_fim)
         self.assertEqual(taxa, 50.0)
@@ -151,17 +169,21 @@ class RN19TaxaOcupacaoTest(TestCase):
 class RN21SalasDisponiveisTest(TestCase):
     """Testes para RN-21: busca de salas disponíveis por intervalo de tempo."""
 
-    def setUp(self):
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
         from datetime import time
         from django.contrib.auth.models import User
-        self.user = User.objects.create_user(username="testuser_rn21", password="pass")
-        self.sala_livre = Sala.objects.create(
+        cls.user = User.objects.create_user(username="testuser_rn21", password="pass")
+        cls.sala_livre = Sala.objects.create(
             nome="Sala Livre",
             capacidade=20,
             hora_inicio=time(8, 0),
             hora_fim=time(20, 0),
         )
-        self.sala_ocupada = Sala.objects.create(
+        cls.sala_ocupada = Sala.objects.create(
             nome="Sala Ocupada",
             capacidade=20,
             hora_inicio=time(8, 0),
@@ -169,12 +191,12 @@ class RN21SalasDisponiveisTest(TestCase):
         )
         # Reserva conflitante para sala_ocupada amanhã das 10h às 12h
         amanha = timezone.now() + timedelta(days=1)
-        self.inicio_conflito = amanha.replace(hour=10, minute=0, second=0, microsecond=0)
-        self.fim_conflito = self.inicio_conflito + timedelta(hours=2)
+        cls.inicio_conflito = amanha.replace(hour=10, minute=0, second=0, microsecond=0)
+        cls.fim_conflito = cls.inicio_conflito + timedelta(hours=2)
         Reserva.objects.create(
-            sala=self.sala_ocupada,
-            data_hora_inicio=self.inicio_conflito,
-            data_hora_fim=self.fim_conflito,
+            sala=cls.sala_ocupada,
+            data_hora_inicio=cls.inicio_conflito,
+            data_hora_fim=cls.fim_conflito,
         )
 
     def test_sala_com_conflito_nao_aparece(self):
@@ -203,12 +225,13 @@ class RN21SalasDisponiveisTest(TestCase):
 class RN22RN23ReservaRecorrenteTest(TestCase):
     """Testes para RN-22 (reservas recorrentes) e RN-23 (verificação em todas as datas)."""
 
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         from datetime import time
         from django.contrib.auth.models import User
 
-        self.user = User.objects.create_user(username="testuser_rn22", password="pass")
-        self.sala = Sala.objects.create(
+        cls.user = User.objects.create_user(username="testuser_rn22", password="pass")
+        cls.sala = Sala.objects.create(
             nome="Sala Recorrente",
             capacidade=20,
             hora_inicio=time(8, 0),
@@ -293,3 +316,1859 @@ class RN22RN23ReservaRecorrenteTest(TestCase):
             usuario=self.user,
         )
         self.assertFalse(form.is_valid())
+
+
+class RN18RelatorioResumoTest(TestCase):
+    """Testes para o modo resumo do relatório de ocupação (RN-18)."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import datetime, time
+        from django.contrib.auth.models import User
+
+        cls.admin = User.objects.create_user(username="admin_resumo", password="pass", is_staff=True)
+        cls.aluno = User.objects.create_user(username="aluno_resumo", password="pass")
+        # Sala aberta 10h por dia; período de 2 dias = 1200 min disponíveis
+        cls.sala = Sala.objects.create(nome="Sala Resumo", capacidade=20, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        cls.sala_vazia = Sala.objects.create(nome="Sala Vazia", capacidade=20, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        dia = timezone.make_aware(datetime(2026, 3, 2, 8, 0))
+        Reserva.objects.create(sala=cls.sala, usuario=cls.aluno, data_hora_inicio=dia,
+                               data_hora_fim=dia + timedelta(hours=4), check_in_realizado=True)
+        Reserva.objects.create(sala=cls.sala, usuario=cls.aluno, data_hora_inicio=dia + timedelta(days=1),
+                               data_hora_fim=dia + timedelta(days=1, hours=2))
+
+    def setUp(self):
+        self.client.login(username="admin_resumo", password="pass")
+
+    def _resumo(self):
+        response = self.client.get("/relatorio-ocupacao/", {
+            "modo": "resumo", "data_inicio": "2026-03-02", "data_fim": "2026-03-03",
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.context["resumo"]
+
+    def test_metricas_por_sala_e_usuario(self):
+        """Horas, ocupação, taxa de check-in e no-shows são agregados por sala e por usuário."""
+        resumo = self._resumo()
+        por_sala = {linha["nome"]: linha for linha in resumo["por_sala"]}
+        self.assertEqual(por_sala["Sala Resumo"]["horas_reservadas"], 6.0)
+        self.assertEqual(por_sala["Sala Resumo"]["taxa_ocupacao"], 30.0)
+        self.assertEqual(por_sala["Sala Resumo"]["no_shows"], 1)
+        self.assertEqual(por_sala["Sala Resumo"]["taxa_checkin"], 50.0)
+        self.assertEqual(por_sala["Sala Vazia"]["taxa_ocupacao"], 0)
+        self.assertEqual(len(resumo["por_usuario"]), 1)
+        self.assertEqual(resumo["por_usuario"][0]["total_reservas"], 2)
+        self.assertEqual(len(resumo["por_dia"]), 2)
+
+    def test_resumo_invalidado_apos_nova_reserva(self):
+        """O cache do resumo é descartado quando uma reserva é criada."""
+        from datetime import datetime
+
+        self._resumo()
+        dia = timezone.make_aware(datetime(2026, 3, 3, 14, 0))
+        Reserva.objects.create(sala=self.sala_vazia, usuario=self.aluno,
+                               data_hora_inicio=dia, data_hora_fim=dia + timedelta(hours=1))
+        por_sala = {linha["nome"]: linha for linha in self._resumo()["por_sala"]}
+        self.assertEqual(por_sala["Sala Vazia"]["total_reservas"], 1)
+
+    def test_sala_invalida_ignorada(self):
+        """Um ``?sala=`` que não é um id é ignorado, no resumo e na listagem."""
+        for modo in ("resumo", ""):
+            response = self.client.get("/relatorio-ocupacao/", {
+                "modo": modo, "sala": "abc", "data_inicio": "2026-03-02", "data_fim": "2026-03-03",
+            })
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["linhas"]), 2)
+        response = self.client.get("/relatorio-ocupacao/", {
+            "modo": "resumo", "sala": str(self.sala.pk), "data_inicio": "2026-03-02", "data_fim": "2026-03-03",
+        })
+        self.assertEqual([linha["nome"] for linha in response.context["resumo"]["por_sala"]], ["Sala Resumo"])
+
+
+class MapaCalorOcupacaoTest(TestCase):
+    """Testes para o mapa de calor de ocupação por tipo de sala, dia da semana e hora."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import datetime, time
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="admin_mapa", password="pass", is_staff=True)
+        cls.lab = Sala.objects.create(nome="Lab Mapa", tipo="laboratorio", capacidade=20,
+                                      hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        Sala.objects.create(nome="Lab Mapa 2", tipo="laboratorio", capacidade=20,
+                            hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        # Segunda-feira, 10:00 às 11:30
+        inicio = timezone.make_aware(datetime(2026, 3, 2, 10, 0))
+        Reserva.objects.create(sala=cls.lab, data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(minutes=90))
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        # O mapa fica em cache com a versão das reservas, que não volta com o rollback do teste
+        cache.clear()
+        self.client.login(username="admin_mapa", password="pass")
+
+    def test_sobreposicao_por_celula(self):
+        """Cada célula recebe apenas os minutos da reserva que caem na sua hora."""
+        response = self.client.get("/relatorio-ocupacao/mapa-calor/", {
+            "data_inicio": "2026-03-02", "data_fim": "2026-03-08",
+        })
+        self.assertEqual(response.status_code, 200)
+        laboratorio = response.json()["tipos"]["laboratorio"]["ocupacao"]
+        segunda = laboratorio[0]
+        # Duas salas de laboratório abertas: 60 min ocupados em 120 disponíveis
+        self.assertEqual(segunda[10], 50.0)
+        self.assertEqual(segunda[11], 25.0)
+        self.assertEqual(segunda[9], 0)
+        self.assertEqual(segunda[20], 0)
+        self.assertEqual(sum(laboratorio[1]), 0)
+
+    def test_minutos_fora_do_funcionamento_nao_contam(self):
+        """Reservas são recortadas ao horário da sala e aos dias letivos, sem teto de 100%."""
+        from datetime import datetime
+        from .ocupacao import calcular_mapa_calor
+
+        # O outro laboratório fica aberto até as 20h: sem o recorte, a reserva abaixo
+        # contaria na célula das 18h como 100% dele
+        lab2 = Sala.objects.get(nome="Lab Mapa 2")
+        lab2.hora_fim = time(20, 0)
+        lab2.save()
+        # Terça, 17h às 19h: a sala da reserva fecha às 18h. Sábado não é dia letivo.
+        terca = timezone.make_aware(datetime(2026, 3, 3, 17, 0))
+        Reserva.objects.create(sala=self.lab, data_hora_inicio=terca, data_hora_fim=terca + timedelta(hours=2))
+        sabado = timezone.make_aware(datetime(2026, 3, 7, 10, 0))
+        Reserva.objects.create(sala=self.lab, data_hora_inicio=sabado, data_hora_fim=sabado + timedelta(hours=1))
+
+        laboratorio = calcular_mapa_calor(datetime(2026, 3, 2).date(), datetime(2026, 3, 8).date())["tipos"]["laboratorio"]
+        self.assertEqual(laboratorio["ocupacao"][1][17], 50.0)
+        self.assertEqual(laboratorio["ocupacao"][1][18], 0)
+        self.assertEqual(sum(laboratorio["ocupacao"][5]), 0)
+
+    def test_periodo_maximo(self):
+        """Períodos maiores que o limite são recusados."""
+        response = self.client.get("/relatorio-ocupacao/mapa-calor/", {
+            "data_inicio": "2024-01-01", "data_fim": "2026-01-01",
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class MotorJinja2PaineisTest(TestCase):
+    """As linhas do dashboard e do relatório também podem ser renderizadas pelo backend Jinja2."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import time
+        from django.contrib.auth.models import User
+
+        cls.admin = User.objects.create_user(username="admin_jinja", password="pass", is_staff=True)
+        cls.sala = Sala.objects.create(nome="Sala Jinja", capacidade=20, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        inicio = timezone.now() + timedelta(days=2)
+        Reserva.objects.create(sala=cls.sala, usuario=cls.admin, data_hora_inicio=inicio,
+                               data_hora_fim=inicio + timedelta(hours=1))
+
+    def setUp(self):
+        self.client.login(username="admin_jinja", password="pass")
+
+    def _renderizar(self, url, motor):
+        from django.test import override_settings
+
+        with override_settings(MOTOR_TEMPLATES_PAINEIS=motor):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_dashboard_nos_dois_motores(self):
+        for motor in ("django", "jinja2"):
+            response = self._renderizar("/dashboard/", motor)
+            self.assertContains(response, "Sala Jinja")
+            self.assertContains(response, f"/reservas/{Reserva.objects.get().pk}/editar/")
+            self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_relatorio_nos_dois_motores(self):
+        for motor in ("django", "jinja2"):
+            response = self._renderizar("/relatorio-ocupacao/", motor)
+            self.assertContains(response, "1 Reservas encontradas")
+            self.assertContains(response, "admin_jinja")
+            response = self._renderizar("/relatorio-ocupacao/?modo=resumo", motor)
+            self.assertContains(response, "Por sala")
+
+    def test_linhas_iguais_nos_dois_motores(self):
+        """Os mesmos parciais, com o mesmo contexto, produzem o mesmo HTML nos dois motores."""
+        from django.template import engines
+        from django.template.backends.utils import csrf_input
+        from django.test import RequestFactory
+        from .views import _linha_reserva, _rotas_reserva
+
+        agora = timezone.now()
+        rotas = _rotas_reserva()
+        reserva = Reserva.objects.select_related("sala", "usuario").get()
+        reserva.sala.nome = 'Sala "A" <D\'Ávila & Cia>'
+        sem_usuario = Reserva(pk=999, sala=self.sala, check_in_realizado=True,
+                              data_hora_inicio=agora - timedelta(minutes=5), data_hora_fim=agora + timedelta(hours=1))
+        linhas = [_linha_reserva(r, agora, rotas) for r in (reserva, sem_usuario)]
+        csrf = csrf_input(RequestFactory().get("/dashboard/"))
+
+        for nome in ("webapp/parciais/linhas_reservas.html", "webapp/parciais/linhas_relatorio.html"):
+            for staff in (True, False):
+                contexto = {"linhas": linhas, "staff": staff, "csrf_input": csrf}
+                html = {motor: engines[motor].get_template(nome).render(contexto) for motor in ("django", "jinja2")}
+                self.assertEqual(html["django"], html["jinja2"], nome)
+                self.assertIn("&quot;A&quot; &lt;D&#x27;Ávila &amp; Cia&gt;", html["django"])
+
+
+class ReplicaRouterTest(TestCase):
+    """Leituras das telas de consulta vão para a réplica; escritas e validações, para o primário."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.user = User.objects.create_user(username="user_replica", password="pass")
+
+    def test_roteamento_de_leitura(self):
+        from unittest import mock
+        from .routers import REPLICA, PRIMARIO, ReplicaRouter, leituras_na_replica
+
+        router = ReplicaRouter()
+        with mock.patch("webapp.routers.replica_configurada", return_value=True):
+            self.assertEqual(router.db_for_read(Reserva), PRIMARIO)
+            with leituras_na_replica():
+                self.assertEqual(router.db_for_read(Reserva), REPLICA)
+                self.assertEqual(router.db_for_write(Reserva), PRIMARIO)
+        # Sem réplica configurada tudo continua no primário
+        with mock.patch("webapp.routers.replica_configurada", return_value=False), leituras_na_replica():
+            self.assertEqual(router.db_for_read(Reserva), PRIMARIO)
+
+    def test_fixa_no_primario_apos_escrita(self):
+        """Uma requisição POST bem-sucedida grava o cookie que desativa a réplica."""
+        from unittest import mock
+        from .routers import COOKIE_FIXAR_PRIMARIO, leitura_replica, _ler_da_replica
+
+        response = self.client.post("/login/", {"username": "user_replica", "password": "pass"})
+        self.assertIn(COOKIE_FIXAR_PRIMARIO, response.cookies)
+
+        observado = []
+        view = leitura_replica(lambda request: observado.append(_ler_da_replica.get()))
+        request = mock.Mock(COOKIES={})
+        view(request)
+        request.COOKIES = {COOKIE_FIXAR_PRIMARIO: "1"}
+        view(request)
+        self.assertEqual(observado, [True, False])
+
+
+class CheckInTest(TestCase):
+    """RN-12: check-in por UPDATE condicional e envio em lote pelos quiosques."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.user = User.objects.create_user(username="user_checkin", password="pass")
+        cls.outro = User.objects.create_user(username="outro_checkin", password="pass")
+        cls.sala = Sala.objects.create(nome="Sala Check-in", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        agora = timezone.now()
+        cls.na_janela = Reserva.objects.create(
+            sala=cls.sala, usuario=cls.user,
+            data_hora_inicio=agora + timedelta(minutes=5), data_hora_fim=agora + timedelta(hours=1),
+        )
+        cls.futura = Reserva.objects.create(
+            sala=cls.sala, usuario=cls.user,
+            data_hora_inicio=agora + timedelta(hours=3), data_hora_fim=agora + timedelta(hours=4),
+        )
+
+    def setUp(self):
+        self.client.login(username="user_checkin", password="pass")
+
+    def test_checkin_na_janela(self):
+        url = f"/reservas/{self.na_janela.pk}/checkin/"
+        with self.assertNumQueries(1):
+            self.assertTrue(Reserva.objects.filter(pk=self.na_janela.pk).fazer_checkin())
+        Reserva.objects.filter(pk=self.na_janela.pk).update(check_in_realizado=False)
+
+        self.client.post(url)
+        self.assertTrue(Reserva.objects.get(pk=self.na_janela.pk).check_in_realizado)
+        # Segunda tentativa não afeta nenhuma linha
+        response = self.client.post(url, follow=True)
+        self.assertContains(response, "já foi realizado")
+
+    def test_checkin_fora_da_janela_ou_de_outro_usuario(self):
+        response = self.client.post(f"/reservas/{self.futura.pk}/checkin/", follow=True)
+        self.assertContains(response, "15 minutos antes")
+        self.assertFalse(Reserva.objects.get(pk=self.futura.pk).check_in_realizado)
+
+        self.client.login(username="outro_checkin", password="pass")
+        response = self.client.post(f"/reservas/{self.na_janela.pk}/checkin/", follow=True)
+        self.assertContains(response, "permissão")
+        self.assertFalse(Reserva.objects.get(pk=self.na_janela.pk).check_in_realizado)
+
+    def test_lote_do_quiosque(self):
+        import json
+        from django.test import override_settings
+
+        corpo = json.dumps({"checkins": [
+            {"reserva": self.na_janela.pk},
+            {"reserva": self.futura.pk},
+            {"reserva": 999999},
+            {"reserva": "x"},
+        ]})
+        with override_settings(QUIOSQUE_TOKEN="segredo"):
+            negado = self.client.post("/quiosque/checkins/", corpo, content_type="application/json")
+            self.assertEqual(negado.status_code, 403)
+
+            # SELECT ... FOR UPDATE e UPDATE, entre SAVEPOINT e RELEASE
+            with self.assertNumQueries(4):
+                response = self.client.post(
+                    "/quiosque/checkins/", corpo, content_type="application/json",
+                    HTTP_AUTHORIZATION="Bearer segredo",
+                )
+        dados = response.json()
+        self.assertEqual(dados["confirmados"], [self.na_janela.pk])
+        motivos = {r["motivo"] for r in dados["rejeitados"]}
+        self.assertEqual(motivos, {"fora_da_janela", "inexistente", "invalido"})
+        self.assertTrue(Reserva.objects.get(pk=self.na_janela.pk).check_in_realizado)
+
+    def test_lote_nao_confirma_checkin_de_outro_quiosque(self):
+        import json
+        from django.db import connection
+        from django.test import override_settings
+        from .models import RegistroAuditoria
+
+        agora = timezone.now()
+        outra = Reserva.objects.create(
+            sala=self.sala, usuario=self.outro,
+            data_hora_inicio=agora + timedelta(minutes=5), data_hora_fim=agora + timedelta(hours=1),
+        )
+        ganhou = []
+
+        def outro_quiosque(execute, sql, params, many, context):
+            # O outro quiosque grava o check-in antes de este ler o lote
+            if not ganhou and "FROM \"webapp_reserva\"" in sql and sql.lstrip().startswith("SELECT"):
+                ganhou.append(Reserva.objects.filter(pk=outra.pk).fazer_checkin())
+            return execute(sql, params, many, context)
+
+        corpo = json.dumps({"checkins": [{"reserva": self.na_janela.pk}, {"reserva": outra.pk}]})
+        with (
+            override_settings(QUIOSQUE_TOKEN="segredo"),
+            connection.execute_wrapper(outro_quiosque),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            dados = self.client.post(
+                "/quiosque/checkins/", corpo, content_type="application/json", HTTP_AUTHORIZATION="Bearer segredo",
+            ).json()
+
+        self.assertEqual(ganhou, [1])
+        self.assertEqual(dados["confirmados"], [self.na_janela.pk])
+        self.assertEqual(dados["rejeitados"], [{"reserva": outra.pk, "motivo": "ja_realizado"}])
+        auditados = RegistroAuditoria.objects.filter(acao="checkin")
+        self.assertEqual(list(auditados.values_list("reserva_id", flat=True)), [self.na_janela.pk])
+
+
+class EventosSalasTest(TestCase):
+    """SSE do estado das salas: estado inicial, eventos difundidos e fronteiras do relógio."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(nome="Sala Eventos", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+
+    def test_fronteiras_entre(self):
+        from .eventos import _fronteiras_entre, _proxima_fronteira
+
+        agora = timezone.now()
+        iniciada = Reserva.objects.create(
+            sala=self.sala, data_hora_inicio=agora - timedelta(minutes=1), data_hora_fim=agora + timedelta(hours=1),
+        )
+        liberada = Reserva.objects.create(
+            sala=self.sala, data_hora_inicio=agora - timedelta(minutes=16), data_hora_fim=agora + timedelta(hours=1),
+        )
+        encerrada = Reserva.objects.create(
+            sala=self.sala, data_hora_inicio=agora - timedelta(hours=1), data_hora_fim=agora - timedelta(minutes=1),
+            check_in_realizado=True,
+        )
+        eventos = {(e["tipo"], e["reserva"]) for e in _fronteiras_entre(agora - timedelta(minutes=2), agora)}
+        self.assertEqual(eventos, {
+            ("reserva_iniciada", iniciada.pk),
+            ("reserva_liberada", liberada.pk),
+            ("reserva_encerrada", encerrada.pk),
+        })
+        # Próxima mudança: a liberação (RN-12) da reserva que acabou de começar
+        self.assertEqual(_proxima_fronteira(agora), iniciada.data_hora_inicio + timedelta(minutes=15))
+
+    def test_requer_login(self):
+        response = self.client.get("/salas/eventos/")
+        self.assertEqual(response.status_code, 302)
+
+    def test_wsgi_responde_so_o_estado(self):
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="user_eventos", password="pass")
+        self.client.login(username="user_eventos", password="pass")
+        # O Client de teste é WSGI: sem fluxo contínuo, o navegador volta em 30 s
+        response = self.client.get("/salas/eventos/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertFalse(response.streaming)
+        corpo = response.content.decode()
+        self.assertTrue(corpo.startswith("retry: 30000\n\nevent: estado\n"))
+        self.assertIn('"nome": "Sala Eventos"', corpo)
+
+    async def test_fluxo_recebe_estado_e_eventos(self):
+        import json
+        from .eventos import difusor, fluxo_eventos
+
+        fluxo = fluxo_eventos()
+        try:
+            self.assertTrue((await anext(fluxo)).startswith("retry:"))
+            estado = await anext(fluxo)
+            self.assertTrue(estado.startswith("event: estado\n"))
+            salas = json.loads(estado.split("data: ", 1)[1])["salas"]
+            self.assertEqual(salas, [{"sala": self.sala.pk, "nome": "Sala Eventos", "ocupada": False}])
+
+            difusor.publicar([{"tipo": "checkin", "reserva": 1, "sala": self.sala.pk}])
+            self.assertTrue((await anext(fluxo)).startswith("event: checkin\n"))
+        finally:
+            await fluxo.aclose()
+        self.assertFalse(difusor.tem_assinantes())
+
+    def test_wsgi_so_salas_do_predio(self):
+        from django.contrib.auth.models import User
+        from .models import Predio
+
+        predio = Predio.objects.create(nome="Bloco Eventos", campus="Centro")
+        Sala.objects.create(nome="Sala do Bloco", capacidade=10, predio=predio, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        User.objects.create_user(username="user_eventos_predio", password="pass")
+        self.client.login(username="user_eventos_predio", password="pass")
+        corpo = self.client.get("/salas/eventos/", {"predio": predio.pk}).content.decode()
+        self.assertIn('"nome": "Sala do Bloco"', corpo)
+        self.assertNotIn('"nome": "Sala Eventos"', corpo)
+        # Sem o parâmetro, vale o prédio guardado na sessão
+        corpo = self.client.get("/salas/eventos/").content.decode()
+        self.assertNotIn('"nome": "Sala Eventos"', corpo)
+
+    async def test_fluxo_filtra_eventos_pelo_predio(self):
+        import json
+        from .eventos import difusor, fluxo_eventos
+        from .models import Predio
+
+        predio = await Predio.objects.acreate(nome="Bloco Fluxo", campus="Centro")
+        sala = await Sala.objects.acreate(
+            nome="Sala Fluxo", capacidade=10, predio=predio, hora_inicio=time(8, 0), hora_fim=time(18, 0),
+        )
+        fluxo = fluxo_eventos(predio.pk)
+        try:
+            await anext(fluxo)
+            salas = json.loads((await anext(fluxo)).split("data: ", 1)[1])["salas"]
+            self.assertEqual([s["sala"] for s in salas], [sala.pk])
+
+            # O evento de outra sala não entra na fila da tela
+            difusor.publicar([{"tipo": "checkin", "reserva": 1, "sala": self.sala.pk}])
+            difusor.publicar([{"tipo": "checkin", "reserva": 2, "sala": sala.pk}])
+            self.assertIn('"reserva": 2', await anext(fluxo))
+        finally:
+            await fluxo.aclose()
+
+
+class RN24BloqueioManutencaoTest(TestCase):
+    """RN-24: bloqueios impedem reservas, saem do denominador da ocupação e cancelam reservas em lote."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        from .models import BloqueioManutencao, DiaCalendario
+
+        cls.user = User.objects.create_user(username="user_rn24", password="pass", email="rn24@example.com")
+        cls.sala = Sala.objects.create(nome="Sala Bloqueada", capacidade=30, hora_inicio=time(8, 0), hora_fim=time(22, 0))
+        cls.livre = Sala.objects.create(nome="Sala Livre", capacidade=30, hora_inicio=time(8, 0), hora_fim=time(22, 0))
+        cls.bloqueio = BloqueioManutencao.objects.create(
+            inicio=_amanha_as(8), fim=_amanha_as(14), motivo="Troca do ar-condicionado",
+        )
+        cls.bloqueio.salas.add(cls.sala)
+        DiaCalendario.objects.create(data=_amanha_as(0).date(), tipo="letivo")
+
+    def test_reserva_no_bloqueio_invalida(self):
+        reserva = Reserva(sala=self.sala, data_hora_inicio=_amanha_as(10), data_hora_fim=_amanha_as(11))
+        with self.assertRaisesMessage(ValidationError, "manutenção"):
+            reserva.full_clean()
+        # Outra sala no mesmo horário continua disponível
+        Reserva(sala=self.livre, data_hora_inicio=_amanha_as(10), data_hora_fim=_amanha_as(11)).full_clean()
+
+    def test_busca_ignora_salas_bloqueadas(self):
+        self.client.login(username="user_rn24", password="pass")
+        response = self.client.get("/salas/disponiveis/", {
+            "inicio": _amanha_as(10).strftime("%Y-%m-%dT%H:%M"),
+            "fim": _amanha_as(11).strftime("%Y-%m-%dT%H:%M"),
+        })
+        self.assertEqual(list(response.context["salas_disponiveis"]), [self.livre])
+
+    def test_tempo_bloqueado_fora_do_denominador(self):
+        from .views import _calcular_taxa_ocupacao
+
+        inicio_dia = _amanha_as(0)
+        Reserva.objects.create(sala=self.sala, data_hora_inicio=_amanha_as(14), data_hora_fim=_amanha_as(18))
+        # 4h reservadas de 8h disponíveis (14h de funcionamento - 6h bloqueadas)
+        taxa = _calcular_taxa_ocupacao(self.sala, inicio_dia, inicio_dia + timedelta(days=1))
+        self.assertEqual(taxa, 50.0)
+
+        # Mapa de calor: às 10h só a sala livre está aberta, e está reservada
+        from .ocupacao import calcular_mapa_calor
+
+        Reserva.objects.create(sala=self.livre, data_hora_inicio=_amanha_as(10), data_hora_fim=_amanha_as(11))
+        amanha = inicio_dia.date()
+        ocupacao = calcular_mapa_calor(amanha, amanha)["tipos"]["comum"]["ocupacao"][amanha.weekday()]
+        self.assertEqual(ocupacao[10], 100.0)
+        self.assertEqual(ocupacao[15], 50.0)
+
+    def test_aplicar_cancela_em_lote_e_notifica(self):
+        from django.core import mail
+        from .manutencao import aplicar_bloqueio
+
+        afetadas = [
+            Reserva.objects.create(sala=self.sala, usuario=self.user, data_hora_inicio=_amanha_as(h), data_hora_fim=_amanha_as(h + 1))
+            for h in (8, 10, 12)
+        ]
+        mantida = Reserva.objects.create(
+            sala=self.sala, usuario=self.user, data_hora_inicio=_amanha_as(14), data_hora_fim=_amanha_as(15),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            canceladas = aplicar_bloqueio(self.bloqueio)
+
+        self.assertEqual(canceladas, len(afetadas))
+        self.assertEqual(list(Reserva.objects.filter(sala=self.sala)), [mantida])
+        # Um único e-mail para o usuário, com as três reservas
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["rn24@example.com"])
+        self.assertEqual(mail.outbox[0].body.count("Sala Bloqueada"), 3)
+
+    def test_bloqueio_criado_fora_do_admin_e_mantem_reservas_em_andamento(self):
+        from .models import BloqueioManutencao, RegistroAuditoria
+
+        agora = timezone.now()
+        em_andamento = Reserva.objects.create(
+            sala=self.livre, usuario=self.user, data_hora_inicio=agora - timedelta(minutes=30),
+            data_hora_fim=agora + timedelta(minutes=30), check_in_realizado=True,
+        )
+        futura = Reserva.objects.create(
+            sala=self.livre, usuario=self.user, data_hora_inicio=agora + timedelta(hours=1),
+            data_hora_fim=agora + timedelta(hours=2),
+        )
+        bloqueio = BloqueioManutencao.objects.create(
+            inicio=agora - timedelta(hours=1), fim=agora + timedelta(hours=3), motivo="Vazamento",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            bloqueio.salas.add(self.livre)
+
+        self.assertEqual(bloqueio.reservas_canceladas, 1)
+        self.assertEqual(list(Reserva.objects.filter(sala=self.livre)), [em_andamento])
+        self.assertEqual(list(bloqueio.reservas_em_andamento()), [em_andamento])
+        self.assertTrue(RegistroAuditoria.objects.filter(reserva_id=futura.pk, acao="cancelada").exists())
+
+
+class AdminReservaTest(TestCase):
+    """Listagem de reservas no admin com consultas limitadas, independentes do volume."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.admin = User.objects.create_superuser(username="admin_lista", password="pass")
+        cls.sala = Sala.objects.create(nome="Sala Admin", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+
+    def setUp(self):
+        self.client.login(username="admin_lista", password="pass")
+
+    def _criar_reservas(self, quantidade):
+        from django.contrib.auth.models import User
+
+        existentes = Reserva.objects.count()
+        for i in range(existentes, existentes + quantidade):
+            usuario = User.objects.create_user(username=f"aluno_admin_{i}")
+            inicio = _amanha_as(0) + timedelta(days=i)
+            Reserva.objects.create(sala=self.sala, usuario=usuario, data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(hours=1))
+
+    def test_consultas_nao_crescem_com_as_linhas(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self._criar_reservas(2)
+        with CaptureQueriesContext(connection) as poucas:
+            self.assertEqual(self.client.get("/admin/webapp/reserva/").status_code, 200)
+        self._criar_reservas(20)
+        with CaptureQueriesContext(connection) as muitas:
+            self.assertEqual(self.client.get("/admin/webapp/reserva/").status_code, 200)
+        self.assertEqual(len(poucas), len(muitas))
+
+    def test_filtro_de_periodo(self):
+        self._criar_reservas(3)
+        response = self.client.get("/admin/webapp/reserva/", {"periodo": "proximos_7_dias"})
+        self.assertEqual(response.context["cl"].result_count, 3)
+        response = self.client.get("/admin/webapp/reserva/", {"periodo": "ultimos_7_dias"})
+        self.assertEqual(response.context["cl"].result_count, 0)
+
+    def test_filtro_acima_do_limite_de_contagem(self):
+        from unittest import mock
+        from django.core.paginator import EmptyPage
+        from .admin import ContagemEstimadaPaginator
+
+        # 13 linhas filtradas com limite de 10: uma página de 2 além da última calculada
+        Reserva.objects.bulk_create(
+            Reserva(sala=self.sala, data_hora_inicio=_amanha_as(0) + timedelta(hours=i), data_hora_fim=_amanha_as(1) + timedelta(hours=i))
+            for i in range(13)
+        )
+        filtradas = Reserva.objects.filter(sala=self.sala).order_by("data_hora_inicio")
+        with mock.patch.object(ContagemEstimadaPaginator, "LIMITE_CONTAGEM", 10):
+            paginator = ContagemEstimadaPaginator(filtradas, 2)
+            self.assertEqual(paginator.count, 10)
+            self.assertEqual(str(paginator.count), "10+")
+            self.assertEqual(paginator.num_pages, 5)
+            self.assertEqual(len(paginator.page(6)), 2)
+            self.assertEqual(len(paginator.page(7)), 1)
+            with self.assertRaises(EmptyPage):
+                paginator.page(8)
+            self.assertEqual(list(paginator.get_elided_page_range(6, on_each_side=1, on_ends=1)), [1, "…", 5, 6, 7])
+
+            # No admin (100 por página): a contagem aparece como "10+" e a página 1 traz as 13
+            response = self.client.get("/admin/webapp/reserva/", {"sala": self.sala.pk})
+        self.assertContains(response, "10+")
+        self.assertEqual(len(response.context["cl"].result_list), 13)
+
+    def test_filtro_de_sala_digitada(self):
+        outra = Sala.objects.create(nome="Auditório", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        self._criar_reservas(2)
+        Reserva.objects.create(sala=outra, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(10))
+
+        # A barra lateral não lista as salas: só o campo de busca
+        response = self.client.get("/admin/webapp/reserva/")
+        self.assertContains(response, 'name="sala"')
+        self.assertNotContains(response, f"?sala__id__exact={outra.pk}")
+
+        response = self.client.get("/admin/webapp/reserva/", {"sala": "admin", "periodo": "proximos_7_dias"})
+        self.assertEqual(response.context["cl"].result_count, 2)
+        self.assertContains(response, 'name="periodo" value="proximos_7_dias"')
+        response = self.client.get("/admin/webapp/reserva/", {"sala": str(outra.pk)})
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+
+class ParticoesReservaTest(TestCase):
+    """Partições mensais: cálculo dos meses e limites de partição nas consultas de sobreposição."""
+
+    def test_meses_e_nomes(self):
+        from datetime import date
+        from .particoes import nome_particao, somar_meses
+
+        self.assertEqual(somar_meses(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(somar_meses(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(nome_particao(date(2026, 3, 1)), "webapp_reserva_p2026_03")
+
+    def test_sobrepostas_limita_inicio_pela_duracao_maxima(self):
+        sala = Sala.objects.create(nome="Sala Partição", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        longa = Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(12))
+        # Reserva de 4 horas (máximo da RN-09) ainda é encontrada pelo limite inferior
+        self.assertEqual(list(Reserva.objects.sobrepostas(_amanha_as(11), _amanha_as(13))), [longa])
+        self.assertEqual(
+            list(Reserva.objects.sobrepostas_a_alguma([(sala.pk, _amanha_as(11), _amanha_as(13))])), [longa]
+        )
+        self.assertEqual(list(Reserva.objects.ativas(_amanha_as(11) + timedelta(minutes=59))), [longa])
+        self.assertEqual(list(Reserva.objects.sobrepostas(_amanha_as(12), _amanha_as(13))), [])
+
+    def test_banco_recusa_reserva_mais_longa_que_o_maximo(self):
+        from django.db import transaction
+
+        sala = Sala.objects.create(nome="Sala Partição", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        # bulk_create não passa pelo clean(): quem recusa é a constraint reserva_duracao_maxima
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Reserva.objects.bulk_create([Reserva(sala=sala, data_hora_inicio=_amanha_as(6), data_hora_fim=_amanha_as(14))])
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_comando_sem_postgresql(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        saida = StringIO()
+        call_command("gerenciar_particoes", stdout=saida)
+        self.assertIn("nada a fazer", saida.getvalue())
+
+
+@skipUnless(connection.vendor == "postgresql", "Partições só existem no PostgreSQL")
+class ParticoesPostgresTest(TransactionTestCase):
+    """Conversão da tabela de reservas em particionada, ida e volta, em um PostgreSQL real."""
+
+    def test_converter_e_reverter(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .particoes import PARTICAO_PADRAO, inicio_do_mes, nome_particao, tabela_particionada
+
+        sala = Sala.objects.create(nome="Sala PG", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        antiga = Reserva.objects.create(
+            sala=sala, data_hora_inicio=_amanha_as(8) - timedelta(days=400), data_hora_fim=_amanha_as(9) - timedelta(days=400)
+        )
+        self.addCleanup(call_command, "gerenciar_particoes", reverter=True, stdout=StringIO())
+        call_command("gerenciar_particoes", converter=True, stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            self.assertTrue(tabela_particionada(cursor))
+        nova = Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(9))
+        self.assertGreater(nova.pk, antiga.pk)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM webapp_reserva WHERE id = %s", [nova.pk])
+            self.assertEqual(cursor.fetchone()[0], nome_particao(inicio_do_mes(nova.data_hora_inicio.date())))
+            cursor.execute("SELECT tableoid::regclass::text FROM webapp_reserva WHERE id = %s", [antiga.pk])
+            self.assertIn(cursor.fetchone()[0], (PARTICAO_PADRAO, nome_particao(inicio_do_mes(antiga.data_hora_inicio.date()))))
+
+        # Para o Django a chave continua sendo id: get, update e delete por pk
+        nova.quantidade_pessoas = 7
+        nova.save()
+        self.assertEqual(Reserva.objects.get(pk=nova.pk).quantidade_pessoas, 7)
+        self.assertEqual(list(Reserva.objects.sobrepostas(_amanha_as(8), _amanha_as(9))), [nova])
+        antiga.delete()
+        self.assertFalse(Reserva.objects.filter(pk=antiga.pk).exists())
+
+        call_command("gerenciar_particoes", reverter=True, stdout=StringIO())
+        with connection.cursor() as cursor:
+            self.assertFalse(tabela_particionada(cursor))
+        self.assertEqual(list(Reserva.objects.values_list("pk", flat=True)), [nova.pk])
+
+    def test_consultas_quentes_descartam_particoes(self):
+        """RN-06, a sala ocupada agora (dashboard) e a RN-10 leem só uma ou duas partições mensais."""
+        import re
+        from io import StringIO
+        from django.core.management import call_command
+        from django.contrib.auth.models import User
+        from .particoes import inicio_do_mes, nome_particao
+
+        usuario = User.objects.create_user(username="usuario_pg", password="pass")
+        sala = Sala.objects.create(nome="Sala PG", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        antiga = Reserva.objects.create(
+            sala=sala, data_hora_inicio=_amanha_as(8) - timedelta(days=400), data_hora_fim=_amanha_as(9) - timedelta(days=400)
+        )
+        self.addCleanup(call_command, "gerenciar_particoes", reverter=True, stdout=StringIO())
+        call_command("gerenciar_particoes", converter=True, stdout=StringIO())
+        particao_antiga = nome_particao(inicio_do_mes(antiga.data_hora_inicio.date()))
+
+        agora = timezone.now()
+        # Limites das partições em UTC, como timezone.now()
+        primeiro_mes = nome_particao(inicio_do_mes((agora - timedelta(hours=4)).date()))
+        # (consulta, máximo de partições mensais lidas); a RN-10 também lê as futuras
+        consultas = {
+            "RN-06": (Reserva.objects.sobrepostas(_amanha_as(8), _amanha_as(9)).filter(sala=sala), 2),
+            "ocupando_sala": (Reserva.objects.ocupando_sala(agora), 2),
+            "RN-10": (Reserva.objects.ativas(agora).filter(usuario=usuario), None),
+        }
+        for nome, (consulta, maximo) in consultas.items():
+            plano = consulta.explain()
+            particoes = set(re.findall(r"webapp_reserva_p\d{4}_\d{2}", plano))
+            self.assertNotIn(particao_antiga, particoes, f"{nome}:\n{plano}")
+            self.assertTrue(particoes, f"{nome}:\n{plano}")
+            self.assertGreaterEqual(min(particoes), primeiro_mes, f"{nome}:\n{plano}")
+            if maximo is not None:
+                self.assertLessEqual(len(particoes), maximo, f"{nome}:\n{plano}")
+
+
+class TesteCargaTest(TestCase):
+    """Comando teste_carga: classificação das respostas, --mix e usuários de carga."""
+
+    def test_classificar_respostas(self):
+        from .management.commands.teste_carga import _classificar_erro, _classificar_formulario
+
+        self.assertEqual(_classificar_erro(429, ""), "limitado")
+        # Com DEBUG=False o corpo não diz a causa: todo 5xx é erro do servidor
+        self.assertEqual(_classificar_erro(500, "<h1>Server Error (500)</h1>"), "erro_servidor")
+        self.assertEqual(_classificar_erro(502, ""), "erro_servidor")
+        self.assertEqual(_classificar_erro(404, "deadlock"), "erro")
+
+        self.assertEqual(_classificar_formulario(302, ""), "sucesso")
+        self.assertEqual(_classificar_formulario(200, "Já existe uma reserva para esta sala"), "conflito")
+        self.assertEqual(_classificar_formulario(200, "Conflito de horário nas seguintes datas"), "conflito")
+        self.assertEqual(_classificar_formulario(200, "Você já possui 3 reservas ativas."), "limite")
+        self.assertEqual(_classificar_formulario(200, "Capacidade excedida"), "rejeitada")
+        self.assertEqual(_classificar_formulario(429, ""), "limitado")
+
+    def test_mix(self):
+        from django.core.management.base import CommandError
+        from .management.commands.teste_carga import MIX_PADRAO, Command
+
+        comando = Command()
+        self.assertEqual(
+            comando._mix(MIX_PADRAO),
+            {"login": 1, "dashboard": 5, "busca": 3, "reserva": 3, "recorrente": 1},
+        )
+        # Ações omitidas ficam com peso zero; espaços e pesos fracionários são aceitos
+        self.assertEqual(
+            comando._mix(" reserva = 2.5 ,busca=1"),
+            {"login": 0, "dashboard": 0, "busca": 1, "reserva": 2.5, "recorrente": 0},
+        )
+        for invalido in ("reserva", "reserva=x", "cancelar=1", "reserva=1=2"):
+            with self.assertRaisesMessage(CommandError, "--mix inválido"):
+                comando._mix(invalido)
+        with self.assertRaisesMessage(CommandError, "ao menos uma ação"):
+            comando._mix("reserva=0,busca=0")
+
+    def test_usuarios_de_carga_e_limpeza(self):
+        from io import StringIO
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from django.test import override_settings
+        from .management.commands.teste_carga import Command
+
+        with self.assertRaisesMessage(CommandError, "Cadastre ao menos uma sala"):
+            call_command("teste_carga", usuarios=1, duracao=0, rampa=0, stdout=StringIO())
+        # Todos os usuários virtuais saem do mesmo IP: com os limites ligados só dá 429
+        with override_settings(LIMITES_TAXA_ATIVO=True), self.assertRaisesMessage(CommandError, "LIMITES_TAXA_ATIVO=False"):
+            call_command("teste_carga", usuarios=1, duracao=0, rampa=0, stdout=StringIO())
+
+        Sala.objects.create(nome="Sala Carga", capacidade=30, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        anterior = User.objects.create_user(username="carga_00001", password="outra")
+        outro = User.objects.create_user(username="aluno_real")
+
+        # Um SELECT, a senha nova dos existentes e um INSERT em lote só para os que faltam
+        with self.assertNumQueries(3):
+            usernames, criados = Command()._preparar_usuarios(3, "senha-carga")
+        self.assertEqual(usernames, ["carga_00000", "carga_00001", "carga_00002"])
+        self.assertEqual(criados, ["carga_00000", "carga_00002"])
+        self.assertTrue(User.objects.get(username="carga_00000").check_password("senha-carga"))
+        # Rodada anterior com outra --senha: a senha é trocada para o login funcionar
+        self.assertTrue(User.objects.get(username="carga_00001").check_password("senha-carga"))
+
+        # Duração zero: nenhuma requisição é feita; --limpar apaga só os criados nesta execução
+        User.objects.filter(username__in=criados).delete()
+        saida = StringIO()
+        call_command(
+            "teste_carga", url="http://127.0.0.1:9", usuarios=3, duracao=0, rampa=0, limpar=True, stdout=saida,
+        )
+        self.assertIn("0 requisições", saida.getvalue())
+        self.assertIn("deadlocks: n/d", saida.getvalue())
+        self.assertEqual(list(User.objects.filter(username__startswith="carga_")), [anterior])
+        self.assertTrue(User.objects.filter(pk=outro.pk).exists())
+
+
+class PerfiladorTest(TestCase):
+    """Perfil sob demanda só para staff, com SQL na resposta e registro rotativo em disco."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="staff_perfil", password="pass", is_staff=True)
+        User.objects.create_user(username="aluno_perfil", password="pass")
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = diretorio.name
+        configuracao = override_settings(PERFILADOR_DIR=self.diretorio, PERFILADOR_MAX_REGISTROS=2)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_staff_recebe_perfil(self):
+        import os
+
+        self.client.login(username="staff_perfil", password="pass")
+        response = self.client.get("/dashboard/", {"_perfil": "1"})
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        texto = response.content.decode()
+        self.assertIn("Árvore de chamadas", texto)
+        self.assertIn("webapp_sala", texto)
+
+        for _ in range(2):
+            self.client.get("/dashboard/", {"_perfil": "1"})
+        self.assertEqual(len(os.listdir(self.diretorio)), 2)
+
+    def test_ignorado_para_nao_staff_e_cabecalho_desligado(self):
+        import os
+
+        self.client.login(username="aluno_perfil", password="pass")
+        response = self.client.get("/dashboard/", {"_perfil": "1"})
+        self.assertTemplateUsed(response, "webapp/dashboard.html")
+
+        self.client.login(username="staff_perfil", password="pass")
+        response = self.client.get("/dashboard/", HTTP_X_PERFILAR="1")
+        self.assertTemplateUsed(response, "webapp/dashboard.html")
+        self.assertEqual(os.listdir(self.diretorio), [])
+
+    def test_poda_concorrente_nao_falha(self):
+        import os
+        from unittest import mock
+        from .perfilador import _guardar
+
+        listar = os.listdir
+        # Um perfil listado, mas já removido por outro worker antes da poda
+        with mock.patch("webapp.perfilador.os.listdir", lambda d: ["000000000-removido.json", *listar(d)]):
+            for duracao in (10, 20, 30):
+                _guardar({"duracao_ms": duracao})
+        self.assertEqual(len(os.listdir(self.diretorio)), 2)
+
+
+class ConsultasLentasTest(TestCase):
+    """Registro de consultas lentas com impressão digital, view de origem e plano amostrado."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="aluno_lento", password="pass")
+        Sala.objects.create(nome="Sala Lenta", capacidade=10, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+
+    def setUp(self):
+        import os
+        import tempfile
+        from django.test import override_settings
+
+        descritor, self.arquivo = tempfile.mkstemp(suffix=".jsonl")
+        os.close(descritor)
+        self.addCleanup(os.remove, self.arquivo)
+        configuracao = override_settings(
+            CONSULTAS_LENTAS_MS=0, CONSULTAS_LENTAS_AMOSTRA_EXPLAIN=1, CONSULTAS_LENTAS_ARQUIVO=self.arquivo
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_impressao_digital_ignora_valores(self):
+        from .consultas_lentas import impressao_digital
+
+        a, normalizado = impressao_digital("SELECT * FROM t WHERE id IN (%s, %s) AND nome = 'x' AND n > 10")
+        b, _ = impressao_digital("SELECT *  FROM t WHERE id IN (%s) AND nome = 'y''z' AND n > 3")
+        self.assertEqual(a, b)
+        self.assertEqual(normalizado, "SELECT * FROM t WHERE id IN (...) AND nome = ? AND n > ?")
+
+    def test_registra_view_origem_e_plano(self):
+        import json
+        from contextlib import ExitStack
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db import connections
+        from .consultas_lentas import MedidorConsultas
+
+        self.client.login(username="aluno_lento", password="pass")
+        # Como em _instalar_medidor, um medidor por conexão: primário e réplica
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(MedidorConsultas(conexao)))
+            self.client.get("/dashboard/")
+
+        with open(self.arquivo, encoding="utf-8") as arquivo:
+            registros = [json.loads(linha) for linha in arquivo]
+        salas = [r for r in registros if "webapp_sala" in r["sql"] and r["sql"].startswith("SELECT")]
+        self.assertTrue(salas)
+        self.assertTrue(all(r["view"] == "webapp.views.dashboard" for r in salas))
+        self.assertTrue(all(r["origem"] and r["origem"].startswith("webapp/") for r in salas))
+        self.assertTrue(all(r["plano"] for r in salas))
+
+        saida = StringIO()
+        call_command("consultas_lentas", arquivo=self.arquivo, top=3, stdout=saida)
+        self.assertIn(f"{len(registros)} consultas lentas", saida.getvalue())
+        self.assertIn("webapp.views.dashboard", saida.getvalue())
+
+
+class AquecimentoTest(TestCase):
+    """Aquecimento do worker: rotas, templates, conexão e caches prontos antes da primeira requisição."""
+
+    # Leituras destas views podem ir para a réplica, quando configurada
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        Sala.objects.create(nome="Sala Quente", capacidade=10, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+
+    def test_aquecer_preenche_caches(self):
+        from django.core.cache import cache
+        from .aquecimento import aquecer
+        from .test_orcamento_consultas import capturar_consultas
+        from .views import RESUMO_DIAS_PADRAO, _resumo_ocupacao
+
+        cache.clear()
+        with capturar_consultas() as aquecimento:
+            tempos = aquecer()
+        self.assertEqual(set(tempos), {"urls", "templates", "banco", "caches"})
+        self.assertGreaterEqual(tempos["templates"][1], 10)
+        self.assertEqual(tempos["caches"][1], 1)
+        # Só leitura: nada é gravado no banco na inicialização do worker
+        self.assertTrue(all(c["sql"].lstrip().upper().startswith("SELECT") for c in aquecimento))
+
+        # Outro worker com o mesmo cache não refaz o resumo
+        with capturar_consultas() as consultas:
+            self.assertEqual(aquecer(["caches"])["caches"][1], 0)
+        self.assertEqual(consultas, [])
+
+        hoje = timezone.localdate()
+        with capturar_consultas() as consultas:
+            _resumo_ocupacao(hoje - timedelta(days=RESUMO_DIAS_PADRAO - 1), hoje)
+        self.assertEqual(len(consultas), 0)
+
+    def test_cada_motor_so_compila_os_seus_templates(self):
+        from unittest import mock
+        from django.template import engines
+        from .aquecimento import aquecer
+
+        jinja2 = engines["jinja2"]
+        with mock.patch.object(jinja2, "get_template", wraps=jinja2.get_template) as compilar:
+            aquecer(["templates"])
+        nomes = {chamada.args[0] for chamada in compilar.call_args_list}
+        self.assertEqual(nomes, {"webapp/parciais/linhas_relatorio.html", "webapp/parciais/linhas_reservas.html"})
+
+
+class LimitesTaxaTest(TestCase):
+    """Token bucket por IP e por usuário: 429 com Retry-After antes do hash de senha e das validações."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="aluno_limite", password="pass")
+        cls.sala = Sala.objects.create(nome="Sala Limite", capacidade=10, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+
+        cache.clear()
+        configuracao = override_settings(
+            LIMITES_TAXA_ATIVO=True,
+            LIMITES_TAXA={"login": {"ip": (10, 60), "usuario": (2, 60)}, "reserva": {"ip": (10, 60), "usuario": (1, 60)}},
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_login_limitado_por_usuario_antes_do_hash(self):
+        from unittest import mock
+
+        for _ in range(2):
+            response = self.client.post("/login/", {"username": "aluno_limite", "password": "errada"})
+            self.assertEqual(response.status_code, 200)
+
+        with mock.patch("django.contrib.auth.hashers.MD5PasswordHasher.verify") as verificar:
+            response = self.client.post("/login/", {"username": "Aluno_Limite", "password": "pass"})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        verificar.assert_not_called()
+
+        # Outro nome, mesmo IP: o balde por IP ainda tem fichas
+        response = self.client.post("/login/", {"username": "outro", "password": "x"})
+        self.assertEqual(response.status_code, 200)
+        # GET não consome fichas
+        self.assertEqual(self.client.get("/login/").status_code, 200)
+
+    def test_reserva_limitada_sem_consultas_de_validacao(self):
+        self.client.login(username="aluno_limite", password="pass")
+        inicio = timezone.now() + timedelta(days=1)
+        dados = {
+            "sala": self.sala.pk,
+            "data_hora_inicio": inicio.strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": (inicio + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M"),
+            "quantidade_pessoas": 1,
+        }
+        self.client.post("/reservas/nova/", dados)
+        with self.assertNumQueries(2):  # sessão e usuário, carregados pela autenticação
+            response = self.client.post("/reservas/nova/", dados)
+        self.assertEqual(response.status_code, 429)
+
+    def test_cache_indisponivel_usa_baldes_locais(self):
+        from unittest import mock
+        from django.core.cache import cache
+
+        with mock.patch.object(cache, "get_many", side_effect=ConnectionError), \
+                mock.patch.object(cache, "set_many", side_effect=ConnectionError):
+            codigos = [
+                self.client.post("/login/", {"username": "sem_cache", "password": "x"}).status_code
+                for _ in range(3)
+            ]
+        self.assertEqual(codigos, [200, 200, 429])
+
+    def test_ip_atras_de_proxy(self):
+        from django.test import RequestFactory, override_settings
+        from .limites import ip_cliente
+
+        request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="1.1.1.1, 2.2.2.2", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(ip_cliente(request), "10.0.0.1")
+        with override_settings(LIMITES_PROXIES_CONFIAVEIS=1):
+            self.assertEqual(ip_cliente(request), "2.2.2.2")
+
+
+class CalendarioIcsTest(TestCase):
+    """Feeds iCalendar por usuário e por sala: token na URL, versão por escopo e 304 condicional."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.user = User.objects.create_user(username="aluno_ics", password="pass")
+        cls.outro = User.objects.create_user(username="outro_ics", password="pass")
+        cls.sala = Sala.objects.create(nome="Sala 1, Bloco; A", capacidade=10, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        cls.outra_sala = Sala.objects.create(nome="Sala ICS 2", capacidade=10, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+        inicio = timezone.now() + timedelta(days=2)
+        cls.reserva = Reserva.objects.create(
+            sala=cls.sala, usuario=cls.user, data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(hours=1),
+        )
+
+    def _url(self, usuario, sala=None):
+        from django.urls import reverse
+        from .calendario import token_feed
+
+        if sala is None:
+            return reverse("calendario_usuario", args=[usuario.pk, token_feed(usuario)])
+        return reverse("calendario_sala", args=[usuario.pk, token_feed(usuario), sala.pk])
+
+    def _corpo(self, response):
+        return b"".join(response.streaming_content if response.streaming else [response.content]).decode()
+
+    def test_feed_do_usuario_e_304(self):
+        response = self.client.get(self._url(self.user))
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        corpo = self._corpo(response)
+        self.assertTrue(corpo.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertIn(f"UID:reserva-{self.reserva.pk}@testserver", corpo)
+        self.assertIn(r"LOCATION:Sala 1\, Bloco\; A", corpo)
+        self.assertTrue(all(len(linha.encode()) <= 75 for linha in corpo.split("\r\n")))
+
+        # Com o ETag, a consulta só valida o token: nenhuma leitura de reservas
+        with self.assertNumQueries(1):
+            condicional = self.client.get(self._url(self.user), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(condicional.status_code, 304)
+        # Sem alterações, o corpo sai do cache
+        with self.assertNumQueries(1):
+            self.assertEqual(self._corpo(self.client.get(self._url(self.user))), corpo)
+
+    def test_alteracao_invalida_so_os_escopos_afetados(self):
+        etag_usuario = self.client.get(self._url(self.user))["ETag"]
+        etag_outra_sala = self.client.get(self._url(self.user, self.outra_sala))["ETag"]
+
+        self.reserva.data_hora_fim += timedelta(minutes=30)
+        self.reserva.save()
+
+        mudou = self.client.get(self._url(self.user), HTTP_IF_NONE_MATCH=etag_usuario)
+        self.assertEqual(mudou.status_code, 200)
+        igual = self.client.get(self._url(self.user, self.outra_sala), HTTP_IF_NONE_MATCH=etag_outra_sala)
+        self.assertEqual(igual.status_code, 304)
+
+    def test_sala_esconde_usuario_e_token_invalido(self):
+        corpo = self._corpo(self.client.get(self._url(self.outro, self.sala)))
+        self.assertIn("SUMMARY:Reservada\r\n", corpo)
+        self.assertNotIn("aluno_ics", corpo)
+
+        response = self.client.get(self._url(self.user).replace(f"/{self.user.pk}/", f"/{self.outro.pk}/"))
+        self.assertEqual(response.status_code, 404)
+
+
+class ReservaLoteTest(TestCase):
+    """Reserva em lote (staff): validação com consultas fixas, tudo ou nada e bulk_create."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.staff = User.objects.create_user(username="staff_lote", password="pass", is_staff=True)
+        User.objects.create_user(username="aluno_lote", password="pass")
+        cls.salas = [
+            Sala.objects.create(nome=f"Lote {i:02d}", capacidade=40, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+            for i in range(12)
+        ]
+        cls.inicio = timezone.localtime().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def _itens(self, salas, **extra):
+        return [
+            {
+                "sala": sala.pk,
+                "data_hora_inicio": self.inicio.isoformat(),
+                "data_hora_fim": (self.inicio + timedelta(hours=3)).isoformat(),
+                "quantidade_pessoas": 30,
+                **extra,
+            }
+            for sala in salas
+        ]
+
+    def _postar(self, itens):
+        import json
+
+        return self.client.post("/reservas/lote/", json.dumps({"reservas": itens}), content_type="application/json")
+
+    def test_cria_lote_com_consultas_constantes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .forms import ReservaLoteForm
+
+        contagens = []
+        for salas in (self.salas[:2], self.salas):
+            form = ReservaLoteForm({"reservas": self._itens(salas)}, usuario=self.staff)
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertTrue(form.is_valid(), form.erros_itens)
+            contagens.append(len(consultas))
+        self.assertEqual(contagens, [3, 3])
+
+        self.client.login(username="staff_lote", password="pass")
+        response = self._postar(self._itens(self.salas))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["criadas"]), 12)
+        self.assertEqual(Reserva.objects.filter(usuario=self.staff).count(), 12)
+
+    def test_tudo_ou_nada(self):
+        Reserva.objects.create(
+            sala=self.salas[3], data_hora_inicio=self.inicio + timedelta(hours=1),
+            data_hora_fim=self.inicio + timedelta(hours=2),
+        )
+        itens = self._itens(self.salas[:5])
+        itens[1]["quantidade_pessoas"] = 41
+        itens.append(dict(itens[0]))
+        itens.append({"sala": 999999, "data_hora_inicio": "x"})
+
+        self.client.login(username="staff_lote", password="pass")
+        response = self._postar(itens)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["erros"]), {"6"})
+
+        del itens[6]
+        response = self._postar(itens)
+        self.assertEqual(response.status_code, 400)
+        erros = response.json()["erros"]
+        self.assertEqual(set(erros), {"1", "3", "5"})
+        self.assertIn("capacidade", erros["1"][0])
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_conflito_depois_da_validacao(self):
+        from .forms import ReservaLoteForm
+
+        form = ReservaLoteForm({"reservas": self._itens(self.salas[:3])}, usuario=self.staff)
+        self.assertTrue(form.is_valid())
+        Reserva.objects.create(
+            sala=self.salas[2], data_hora_inicio=self.inicio, data_hora_fim=self.inicio + timedelta(hours=1),
+        )
+        self.assertIsNone(form.criar_reservas())
+        self.assertEqual(list(form.erros_itens), [2])
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_reservas_simples_e_recorrentes_usam_a_mesma_trava(self):
+        from django.db import transaction
+        from django.test.utils import CaptureQueriesContext
+        from .forms import ReservaForm, ReservaRecorrenteForm
+
+        sala = self.salas[0]
+        simples = ReservaForm({
+            "sala": sala.pk,
+            "data_hora_inicio": self.inicio.strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": (self.inicio + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M"),
+            "quantidade_pessoas": 5,
+        }, usuario=self.staff)
+        recorrente = ReservaRecorrenteForm({
+            "sala": sala.pk,
+            "dia_da_semana": self.inicio.weekday(),
+            "hora_inicio": "09:00",
+            "hora_fim": "10:00",
+            "data_inicio_recorrencia": self.inicio.date().isoformat(),
+            "num_semanas": 2,
+            "quantidade_pessoas": 5,
+        }, usuario=self.staff)
+        self.assertTrue(simples.is_valid(), simples.errors)
+        self.assertTrue(recorrente.is_valid(), recorrente.errors)
+
+        # Outra gravação entra na sala depois da validação dos dois formulários
+        Reserva.objects.create(sala=sala, data_hora_inicio=self.inicio, data_hora_fim=self.inicio + timedelta(hours=1))
+        with transaction.atomic(), CaptureQueriesContext(connection) as consultas:
+            self.assertFalse(simples.travar_sala())
+        self.assertIn("Já existe uma reserva", simples.non_field_errors()[0])
+        # Sem FOR UPDATE no SQLite; a trava aparece como o SELECT da sala antes de RN-06
+        self.assertIn('FROM "webapp_sala"', consultas[-2]["sql"])
+        self.assertIsNone(recorrente.criar_reservas(self.staff))
+        self.assertIn("Já existe uma reserva", recorrente.non_field_errors()[0])
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_somente_staff(self):
+        self.client.login(username="aluno_lote", password="pass")
+        self.assertEqual(self._postar(self._itens(self.salas[:1])).status_code, 403)
+
+
+class AlocacaoSalasTest(TestCase):
+    """Alocação de salas do semestre: menor ociosidade, sem conflitos, com reservas existentes respeitadas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.auditorio = Sala.objects.create(
+            nome="Auditório Aloc", tipo="auditorio", capacidade=200, hora_inicio=time(7, 0), hora_fim=time(22, 0)
+        )
+        cls.pequena = Sala.objects.create(
+            nome="Pequena Aloc", capacidade=20, hora_inicio=time(7, 0), hora_fim=time(22, 0)
+        )
+        cls.laboratorio = Sala.objects.create(
+            nome="Lab Aloc", tipo="laboratorio", capacidade=30, hora_inicio=time(7, 0), hora_fim=time(12, 0)
+        )
+
+    def _aula(self, turma, pessoas, inicio, fim, dia=0, tipo=None):
+        return {"turma": turma, "dia": dia, "inicio": time(inicio), "fim": time(fim), "pessoas": pessoas, "tipo": tipo}
+
+    def test_hungaro_otimo(self):
+        import numpy as np
+        from .alocacao import hungaro
+
+        custos = np.array([[4.0, 1, 3], [2, 0, 5], [3, 2, 2]])
+        atribuicao = hungaro(custos)
+        self.assertEqual(custos[np.arange(3), atribuicao].sum(), 5)
+
+    def test_minimiza_ociosidade_e_reporta_sem_sala(self):
+        from .alocacao import MOTIVO_OCUPADAS, MOTIVO_SEM_SALA, alocar
+
+        aulas = [
+            self._aula("pequena", 15, 8, 10),
+            self._aula("grande", 180, 8, 10),
+            self._aula("depois", 18, 10, 12),
+            self._aula("sem_lugar", 19, 9, 13),
+            self._aula("enorme", 250, 14, 16),
+        ]
+        alocadas, nao_alocadas = alocar(aulas, Sala.objects.all())
+        resultado = {aula["turma"]: sala.nome for aula, sala in alocadas}
+        self.assertEqual(resultado["grande"], "Auditório Aloc")
+        self.assertEqual(resultado["pequena"], "Pequena Aloc")
+        # A sala pequena fica livre às 10h e é reaproveitada
+        self.assertEqual(resultado["depois"], "Pequena Aloc")
+        self.assertEqual(dict((a["turma"], m) for a, m in nao_alocadas), {
+            "sem_lugar": MOTIVO_OCUPADAS, "enorme": MOTIVO_SEM_SALA,
+        })
+
+    def test_respeita_reservas_existentes_e_horario(self):
+        from .alocacao import alocar, ocupacao_existente
+
+        segunda = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        inicio = timezone.make_aware(datetime.combine(segunda + timedelta(weeks=2), time(8, 0)))
+        Reserva.objects.create(sala=self.pequena, data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(hours=1))
+
+        ocupados = ocupacao_existente(segunda, semanas=4)
+        aulas = [self._aula("manha", 15, 8, 10), self._aula("tarde", 25, 13, 15, tipo="laboratorio")]
+        alocadas, _ = alocar(aulas, Sala.objects.all(), ocupados)
+        resultado = {aula["turma"]: sala.nome for aula, sala in alocadas}
+        # A pequena tem reserva às 8h em uma das semanas; o laboratório fecha às 12h
+        self.assertEqual(resultado["manha"], "Lab Aloc")
+        self.assertEqual(resultado["tarde"], "Auditório Aloc")
+
+
+class VerificarReservasTest(TestCase):
+    """Varredura de integridade: sobreposições (RN-06), fora do horário (RN-07) e capacidade (RN-03)."""
+
+    def _verificar(self, **opcoes):
+        from io import StringIO
+        from django.core.management import call_command
+
+        saida = StringIO()
+        call_command("verificar_reservas", stdout=saida, **opcoes)
+        return saida.getvalue()
+
+    def test_tabela_integra(self):
+        sala = Sala.objects.create(nome="Sala Íntegra", capacidade=30, hora_inicio=time(7, 0), hora_fim=time(22, 0))
+        Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(10))
+        Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(10), data_hora_fim=_amanha_as(12))
+        self.assertIn("2 reservas verificadas — RN-06: 0, RN-07: 0, RN-03: 0", self._verificar())
+
+    def test_aponta_violacoes_e_grava_plano(self):
+        import csv
+        import os
+        import tempfile
+
+        sala = Sala.objects.create(nome="Sala Suja", capacidade=10, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        outra = Sala.objects.create(nome="Sala Vizinha", capacidade=10, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        longa = Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(13))
+        meio = Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(10), data_hora_fim=_amanha_as(11))
+        fim = Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(12), data_hora_fim=_amanha_as(14))
+        cedo = Reserva.objects.create(
+            sala=sala, data_hora_inicio=_amanha_as(6), data_hora_fim=_amanha_as(7), quantidade_pessoas=12
+        )
+        # Mesmo horário em outra sala não é sobreposição
+        Reserva.objects.create(sala=outra, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(13))
+
+        descritor, caminho = tempfile.mkstemp(suffix=".csv")
+        os.close(descritor)
+        self.addCleanup(os.remove, caminho)
+        relatorio = self._verificar(plano=caminho)
+        self.assertIn("5 reservas verificadas — RN-06: 2, RN-07: 1, RN-03: 1", relatorio)
+        self.assertIn(f"RN-06 reserva {meio.pk} (Sala Suja", relatorio)
+        self.assertIn(f"sobrepõe a reserva {longa.pk}", relatorio)
+
+        with open(caminho, encoding="utf-8") as arquivo:
+            plano = {(linha["acao"], int(linha["reserva"]), linha["regra"]) for linha in csv.DictReader(arquivo)}
+        # A mais antiga (longa) fica; as que conflitam com ela são canceladas. A cancelada
+        # por estar fora do horário não recebe também a redução de pessoas
+        self.assertEqual(plano, {
+            ("cancelar", meio.pk, "RN-06"),
+            ("cancelar", fim.pk, "RN-06"),
+            ("cancelar", cedo.pk, "RN-07"),
+        })
+
+        self.assertIn("1 reservas verificadas", self._verificar(sala=outra.pk))
+
+    def test_plano_sem_acoes_repetidas_ou_contraditorias(self):
+        import csv
+        import os
+        import tempfile
+
+        sala = Sala.objects.create(nome="Sala Plano", capacidade=10, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        lotada = Reserva.objects.create(
+            sala=sala, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(11), quantidade_pessoas=12
+        )
+        Reserva.objects.create(
+            sala=sala, data_hora_inicio=_amanha_as(10), data_hora_fim=_amanha_as(12), check_in_realizado=True
+        )
+        cedo = Reserva.objects.create(sala=sala, data_hora_inicio=_amanha_as(7), data_hora_fim=_amanha_as(11))
+
+        descritor, caminho = tempfile.mkstemp(suffix=".csv")
+        os.close(descritor)
+        self.addCleanup(os.remove, caminho)
+        self._verificar(plano=caminho)
+        with open(caminho, encoding="utf-8") as arquivo:
+            plano = [(linha["acao"], int(linha["reserva"]), linha["regra"]) for linha in csv.DictReader(arquivo)]
+        # A fora do horário só é cancelada uma vez e não derruba a lotada; a lotada perde
+        # para a que teve check-in, e a redução de pessoas sai do plano
+        self.assertEqual(plano, [("cancelar", cedo.pk, "RN-07"), ("cancelar", lotada.pk, "RN-06")])
+
+
+class AuditoriaReservasTest(TestCase):
+    """Auditoria das reservas: registros das views após o commit e gravação em lote pela thread."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.user = User.objects.create_user(username="user_auditoria", password="pass")
+        cls.admin = User.objects.create_user(username="admin_auditoria", password="pass", is_staff=True)
+        cls.sala = Sala.objects.create(nome="Sala Auditoria", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+
+    def _historico(self, reserva_id):
+        from .models import RegistroAuditoria
+
+        return list(RegistroAuditoria.objects.da_reserva(reserva_id).values_list("acao", "usuario__username"))
+
+    def test_criar_alterar_checkin_e_cancelar(self):
+        from .models import RegistroAuditoria
+
+        self.client.login(username="user_auditoria", password="pass")
+        dados = {
+            "sala": self.sala.pk,
+            "data_hora_inicio": _amanha_as(9).strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": _amanha_as(10).strftime("%Y-%m-%dT%H:%M"),
+            "quantidade_pessoas": 5,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/reservas/nova/", dados)
+        reserva = Reserva.objects.get()
+        registro = RegistroAuditoria.objects.get()
+        self.assertEqual((registro.acao, registro.usuario, registro.reserva_id), ("criada", self.user, reserva.pk))
+        self.assertEqual(registro.dados["quantidade_pessoas"], 5)
+
+        self.client.login(username="admin_auditoria", password="pass")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                f"/reservas/{reserva.pk}/editar/", {**dados, "quantidade_pessoas": 8, "versao": reserva.versao}
+            )
+        self.assertEqual(RegistroAuditoria.objects.da_reserva(reserva.pk)[0].dados["campos"], ["quantidade_pessoas"])
+
+        agora = timezone.now()
+        Reserva.objects.filter(pk=reserva.pk).update(
+            data_hora_inicio=agora + timedelta(minutes=5), data_hora_fim=agora + timedelta(minutes=65)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/reservas/{reserva.pk}/checkin/")
+        Reserva.objects.filter(pk=reserva.pk).update(data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(10))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/reservas/{reserva.pk}/cancelar/")
+        self.assertFalse(Reserva.objects.exists())
+
+        self.assertEqual(self._historico(reserva.pk), [
+            ("cancelada", "admin_auditoria"),
+            ("checkin", "admin_auditoria"),
+            ("alterada", "admin_auditoria"),
+            ("criada", "user_auditoria"),
+        ])
+        self.assertEqual(RegistroAuditoria.objects.do_usuario(self.user).count(), 1)
+
+    def test_sem_commit_nao_registra(self):
+        from django.db import transaction
+        from .auditoria import registrar
+        from .models import RegistroAuditoria
+
+        reserva = Reserva.objects.create(sala=self.sala, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(10))
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    registrar("cancelada", [reserva], self.user)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(RegistroAuditoria.objects.exists())
+
+    def test_thread_grava_em_lotes_e_encerrar_descarrega(self):
+        import threading
+        from unittest import mock
+        from django.test import override_settings
+        from . import auditoria
+
+        lotes = []
+        gravou = threading.Event()
+
+        def gravar(registros):
+            lotes.append([r.reserva_id for r in registros])
+            gravou.set()
+
+        with override_settings(AUDITORIA_ASSINCRONA=True, AUDITORIA_LOTE=2, AUDITORIA_INTERVALO_MS=60000), \
+                mock.patch.object(auditoria, "_gravar", gravar):
+            with self.captureOnCommitCallbacks(execute=True):
+                auditoria.registrar("checkin", [1, 2, 3], self.user)
+            self.assertTrue(gravou.wait(2))
+            auditoria.encerrar()
+        # O lote cheio sai na hora; o 3 estava com a thread, à espera do intervalo
+        self.assertEqual(lotes, [[1, 2], [3]])
+
+
+class PredioEscopoTest(TestCase):
+    """Prédios: painéis, busca e relatórios restritos ao prédio em foco, com cache por prédio."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        from .models import PerfilUsuario, Predio
+
+        cls.norte = Predio.objects.create(nome="Bloco Norte", campus="Centro")
+        cls.sul = Predio.objects.create(nome="Bloco Sul", campus="Centro")
+        cls.sala_norte = Sala.objects.create(
+            nome="Norte 101", predio=cls.norte, capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59)
+        )
+        cls.sala_sul = Sala.objects.create(
+            nome="Sul 201", predio=cls.sul, capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59)
+        )
+        cls.admin = User.objects.create_user(username="admin_predio", password="pass", is_staff=True)
+        PerfilUsuario.objects.create(user=cls.admin, nome_completo="Admin Prédio", predio_padrao=cls.norte)
+
+    def setUp(self):
+        self.client.login(username="admin_predio", password="pass")
+
+    def _nomes(self, salas):
+        return sorted(sala.nome for sala in salas)
+
+    def test_dashboard_usa_predio_padrao_e_escolha_fica_na_sessao(self):
+        response = self.client.get("/dashboard/")
+        self.assertEqual(self._nomes(response.context["salas_disponiveis"]), ["Norte 101"])
+        self.assertEqual(response.context["predio_id"], self.norte.pk)
+
+        response = self.client.get("/dashboard/", {"predio": self.sul.pk})
+        self.assertEqual(self._nomes(response.context["salas_disponiveis"]), ["Sul 201"])
+        response = self.client.get("/dashboard/")
+        self.assertEqual(response.context["predio_id"], self.sul.pk)
+
+        response = self.client.get("/dashboard/", {"predio": "todos"})
+        self.assertEqual(self._nomes(response.context["salas_disponiveis"]), ["Norte 101", "Sul 201"])
+
+    def test_salas_disponiveis_e_relatorio_por_predio(self):
+        inicio = _amanha_as(10).strftime("%Y-%m-%dT%H:%M")
+        fim = _amanha_as(11).strftime("%Y-%m-%dT%H:%M")
+        response = self.client.get("/salas/disponiveis/", {"inicio": inicio, "fim": fim, "predio": self.sul.pk})
+        self.assertEqual(self._nomes(response.context["salas_disponiveis"]), ["Sul 201"])
+
+        Reserva.objects.create(sala=self.sala_norte, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(9))
+        Reserva.objects.create(sala=self.sala_sul, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(9))
+        response = self.client.get("/relatorio-ocupacao/", {"predio": self.norte.pk})
+        self.assertEqual([linha["sala_nome"] for linha in response.context["linhas"]], ["Norte 101"])
+        self.assertEqual(self._nomes(response.context["salas"]), ["Norte 101"])
+
+    def test_cache_particionado_por_predio(self):
+        from .cache import versao_reservas
+
+        norte, sul, todos = versao_reservas(self.norte.pk), versao_reservas(self.sul.pk), versao_reservas()
+        Reserva.objects.create(sala=self.sala_norte, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(9))
+        # Uma reserva no Norte não invalida os caches do Sul
+        self.assertNotEqual(versao_reservas(self.norte.pk), norte)
+        self.assertEqual(versao_reservas(self.sul.pk), sul)
+        self.assertNotEqual(versao_reservas(), todos)
+
+        # Check-in por queryset: prédio desconhecido, invalida todos
+        from .signals import reservas_alteradas
+        reservas_alteradas(Reserva.objects.all())
+        self.assertNotEqual(versao_reservas(self.sul.pk), sul)
+
+    def test_reserva_trocada_de_predio_invalida_os_dois(self):
+        from .cache import versao_reservas
+
+        reserva = Reserva.objects.create(sala=self.sala_norte, data_hora_inicio=_amanha_as(8), data_hora_fim=_amanha_as(9))
+        norte, sul = versao_reservas(self.norte.pk), versao_reservas(self.sul.pk)
+        reserva.sala = self.sala_sul
+        self.assertTrue(reserva.salvar_se_versao(reserva.versao, ["sala"]))
+        self.assertNotEqual(versao_reservas(self.norte.pk), norte)
+        self.assertNotEqual(versao_reservas(self.sul.pk), sul)
+
+        # Sem trocar de sala, nenhuma consulta a mais e o prédio antigo não muda
+        norte = versao_reservas(self.norte.pk)
+        with self.assertNumQueries(1):
+            reserva.save(update_fields=["quantidade_pessoas"])
+        self.assertEqual(versao_reservas(self.norte.pk), norte)
+
+
+class IdempotenciaReservaTest(TestCase):
+    """Tokens de idempotência: reenvios do mesmo formulário devolvem a resposta original sem regravar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.user = User.objects.create_user(username="user_idem", password="pass")
+        cls.sala = Sala.objects.create(nome="Sala Idem", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+
+    def setUp(self):
+        self.client.login(username="user_idem", password="pass")
+
+    def _dados(self, token, **extras):
+        return {
+            "sala": self.sala.pk,
+            "data_hora_inicio": _amanha_as(9).strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": _amanha_as(10).strftime("%Y-%m-%dT%H:%M"),
+            "quantidade_pessoas": 5,
+            "token_idempotencia": token,
+            **extras,
+        }
+
+    def test_reenvio_devolve_resultado_original(self):
+        token = self.client.get("/reservas/nova/").context["token_idempotencia"]
+        primeira = self.client.post("/reservas/nova/", self._dados(token))
+        self.assertRedirects(primeira, "/dashboard/", fetch_redirect_response=False)
+
+        # Sessão e usuário; nenhuma validação nem INSERT
+        with self.assertNumQueries(2):
+            repetida = self.client.post("/reservas/nova/", self._dados(token))
+        self.assertRedirects(repetida, "/dashboard/", fetch_redirect_response=False)
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertContains(self.client.get(repetida["Location"]), "Reserva criada com sucesso.")
+
+        # Outro token é outro envio: agora esbarra no conflito de horário (RN-06)
+        novo = self.client.get("/reservas/nova/").context["token_idempotencia"]
+        outra = self.client.post("/reservas/nova/", self._dados(novo))
+        self.assertEqual(outra.status_code, 200)
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_erro_libera_token_e_envio_em_andamento(self):
+        from django.core.cache import cache
+        from .idempotencia import EM_ANDAMENTO, novo_token
+
+        token = novo_token()
+        invalida = self.client.post("/reservas/nova/", self._dados(token, quantidade_pessoas=99))
+        self.assertEqual(invalida.status_code, 200)
+        self.assertEqual(invalida.context["token_idempotencia"], token)
+        # Corrigido, o mesmo token é aceito
+        self.client.post("/reservas/nova/", self._dados(token))
+        self.assertEqual(Reserva.objects.count(), 1)
+
+        emperrado = novo_token()
+        cache.set(f"idempotencia:reserva:{self.user.pk}:{emperrado}", EM_ANDAMENTO)
+        response = self.client.post("/reservas/nova/", self._dados(emperrado), follow=True)
+        self.assertContains(response, "ainda está sendo processada")
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_recorrente(self):
+        amanha = timezone.localdate() + timedelta(days=1)
+        token = self.client.get("/reservas/recorrente/").context["token_idempotencia"]
+        dados = {
+            "sala": self.sala.pk,
+            "dia_da_semana": amanha.weekday(),
+            "hora_inicio": "09:00",
+            "hora_fim": "10:00",
+            "data_inicio_recorrencia": amanha.isoformat(),
+            "num_semanas": 2,
+            "quantidade_pessoas": 5,
+            "token_idempotencia": token,
+        }
+        self.client.post("/reservas/recorrente/", dados)
+        self.client.post("/reservas/recorrente/", dados)
+        self.assertEqual(Reserva.objects.count(), 2)
+
+    def test_grava_so_as_mensagens_da_view(self):
+        from django.contrib import messages
+        from django.core.cache import cache
+
+        token = self.client.get("/reservas/nova/").context["token_idempotencia"]
+        self.client.post("/reservas/nova/", self._dados(token))
+        guardada = cache.get(f"idempotencia:reserva:{self.user.pk}:{token}")
+        self.assertEqual(guardada["mensagens"], [(messages.SUCCESS, "Reserva criada com sucesso.", "")])
+
+
+class ConcorrenciaOtimistaTest(TestCase):
+    """Versão em Reserva e Sala: a segunda edição concorrente perde, sem travas longas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="admin_versao", password="pass", is_staff=True)
+        cls.sala = Sala.objects.create(nome="Sala Versão", capacidade=30, hora_inicio=time(0, 0), hora_fim=time(23, 59))
+
+    def setUp(self):
+        self.client.login(username="admin_versao", password="pass")
+
+    def test_cas_e_gravacao_sem_versao(self):
+        reserva = Reserva.objects.create(sala=self.sala, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(10))
+        self.assertEqual(reserva.versao, 1)
+
+        primeira, segunda = Reserva.objects.get(pk=reserva.pk), Reserva.objects.get(pk=reserva.pk)
+        primeira.quantidade_pessoas = 5
+        self.assertTrue(primeira.salvar_se_versao(1, ["quantidade_pessoas"]))
+        segunda.quantidade_pessoas = 9
+        self.assertFalse(segunda.salvar_se_versao(1, ["quantidade_pessoas"]))
+        reserva.refresh_from_db()
+        self.assertEqual((reserva.quantidade_pessoas, reserva.versao), (5, 2))
+
+        # save() comum (admin, scripts) também avança a versão, no próprio banco
+        segunda.save()
+        self.assertEqual(segunda.versao, 3)
+
+    def test_formularios_concorrentes(self):
+        reserva = Reserva.objects.create(sala=self.sala, data_hora_inicio=_amanha_as(9), data_hora_fim=_amanha_as(10))
+        dados = {
+            "sala": self.sala.pk,
+            "data_hora_inicio": _amanha_as(9).strftime("%Y-%m-%dT%H:%M"),
+            "data_hora_fim": _amanha_as(10).strftime("%Y-%m-%dT%H:%M"),
+            "versao": self.client.get(f"/reservas/{reserva.pk}/editar/").context["form"]["versao"].value(),
+        }
+        self.client.post(f"/reservas/{reserva.pk}/editar/", {**dados, "quantidade_pessoas": 4})
+        response = self.client.post(f"/reservas/{reserva.pk}/editar/", {**dados, "quantidade_pessoas": 7})
+        self.assertContains(response, "alterado por outra pessoa")
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).quantidade_pessoas, 4)
+
+        dados_sala = {"nome": "Sala Versão", "tipo": "comum", "hora_inicio": "00:00", "hora_fim": "23:59", "versao": 1}
+        self.assertRedirects(
+            self.client.post(f"/salas/{self.sala.pk}/editar/", {**dados_sala, "capacidade": 40}),
+            "/dashboard/", fetch_redirect_response=False,
+        )
+        response = self.client.post(f"/salas/{self.sala.pk}/editar/", {**dados_sala, "capacidade": 50})
+        self.assertContains(response, "alterado por outra pessoa")
+        self.assertEqual(Sala.objects.get(pk=self.sala.pk).capacidade, 40)
+
+
+class CalendarioAcademicoTest(TestCase):
+    """Denominador das taxas de ocupação: só dias letivos, somados na tabela de disponibilidade."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from .models import DiaCalendario
+
+        cls.sala = Sala.objects.create(nome="Sala Calendário", capacidade=30, hora_inicio=time(8, 0), hora_fim=time(18, 0))
+        # Semana de 02/03/2026 (segunda) a 08/03/2026 (domingo), com feriado na terça
+        cls.segunda = datetime(2026, 3, 2).date()
+        cls.domingo = datetime(2026, 3, 8).date()
+        DiaCalendario.objects.create(data=datetime(2026, 3, 3).date(), tipo="feriado", descricao="Carnaval")
+
+    def _disponivel(self):
+        from .calendario_academico import minutos_disponiveis
+
+        horarios = {self.sala.pk: (self.sala.hora_inicio, self.sala.hora_fim)}
+        return minutos_disponiveis(self.segunda, self.domingo, horarios)[self.sala.pk]
+
+    def test_feriados_e_fim_de_semana_fora_do_denominador(self):
+        from .views import _calcular_taxa_ocupacao
+
+        self.assertEqual(self._disponivel(), 4 * 600)
+        inicio = timezone.make_aware(datetime(2026, 3, 2, 8, 0))
+        Reserva.objects.create(sala=self.sala, data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(hours=4))
+        taxa = _calcular_taxa_ocupacao(self.sala, inicio.replace(hour=0), inicio.replace(hour=0) + timedelta(days=7))
+        self.assertEqual(taxa, 10.0)
+
+    def _na_tabela(self):
+        from django.db.models import Sum
+        from .models import DisponibilidadeSala
+
+        return DisponibilidadeSala.objects.filter(sala=self.sala).aggregate(total=Sum("minutos"))["total"]
+
+    def test_leitura_nao_grava_e_soma_em_uma_consulta(self):
+        from .calendario_academico import gerar_disponibilidade
+        from .models import DisponibilidadeSala
+
+        self.assertEqual(self._disponivel(), 4 * 600)
+        self.assertFalse(DisponibilidadeSala.objects.exists())
+
+        gerar_disponibilidade(self.segunda, self.domingo)
+        self.assertEqual(DisponibilidadeSala.objects.filter(sala=self.sala).count(), 7)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._disponivel(), 4 * 600)
+
+    def test_mudancas_refazem_os_dias_gravados(self):
+        from .calendario_academico import gerar_disponibilidade
+        from .models import BloqueioManutencao, DiaCalendario
+
+        gerar_disponibilidade(self.segunda, self.domingo)
+        # Reposição no sábado
+        with self.captureOnCommitCallbacks(execute=True):
+            DiaCalendario.objects.create(data=datetime(2026, 3, 7).date(), tipo="letivo")
+        self.assertEqual(self._na_tabela(), 5 * 600)
+
+        # Novo horário da sala: 8h às 12h
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sala.hora_fim = time(12, 0)
+            self.sala.save()
+        self.assertEqual(self._na_tabela(), 5 * 240)
+
+        # RN-24: duas horas de manutenção na segunda
+        with self.captureOnCommitCallbacks(execute=True):
+            bloqueio = BloqueioManutencao.objects.create(
+                inicio=timezone.make_aware(datetime(2026, 3, 2, 10, 0)),
+                fim=timezone.make_aware(datetime(2026, 3, 2, 14, 0)),
+                motivo="Pintura",
+            )
+            bloqueio.salas.add(self.sala)
+        self.assertEqual(self._na_tabela(), 5 * 240 - 120)
+        with self.captureOnCommitCallbacks(execute=True):
+            bloqueio.delete()
+        self.assertEqual(self._na_tabela(), 5 * 240)
+        self.assertEqual(self._disponivel(), 5 * 240)
+
+    def test_so_o_horario_refaz_e_sem_preencher_lacunas(self):
+        from .calendario_academico import gerar_disponibilidade
+        from .models import DisponibilidadeSala
+
+        # Só a segunda e o domingo gravados; a semana no meio fica para a leitura
+        gerar_disponibilidade(self.segunda, self.segunda)
+        gerar_disponibilidade(self.domingo, self.domingo)
+
+        # Nome e versão não mudam o tempo disponível: nada é refeito
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.sala.nome = "Sala Calendário 2"
+            self.sala.save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sala.hora_fim = time(12, 0)
+            self.sala.save()
+        self.assertEqual(
+            sorted(DisponibilidadeSala.objects.filter(sala=self.sala).values_list("data", "minutos")),
+            [(self.segunda, 240), (self.domingo, 0)],
+        )
+
+    def test_mapa_de_calor_usa_o_calendario(self):
+        from .ocupacao import calcular_mapa_calor
+
+        inicio = timezone.make_aware(datetime(2026, 3, 3, 10, 0))
+        Reserva.objects.create(sala=self.sala, data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(hours=1))
+        terca = calcular_mapa_calor(self.segunda, self.domingo)["tipos"]["comum"]["ocupacao"][1]
+        # Feriado: sem tempo disponível na terça, como nas taxas do painel
+        self.assertEqual(terca[10], 0)
+
+    def test_comando_gera_o_periodo(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import DisponibilidadeSala
+
+        saida = StringIO()
+        call_command("gerar_disponibilidade", "--inicio", "2026-03-02", "--dias", "7", stdout=saida)
+        self.assertIn("1 sala(s) de 02/03/2026 a 08/03/2026: 40 h disponíveis.", saida.getvalue())
+        self.assertEqual(DisponibilidadeSala.objects.filter(minutos__gt=0).count(), 4)
@@ -1,62 +1,295 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
-from django.contrib.auth import login
+from django.template.backends.utils import csrf_input
+from django.template.loader import render_to_string
+from django.contrib.auth import get_user_model, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView, LogoutView
 from django.utils import timezone
+from django.conf import settings
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import CreateView, DeleteView, View, UpdateView, ListView
 from django.contrib.auth.mixins import UserPassesTestMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
-from datetime import timedelta, datetime, date
-from django.db.models import Sum, ExpressionWrapper, F, DurationField
-
-from .forms import RegistroForm, SalaForm, ReservaForm, ReservaRecorrenteForm
-from .models import Sala, Reserva
+from datetime import timedelta, datetime, date, time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, Count, Q, ExpressionWrapper, F, DurationField
+from django.db.models.functions import TruncDate
+
+from .auditoria import registrar
+from .cache import versao_reservas
+from .calendario import feed_sala, feed_usuario, token_feed, token_valido
+from .calendario_academico import minutos_disponiveis
+from .eventos import estado_para_consulta, fluxo_eventos, publicar_reservas
+from .forms import RegistroForm, SalaForm, ReservaForm, ReservaLoteForm, ReservaRecorrenteForm
+from .idempotencia import idempotente, token_do_formulario
+from .limites import limitar
+from .models import JANELA_CHECKIN, BloqueioManutencao, PerfilUsuario, Predio, Sala, Reserva
+from .ocupacao import MAX_DIAS_MAPA, calcular_mapa_calor
+from .routers import PRIMARIO, leitura_replica
+from .signals import reservas_alteradas
 
 
 # -------------------------
 # Helpers para RN-19 / RN-20
 # -------------------------
 
+def _dias_do_intervalo(inicio, fim):
+    """Primeiro e último dia locais do intervalo ``[inicio, fim)``."""
+    return timezone.localdate(inicio), timezone.localdate(fim - timedelta(microseconds=1))
+
+
+def _taxas_ocupacao(salas, data_inicio, data_fim):
+    """
+    Taxa de ocupação (0 a 100) de cada sala em um intervalo de dias inteiros
+    ``[data_inicio, data_fim)``: ``{sala_id: taxa}``, em duas consultas para
+    qualquer número de salas.
+
+    O denominador vem da tabela de disponibilidade (calendário acadêmico,
+    horário da sala e bloqueios RN-24); o numerador soma as reservas do
+    período, carregadas de uma vez e recortadas ao intervalo.
+    """
+    horarios = {sala.id: (sala.hora_inicio, sala.hora_fim) for sala in salas}
+    disponivel = minutos_disponiveis(*_dias_do_intervalo(data_inicio, data_fim), horarios)
+
+    reservado = dict.fromkeys(horarios, 0)
+    for sala_id, inicio, fim in Reserva.objects.sobrepostas(data_inicio, data_fim).filter(
+        sala_id__in=list(horarios)
+    ).values_list("sala_id", "data_hora_inicio", "data_hora_fim"):
+        inicio_efetivo = max(inicio, data_inicio)
+        fim_efetivo = min(fim, data_fim)
+        if fim_efetivo > inicio_efetivo:
+            reservado[sala_id] += (fim_efetivo - inicio_efetivo).total_seconds() / 60
+
+    return {
+        sala_id: min(round(minutos / disponivel[sala_id] * 100, 1), 100) if disponivel.get(sala_id, 0) > 0 else 0
+        for sala_id, minutos in reservado.items()
+    }
+
+
 def _calcular_taxa_ocupacao(sala, data_inicio, data_fim):
+    """Taxa de ocupação de uma única sala no intervalo; veja ``_taxas_ocupacao``."""
+    return _taxas_ocupacao([sala], data_inicio, data_fim)[sala.id]
+
+
+# -------------------------
+# Helpers para RN-18 (resumo do relatório)
+# -------------------------
+
+RESUMO_DIAS_PADRAO = 30
+RESUMO_CACHE_TIMEOUT = 300  # segundos
+
+
+def _metricas_reservas(prefixo, filtro, limite_checkin):
+    """
+    Agregações usadas no resumo do relatório. ``prefixo`` é o caminho até a
+    reserva a partir do modelo consultado ("" para Reserva, "reservas__" para Sala).
+    """
+    duracao = ExpressionWrapper(
+        F(f"{prefixo}data_hora_fim") - F(f"{prefixo}data_hora_inicio"),
+        output_field=DurationField(),
+    )
+    pk = f"{prefixo}id"
+    return {
+        "total_reservas": Count(pk, filter=filtro),
+        "duracao_total": Sum(duracao, filter=filtro),
+        "checkins": Count(pk, filter=filtro & Q(**{f"{prefixo}check_in_realizado": True})),
+        # RN-12: sem check-in e com a janela de check-in já encerrada
+        "no_shows": Count(pk, filter=filtro & Q(**{
+            f"{prefixo}check_in_realizado": False,
+            f"{prefixo}data_hora_inicio__lte": limite_checkin,
+        })),
+    }
+
+
+def _completar_metricas(linha, minutos_disponiveis=None):
+    """Converte os agregados brutos em horas, taxa de check-in e taxa de ocupação."""
+    duracao = linha.get("duracao_total") or timedelta()
+    minutos_reservados = duracao.total_seconds() / 60
+    linha["horas_reservadas"] = round(minutos_reservados / 60, 1)
+    concluidas = linha["checkins"] + linha["no_shows"]
+    linha["taxa_checkin"] = round(linha["checkins"] / concluidas * 100, 1) if concluidas else None
+    if minutos_disponiveis is not None:
+        linha["taxa_ocupacao"] = (
+            min(round(minutos_reservados / minutos_disponiveis * 100, 1), 100)
+            if minutos_disponiveis > 0 else 0
+        )
+    return linha
+
+
+def _periodo_informado(request):
+    """Período (datas inclusivas) dos parâmetros GET; sem datas válidas, usa os últimos RESUMO_DIAS_PADRAO dias."""
+    def _data(nome):
+        try:
+            return date.fromisoformat(request.GET.get(nome, ''))
+        except ValueError:
+            return None
+
+    data_fim = _data('data_fim') or timezone.localdate()
+    data_inicio = _data('data_inicio') or data_fim - timedelta(days=RESUMO_DIAS_PADRAO - 1)
+    if data_inicio > data_fim:
+        data_inicio, data_fim = data_fim, data_inicio
+    return data_inicio, data_fim
+
+
+CHAVE_SESSAO_PREDIO = "predio"
+
+
+def _predio_escolhido(request):
     """
-    Calcula a taxa de ocupação de uma sala em um intervalo de datas.
-    Retorna um valor entre 0 e 100 (percentual).
+    Prédio em foco no painel: o ``?predio=`` da URL (guardado na sessão;
+    "todos" ou vazio para todos), senão o da sessão, senão o prédio padrão do
+    perfil. Retorna o id ou ``None`` para todos os prédios.
     """
-    # Janela total de disponibilidade da sala no intervalo (em minutos)
-    from datetime import datetime as dt
-    import math
-
-    # Número de dias no intervalo
-    delta = data_fim - data_inicio
-    num_dias = max(delta.days, 1)
-
-    # Minutos disponíveis por dia
-    sala_inicio_dt = dt.combine(date.today(), sala.hora_inicio)
-    sala_fim_dt = dt.combine(date.today(), sala.hora_fim)
-    minutos_disponiveis_dia = (sala_fim_dt - sala_inicio_dt).total_seconds() / 60
-    total_minutos_disponiveis = minutos_disponiveis_dia * num_dias
-
-    if total_minutos_disponiveis <= 0:
-        return 0
-
-    # Reservas no período
-    reservas = Reserva.objects.filter(
-        sala=sala,
-        data_hora_inicio__lt=data_fim,
-        data_hora_fim__gt=data_inicio,
+    if "predio" in request.GET:
+        valor = request.GET["predio"]
+        predio_id = int(valor) if valor.isdigit() else None
+        request.session[CHAVE_SESSAO_PREDIO] = predio_id
+        return predio_id
+    if CHAVE_SESSAO_PREDIO not in request.session:
+        request.session[CHAVE_SESSAO_PREDIO] = (
+            PerfilUsuario.objects.filter(user=request.user).values_list("predio_padrao_id", flat=True).first()
+        )
+    return request.session[CHAVE_SESSAO_PREDIO]
+
+
+def _chave_resumo(data_inicio, data_fim, sala_id=None, predio_id=None):
+    return "relatorio-resumo:{}:{}:{}:{}:{}".format(
+        versao_reservas(predio_id), predio_id or "", sala_id or "", data_inicio.isoformat(), data_fim.isoformat()
     )
 
-    total_minutos_reservados = 0
-    for r in reservas:
-        inicio_efetivo = max(r.data_hora_inicio, data_inicio)
-        fim_efetivo = min(r.data_hora_fim, data_fim)
-        if fim_efetivo > inicio_efetivo:
-            total_minutos_reservados += (fim_efetivo - inicio_efetivo).total_seconds() / 60
 
-    taxa = (total_minutos_reservados / total_minutos_disponiveis) * 100
-    return min(round(taxa, 1), 100)
+def _resumo_ocupacao(data_inicio, data_fim, sala_id=None, predio_id=None):
+    """
+    Resumo por sala, por usuário e por dia das reservas que começam entre
+    ``data_inicio`` e ``data_fim`` (datas inclusivas), das salas do prédio
+    ``predio_id`` (ou de todos).
+
+    Tudo é agregado no banco (GROUP BY), em três consultas independentes do
+    volume de reservas, e o resultado fica em cache por combinação de filtros
+    até a próxima alteração de reservas no prédio.
+    """
+    chave = _chave_resumo(data_inicio, data_fim, sala_id, predio_id)
+    resumo = cache.get(chave)
+    if resumo is not None:
+        return resumo
+
+    inicio = timezone.make_aware(datetime.combine(data_inicio, time.min))
+    fim = timezone.make_aware(datetime.combine(data_fim + timedelta(days=1), time.min))
+    limite_checkin = timezone.now() - timedelta(minutes=15)
+
+    salas = Sala.objects.do_predio(predio_id)
+    reservas = Reserva.objects.do_predio(predio_id).filter(data_hora_inicio__gte=inicio, data_hora_inicio__lt=fim)
+    if sala_id:
+        salas = salas.filter(id=sala_id)
+        reservas = reservas.filter(sala_id=sala_id)
+
+    # Por sala — parte de Sala para incluir salas sem nenhuma reserva (0%)
+    filtro_sala = Q(reservas__data_hora_inicio__gte=inicio, reservas__data_hora_inicio__lt=fim)
+    linhas_sala = list(
+        salas.values("id", "nome", "hora_inicio", "hora_fim")
+        .annotate(**_metricas_reservas("reservas__", filtro_sala, limite_checkin))
+        .order_by("nome")
+    )
+    # Dias letivos × horário da sala, menos os bloqueios (RN-24), somados na tabela de disponibilidade
+    disponivel = minutos_disponiveis(
+        data_inicio, data_fim, {linha["id"]: (linha["hora_inicio"], linha["hora_fim"]) for linha in linhas_sala}
+    )
+    por_sala = [_completar_metricas(linha, disponivel.get(linha["id"], 0)) for linha in linhas_sala]
+
+    metricas = _metricas_reservas("", Q(), limite_checkin)
+    por_usuario = [
+        _completar_metricas(linha)
+        for linha in reservas.values("usuario_id", "usuario__username")
+        .annotate(**metricas)
+        .order_by("usuario__username")
+    ]
+    por_dia = [
+        _completar_metricas(linha)
+        for linha in reservas.annotate(dia=TruncDate("data_hora_inicio"))
+        .values("dia")
+        .annotate(**metricas)
+        .order_by("dia")
+    ]
+
+    resumo = {
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "por_sala": por_sala,
+        "por_usuario": por_usuario,
+        "por_dia": por_dia,
+    }
+    cache.set(chave, resumo, RESUMO_CACHE_TIMEOUT)
+    return resumo
+
+
+# -------------------------
+# Linhas pré-calculadas para os templates do dashboard e do relatório
+# -------------------------
+
+def _rotas_reserva():
+    """
+    Montadores das URLs de ação de uma reserva. ``reverse()`` é chamado uma vez
+    por rota e o pk é inserido por formatação, em vez de um reverse por linha.
+    """
+    rotas = {}
+    for chave, nome in (("url_editar", "reserva_update"), ("url_cancelar", "reserva_delete"),
+                        ("url_checkin", "reserva_checkin")):
+        prefixo, sufixo = reverse(nome, args=[0]).rsplit("/0/", 1)
+        rotas[chave] = prefixo + "/{}/" + sufixo
+    return rotas
+
+
+def _linha_reserva(reserva, agora, rotas):
+    """
+    View model de uma reserva para as linhas do dashboard e do relatório: evita
+    que o template chame propriedades do modelo (cada uma com seu
+    timezone.now()) e já traz as datas formatadas, para que as linhas saiam
+    iguais nos motores Django e Jinja2.
+    """
+    inicio = timezone.localtime(reserva.data_hora_inicio)
+    fim = timezone.localtime(reserva.data_hora_fim)
+    linha = {
+        "pk": reserva.pk,
+        "sala_nome": reserva.sala.nome,
+        "sala_tipo": reserva.sala.get_tipo_display(),
+        "inicio_texto": inicio.strftime("%d/%m/%Y %H:%M"),
+        "fim_texto": fim.strftime("%d/%m/%Y %H:%M"),
+        "fim_hora": fim.strftime("%H:%M"),
+        "usuario": reserva.usuario.username if reserva.usuario else "",
+        "check_in_realizado": reserva.check_in_realizado,
+        "pode_cancelar": reserva.pode_cancelar_em(agora),
+        "pode_fazer_checkin": reserva.pode_fazer_checkin_em(agora),
+    }
+    for chave, rota in rotas.items():
+        linha[chave] = rota.format(reserva.pk)
+    return linha
+
+
+def _motor_paineis():
+    """Motor de templates das linhas do dashboard e do relatório ("django" ou "jinja2")."""
+    return settings.MOTOR_TEMPLATES_PAINEIS
+
+
+def _renderizar_linhas(template, linhas, **contexto):
+    """
+    Renderiza as linhas de uma tabela (``webapp/parciais/``) no motor de
+    MOTOR_TEMPLATES_PAINEIS; o resto da página continua no motor Django.
+    Sem request, de propósito: o backend Jinja2 trocaria o ``csrf_input``
+    recebido por um que gera um token novo a cada linha.
+    """
+    return mark_safe(render_to_string(template, {"linhas": linhas, **contexto}, using=_motor_paineis()))
 
 
 def welcome(request):
@@ -64,36 +297,31 @@ def welcome(request):
 
 
 @login_required
+@leitura_replica
 def dashboard(request):
     """Lista salas disponíveis e ocupadas no momento."""
     now = timezone.now()
+    predio_id = _predio_escolhido(request)
+    salas_do_predio = Sala.objects.do_predio(predio_id)
 
     # RN-12: Reservas onde data_hora_inicio <= now - 15 e check_in_realizado=False são ignoradas
-    limite_checkin = now - timedelta(minutes=15)
-
-    reservas_agora = Reserva.objects.filter(
-        data_hora_inicio__lte=now,
-        data_hora_fim__gte=now,
-    ).exclude(
-        data_hora_inicio__lte=limite_checkin,
-        check_in_realizado=False
-    )
+    reservas_agora = Reserva.objects.ocupando_sala(now).do_predio(predio_id)
 
     salas_ocupadas_ids = reservas_agora.values_list("sala_id", flat=True)
-    salas_ocupadas = Sala.objects.filter(id__in=salas_ocupadas_ids)
-    salas_disponiveis = Sala.objects.exclude(id__in=salas_ocupadas_ids)
+    salas_ocupadas = salas_do_predio.filter(id__in=salas_ocupadas_ids)
+    salas_disponiveis = salas_do_predio.exclude(id__in=salas_ocupadas_ids)
 
     reservas_ativas = {r.sala_id: r for r in reservas_agora.select_related("sala", "usuario")}
     ocupadas_com_reserva = [(sala, reservas_ativas.get(sala.id)) for sala in salas_ocupadas]
 
     # Reservas (futuras e ativas)
     if request.user.is_staff:
-        minhas_reservas = Reserva.objects.filter(data_hora_fim__gte=now).order_by("data_hora_inicio")
+        minhas_reservas = Reserva.objects.ativas(now).do_predio(predio_id).order_by("data_hora_inicio")
     else:
-        minhas_reservas = Reserva.objects.filter(
+        minhas_reservas = Reserva.objects.ativas(now).filter(
             usuario=request.user,
-            data_hora_fim__gte=now
         ).order_by("data_hora_inicio")
+    minhas_reservas = minhas_reservas.select_related("sala", "usuario")
 
     # RN-13: Notificação de reserva em menos de 2 horas
     limite_notificacao = now + timedelta(hours=2)
@@ -104,20 +332,28 @@ def dashboard(request):
     for res in reservas_proximas:
         messages.info(request, f"Lembrete: Sua reserva para a sala {res.sala.nome} começará às {res.data_hora_inicio.strftime('%H:%M')}.")
 
+    token_calendario = token_feed(request.user)
+
     # RN-19: Taxa de ocupação de cada sala (hoje) — anota o atributo diretamente no objeto
     hoje_inicio = now.replace(hour=0, minute=0, second=0, microsecond=0)
     hoje_fim = hoje_inicio + timedelta(days=1)
-    todas_as_salas = list(Sala.objects.all())
+    todas_as_salas = list(salas_do_predio)
+    taxas_hoje = _taxas_ocupacao(todas_as_salas, hoje_inicio, hoje_fim)
+    for sala_obj in todas_as_salas:
+        sala_obj.taxa_ocupacao = taxas_hoje[sala_obj.id]
+
     for sala_obj in todas_as_salas:
-        sala_obj.taxa_ocupacao = _calcular_taxa_ocupacao(sala_obj, hoje_inicio, hoje_fim)
+        sala_obj.url_calendario = reverse(
+            "calendario_sala", args=[request.user.pk, token_calendario, sala_obj.pk]
+        )
 
     # Reconstroi as querysets anotadas
     sala_map = {s.id: s for s in todas_as_salas}
     salas_disponiveis_anotadas = [sala_map[sid] for sid in
-        Sala.objects.exclude(id__in=salas_ocupadas_ids).values_list('id', flat=True)
+        salas_disponiveis.values_list('id', flat=True)
         if sid in sala_map]
     salas_ocupadas_anotadas = [sala_map[sid] for sid in
-        Sala.objects.filter(id__in=salas_ocupadas_ids).values_list('id', flat=True)
+        salas_ocupadas.values_list('id', flat=True)
         if sid in sala_map]
     ocupadas_com_reserva_anotadas = [
         (sala_map.get(sala.id, sala), reserva)
@@ -130,14 +366,17 @@ def dashboard(request):
     if request.user.is_staff:
         semana_inicio = hoje_inicio - timedelta(days=hoje_inicio.weekday())
         semana_fim = semana_inicio + timedelta(days=7)
+        taxas_semana = _taxas_ocupacao(todas_as_salas, semana_inicio, semana_fim)
         for sala_obj in todas_as_salas:
-            taxa_semana = _calcular_taxa_ocupacao(sala_obj, semana_inicio, semana_fim)
+            taxa_semana = taxas_semana[sala_obj.id]
             if taxa_semana < LIMIAR_BAIXA_UTILIZACAO:
                 salas_baixa_utilizacao.append({
                     "sala": sala_obj,
                     "taxa": taxa_semana,
                 })
 
+    rotas = _rotas_reserva()
+    linhas = [_linha_reserva(r, now, rotas) for r in minhas_reservas]
     return render(
         request,
         "webapp/dashboard.html",
@@ -145,8 +384,15 @@ def dashboard(request):
             "salas_disponiveis": salas_disponiveis_anotadas,
             "salas_ocupadas": salas_ocupadas_anotadas,
             "ocupadas_com_reserva": ocupadas_com_reserva_anotadas,
-            "minhas_reservas": minhas_reservas,
+            "minhas_reservas": linhas,
+            "linhas_reservas": _renderizar_linhas(
+                "webapp/parciais/linhas_reservas.html", linhas,
+                staff=request.user.is_staff, csrf_input=csrf_input(request),
+            ),
             "agora": now,
+            "url_calendario": reverse("calendario_usuario", args=[request.user.pk, token_calendario]),
+            "predios": list(Predio.objects.all()),
+            "predio_id": predio_id,
             # RN-20
             "salas_baixa_utilizacao": salas_baixa_utilizacao,
             "limiar_baixa_utilizacao": LIMIAR_BAIXA_UTILIZACAO,
@@ -180,6 +426,11 @@ class SalaUpdateView(UserPassesTestMixin, UpdateView):
         messages.error(self.request, "Apenas administradores podem gerenciar salas.")
         return redirect("dashboard")
 
+    def form_valid(self, form):
+        if not form.salvar_versionado():
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
+
 
 class SalaDeleteView(UserPassesTestMixin, DeleteView):
     model = Sala
@@ -198,11 +449,18 @@ class SalaDeleteView(UserPassesTestMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+# O reenvio de um formulário já processado é respondido antes do limite de taxa
+@method_decorator(idempotente("reserva"), name="dispatch")
+@method_decorator(limitar("reserva"), name="dispatch")
 class ReservaCreateView(CreateView):
     form_class = ReservaForm
     template_name = "webapp/reserva_form.html"
     success_url = reverse_lazy("dashboard")
 
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault("token_idempotencia", token_do_formulario(self.request))
+        return super().get_context_data(**kwargs)
+
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return redirect("login")
@@ -216,7 +474,11 @@ class ReservaCreateView(CreateView):
     def form_valid(self, form):
         reserva = form.save(commit=False)
         reserva.usuario = self.request.user
-        reserva.save()
+        with transaction.atomic(using=PRIMARIO):
+            if not form.travar_sala():
+                return self.form_invalid(form)
+            reserva.save(using=PRIMARIO)
+        registrar("criada", [reserva], self.request.user)
         messages.success(self.request, "Reserva criada com sucesso.")
         return redirect(self.success_url)
 
@@ -247,24 +509,190 @@ class ReservaDeleteView(DeleteView):
         messages.success(request, "Reserva cancelada com sucesso.")
         return super().delete(request, *args, **kwargs)
 
+    def form_valid(self, form):
+        # O registro é agendado para o commit; se a exclusão falhar, é descartado junto
+        with transaction.atomic():
+            registrar("cancelada", [self.object], self.request.user)
+            return super().form_valid(form)
+
 
 class ReservaCheckInView(View):
     def post(self, request, pk, *args, **kwargs):
         if not request.user.is_authenticated:
             return redirect("login")
-            
-        reserva = get_object_or_404(Reserva, pk=pk)
-        
-        if reserva.usuario != request.user and not request.user.is_staff:
-            messages.error(request, "Você não tem permissão para fazer check-in nesta reserva.")
+
+        reservas = Reserva.objects.filter(pk=pk)
+        if not request.user.is_staff:
+            reservas = reservas.filter(usuario=request.user)
+
+        # RN-12: o check-in só vale dentro da janela de 15 minutos em torno do início
+        if reservas.fazer_checkin():
+            registrar("checkin", [pk], request.user)
+            reservas_alteradas(reservas)
+            publicar_reservas("checkin", reservas)
+            messages.success(request, "Check-in realizado com sucesso.")
             return redirect("dashboard")
-            
-        reserva.check_in_realizado = True
-        reserva.save()
-        messages.success(request, f"Check-in realizado com sucesso para a sala {reserva.sala.nome}.")
+
+        # Nenhuma linha afetada: só agora consulta a reserva para explicar o motivo
+        reserva = get_object_or_404(Reserva.objects.using(PRIMARIO), pk=pk)
+        if reserva.usuario_id != request.user.pk and not request.user.is_staff:
+            messages.error(request, "Você não tem permissão para fazer check-in nesta reserva.")
+        elif reserva.check_in_realizado:
+            messages.info(request, "O check-in desta reserva já foi realizado.")
+        else:
+            messages.error(
+                request,
+                "O check-in só pode ser feito entre 15 minutos antes e 15 minutos depois do início da reserva.",
+            )
         return redirect("dashboard")
 
 
+MAX_CHECKINS_LOTE = 500
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class CheckInLoteQuiosqueView(View):
+    """Recebe de uma vez os check-ins enfileirados por um quiosque de porta.
+
+    Autenticação pelo cabeçalho ``Authorization: Bearer <QUIOSQUE_TOKEN>``.
+    Corpo: ``{"checkins": [{"reserva": 12, "realizado_em": "2026-03-02T10:01:00-03:00"}, ...]}``;
+    ``realizado_em`` é opcional (padrão: agora). A janela de check-in é avaliada no
+    instante registrado pelo quiosque, para aceitar filas enviadas com atraso.
+    """
+
+    def post(self, request, *args, **kwargs):
+        token = settings.QUIOSQUE_TOKEN
+        autorizacao = request.headers.get("Authorization", "")
+        if not token or not constant_time_compare(autorizacao, f"Bearer {token}"):
+            return JsonResponse({"erro": "Token de quiosque inválido."}, status=403)
+
+        try:
+            itens = json.loads(request.body)["checkins"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"erro": "Corpo deve ser um JSON com a lista 'checkins'."}, status=400)
+        if not isinstance(itens, list) or len(itens) > MAX_CHECKINS_LOTE:
+            return JsonResponse(
+                {"erro": f"'checkins' deve ser uma lista com no máximo {MAX_CHECKINS_LOTE} itens."}, status=400
+            )
+
+        agora = timezone.now()
+        rejeitados = []
+        pedidos = {}
+        for item in itens:
+            try:
+                pk = int(item["reserva"])
+                realizado_em = parse_datetime(item["realizado_em"]) if item.get("realizado_em") else agora
+            except (AttributeError, KeyError, TypeError, ValueError):
+                realizado_em = None
+            if realizado_em is None:
+                rejeitados.append({"item": item, "motivo": "invalido"})
+                continue
+            if timezone.is_naive(realizado_em):
+                realizado_em = timezone.make_aware(realizado_em)
+            # Relógio do quiosque adiantado não pode abrir a janela antes da hora
+            pedidos[pk] = min(realizado_em, agora)
+
+        # Um SELECT para classificar todo o lote e um UPDATE para os aceitos. O
+        # SELECT trava as linhas (FOR UPDATE): um quiosque concorrente com a mesma
+        # reserva espera o commit deste e a classifica como "ja_realizado", então
+        # os confirmados são exatamente as linhas alteradas por este UPDATE.
+        confirmados = []
+        with transaction.atomic(using=PRIMARIO):
+            encontradas = {
+                pk: (inicio, realizado)
+                for pk, inicio, realizado in Reserva.objects.using(PRIMARIO)
+                .select_for_update()
+                .filter(pk__in=pedidos)
+                .values_list("pk", "data_hora_inicio", "check_in_realizado")
+            }
+            for pk, realizado_em in pedidos.items():
+                if pk not in encontradas:
+                    rejeitados.append({"reserva": pk, "motivo": "inexistente"})
+                    continue
+                inicio, realizado = encontradas[pk]
+                if realizado:
+                    rejeitados.append({"reserva": pk, "motivo": "ja_realizado"})
+                elif not inicio - JANELA_CHECKIN <= realizado_em <= inicio + JANELA_CHECKIN:
+                    rejeitados.append({"reserva": pk, "motivo": "fora_da_janela"})
+                else:
+                    confirmados.append(pk)
+
+            if confirmados:
+                reservas = Reserva.objects.using(PRIMARIO).filter(pk__in=confirmados)
+                reservas.filter(check_in_realizado=False).update(check_in_realizado=True)
+                registrar("checkin", confirmados, origem="quiosque")
+                reservas_alteradas(reservas)
+                publicar_reservas("checkin", reservas)
+
+        return JsonResponse({"confirmados": confirmados, "rejeitados": rejeitados})
+
+
+@login_required
+async def eventos_salas(request):
+    """SSE com as mudanças de estado das salas, para painéis e telas de corredor.
+
+    Só as salas do prédio em foco (``?predio=`` ou o da sessão, como no
+    painel) entram no estado e nos eventos. Sob WSGI um fluxo aberto
+    prenderia um worker por tela: responde só o estado atual, e o navegador
+    reconecta periodicamente.
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    predio_id = await sync_to_async(_predio_escolhido)(request)
+    if not isinstance(request, ASGIRequest):
+        corpo = await sync_to_async(estado_para_consulta)(predio_id)
+        return HttpResponse(corpo, content_type="text/event-stream", headers=headers)
+    return StreamingHttpResponse(
+        fluxo_eventos(predio_id),
+        content_type="text/event-stream",
+        headers=headers,
+    )
+
+
+class ReservaLoteView(UserPassesTestMixin, View):
+    """Reserva várias salas de uma vez para provas e eventos (somente staff), tudo ou nada.
+
+    Corpo: ``{"reservas": [{"sala": 3, "data_hora_inicio": "2026-03-02T08:00:00-03:00",
+    "data_hora_fim": "2026-03-02T12:00:00-03:00", "quantidade_pessoas": 40}, ...]}``.
+    Responde 201 com as reservas criadas, ou 400/409 com ``erros`` por índice do item.
+    """
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def handle_no_permission(self):
+        return JsonResponse({"erro": "Apenas administradores podem reservar em lote."}, status=403)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            itens = json.loads(request.body)["reservas"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"erro": "Corpo deve ser um JSON com a lista 'reservas'."}, status=400)
+
+        form = ReservaLoteForm({"reservas": itens}, usuario=request.user)
+        if not form.is_valid():
+            return JsonResponse(
+                {"erro": " ".join(form.non_field_errors() or form.errors.get("reservas", [])),
+                 "erros": form.erros_itens},
+                status=400,
+            )
+        reservas = form.criar_reservas()
+        if reservas is None:
+            # Outra reserva ocupou a sala entre a validação e a trava
+            return JsonResponse({"erro": "Conflito de horário.", "erros": form.erros_itens}, status=409)
+
+        registrar("criada", reservas, request.user, origem="lote")
+        reservas_alteradas(reservas)
+        publicar_reservas("reserva_criada", reservas)
+        return JsonResponse(
+            {"criadas": [
+                {"id": r.pk, "sala": r.sala_id, "data_hora_inicio": r.data_hora_inicio,
+                 "data_hora_fim": r.data_hora_fim}
+                for r in reservas
+            ]},
+            status=201,
+        )
+
+
 class ReservaUpdateView(UserPassesTestMixin, UpdateView):
     model = Reserva
     form_class = ReservaForm
@@ -279,10 +707,16 @@ class ReservaUpdateView(UserPassesTestMixin, UpdateView):
         return redirect("dashboard")
 
     def form_valid(self, form):
+        # Concorrência otimista: perde para quem gravou depois da leitura do formulário
+        with transaction.atomic(using=PRIMARIO):
+            if not form.travar_sala() or not form.salvar_versionado():
+                return self.form_invalid(form)
         messages.success(self.request, "Reserva atualizada com sucesso.")
-        return super().form_valid(form)
+        registrar("alterada", [self.object], self.request.user, campos=form.campos_alterados)
+        return redirect(self.get_success_url())
 
 
+@method_decorator(leitura_replica, name="dispatch")
 class RelatorioOcupacaoView(UserPassesTestMixin, ListView):
     model = Reserva
     template_name = "webapp/relatorio_ocupacao.html"
@@ -295,11 +729,27 @@ class RelatorioOcupacaoView(UserPassesTestMixin, ListView):
         messages.error(self.request, "Acesso negado. Apenas administradores podem ver o relatório.")
         return redirect("dashboard")
 
+    @property
+    def modo_resumo(self):
+        return self.request.GET.get('modo') == 'resumo'
+
+    @property
+    def sala_id(self):
+        # Valores que não são um id são ignorados, como no filtro de prédio
+        valor = self.request.GET.get('sala', '')
+        return int(valor) if valor.isdigit() else None
+
+    def get(self, request, *args, **kwargs):
+        self.predio_id = _predio_escolhido(request)
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
-        qs = super().get_queryset().select_related('sala', 'usuario')
-        sala_id = self.request.GET.get('sala')
-        if sala_id:
-            qs = qs.filter(sala_id=sala_id)
+        if self.modo_resumo:
+            # No modo resumo a listagem bruta não é exibida
+            return Reserva.objects.none()
+        qs = super().get_queryset().do_predio(self.predio_id).select_related('sala', 'usuario')
+        if self.sala_id:
+            qs = qs.filter(sala_id=self.sala_id)
         
         data_inicio = self.request.GET.get('data_inicio')
         if data_inicio:
@@ -313,10 +763,63 @@ class RelatorioOcupacaoView(UserPassesTestMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['salas'] = Sala.objects.all()
+        context['salas'] = Sala.objects.do_predio(self.predio_id)
+        context['predios'] = list(Predio.objects.all())
+        context['predio_id'] = self.predio_id
+        context['modo_resumo'] = self.modo_resumo
+        agora = timezone.now()
+        rotas = _rotas_reserva()
+        context['linhas'] = [_linha_reserva(r, agora, rotas) for r in context['reservas']]
+        context['linhas_relatorio'] = _renderizar_linhas("webapp/parciais/linhas_relatorio.html", context['linhas'])
+        if self.modo_resumo:
+            context['resumo'] = _resumo_ocupacao(
+                *_periodo_informado(self.request), sala_id=self.sala_id, predio_id=self.predio_id
+            )
         return context
 
 
+@method_decorator(leitura_replica, name="dispatch")
+class MapaCalorOcupacaoView(UserPassesTestMixin, View):
+    """Mapa de calor (tipo de sala × dia da semana × hora) da ocupação no período, em JSON."""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def handle_no_permission(self):
+        messages.error(self.request, "Acesso negado. Apenas administradores podem ver o relatório.")
+        return redirect("dashboard")
+
+    def get(self, request, *args, **kwargs):
+        data_inicio, data_fim = _periodo_informado(request)
+        if (data_fim - data_inicio).days + 1 > MAX_DIAS_MAPA:
+            return JsonResponse(
+                {"erro": f"O período máximo do mapa de calor é de {MAX_DIAS_MAPA} dias."},
+                status=400,
+            )
+        return JsonResponse(calcular_mapa_calor(data_inicio, data_fim, _predio_escolhido(request)))
+
+
+def _usuario_do_feed(usuario_id, token):
+    usuario = get_user_model().objects.filter(pk=usuario_id, is_active=True).first()
+    if usuario is None or not token_valido(usuario, token):
+        raise Http404
+    return usuario
+
+
+# Os feeds leem sempre do primário: com a réplica atrasada, a versão nova do
+# cache poderia ficar associada a um feed gerado com dados antigos.
+def calendario_usuario(request, usuario_id, token):
+    """Feed iCalendar das reservas do usuário; o token na URL substitui o login."""
+    return feed_usuario(request, _usuario_do_feed(usuario_id, token))
+
+
+def calendario_sala(request, usuario_id, token, sala_id):
+    """Feed iCalendar da agenda de uma sala, para qualquer usuário com token válido."""
+    usuario = _usuario_do_feed(usuario_id, token)
+    return feed_sala(request, get_object_or_404(Sala, pk=sala_id), usuario)
+
+
+@method_decorator(limitar("login"), name="dispatch")
 class LoginViewCustom(LoginView):
     template_name = "webapp/login.html"
     redirect_authenticated_user = True
@@ -326,6 +829,7 @@ class LogoutViewCustom(LogoutView):
     next_page = "login"
 
 
+@method_decorator(limitar("cadastro"), name="dispatch")
 class RegistroView(CreateView):
     form_class = RegistroForm
     template_name = "webapp/register.html"
@@ -337,6 +841,7 @@ class RegistroView(CreateView):
         return redirect(self.success_url)
 
 
+@method_decorator(leitura_replica, name="dispatch")
 class SalasDisponiveisView(View):
     """RN-21: Busca de salas disponíveis em um intervalo de tempo específico."""
 
@@ -350,6 +855,7 @@ class SalasDisponiveisView(View):
         fim_str = request.GET.get("fim", "")
         salas_disponiveis = None
         erro = None
+        predio_id = _predio_escolhido(request)
 
         if inicio_str and fim_str:
             try:
@@ -368,14 +874,16 @@ class SalasDisponiveisView(View):
                     hora_fim = fim.time()
 
                     # Salas sem conflito de reserva no intervalo (RN-06 invertida)
-                    salas_com_conflito = Reserva.objects.filter(
-                        data_hora_inicio__lt=fim,
-                        data_hora_fim__gt=inicio,
-                    ).values_list("sala_id", flat=True)
+                    salas_com_conflito = Reserva.objects.sobrepostas(
+                        inicio, fim
+                    ).do_predio(predio_id).values_list("sala_id", flat=True)
 
                     # Filtra também pelo horário de disponibilidade da sala (RN-07)
-                    salas_disponiveis = Sala.objects.exclude(
+                    salas_disponiveis = Sala.objects.do_predio(predio_id).exclude(
                         id__in=salas_com_conflito
+                    ).exclude(
+                        # RN-24: salas bloqueadas para manutenção no intervalo
+                        bloqueios__in=BloqueioManutencao.objects.sobrepostos(inicio, fim)
                     ).filter(
                         hora_inicio__lte=hora_inicio,
                         hora_fim__gte=hora_fim,
@@ -388,9 +896,13 @@ class SalasDisponiveisView(View):
             "inicio": inicio_str,
             "fim": fim_str,
             "erro": erro,
+            "predios": list(Predio.objects.all()),
+            "predio_id": predio_id,
         })
 
 
+@method_decorator(idempotente("reserva_recorrente"), name="dispatch")
+@method_decorator(limitar("reserva_recorrente"), name="dispatch")
 class ReservaRecorrenteCreateView(View):
     """RN-22 e RN-23: criação de reservas recorrentes com verificação de disponibilidade."""
 
@@ -401,15 +913,22 @@ class ReservaRecorrenteCreateView(View):
 
     def get(self, request, *args, **kwargs):
         form = ReservaRecorrenteForm(usuario=request.user)
-        return render(request, "webapp/reserva_recorrente_form.html", {"form": form})
+        return render(request, "webapp/reserva_recorrente_form.html", {
+            "form": form, "token_idempotencia": token_do_formulario(request),
+        })
 
     def post(self, request, *args, **kwargs):
         form = ReservaRecorrenteForm(request.POST, usuario=request.user)
-        if form.is_valid():
-            reservas = form.criar_reservas(usuario=request.user)
+        reservas = form.criar_reservas(usuario=request.user) if form.is_valid() else None
+        if reservas is not None:
+            registrar("criada", reservas, request.user, origem="recorrente")
+            reservas_alteradas(reservas)
+            publicar_reservas("reserva_criada", reservas)
             messages.success(
                 request,
                 f"{len(reservas)} reserva(s) recorrente(s) criada(s) com sucesso!",
             )
             return redirect("dashboard")
-        return render(request, "webapp/reserva_recorrente_form.html", {"form": form})
+        return render(request, "webapp/reserva_recorrente_form.html", {
+            "form": form, "token_idempotencia": token_do_formulario(request),
+        })